@@ -0,0 +1,254 @@
+# bench.py
+"""基准测试：生成指定规模的合成宇宙（恒星 × 行星 × 卫星），对载入、星历、引力、存读档、
+轨迹与渲染、整帧推进等场景计时，结果写成 JSON，可与上一次的结果对比找出性能回退。
+渲染场景使用 SDL 的 dummy 视频驱动，无显示器的 Linux 上也能跑"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def generate_universe(path, stars, planets, moons, seed=0, spacing=1e10):
+    """写出 stars 个星系的 Universe.xml，每颗恒星 planets 颗行星、每颗行星 moons 颗卫星。
+    恒星按网格排布（间距 spacing 千米，带随机抖动），行星与卫星都落在各自父天体的 SOI 内"""
+    rng = random.Random(seed)
+    side = math.ceil(math.sqrt(stars))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8" ?>\n<Universe>\n')
+        for s in range(stars):
+            x = (s % side + rng.uniform(-0.25, 0.25)) * spacing
+            y = (s // side + rng.uniform(-0.25, 0.25)) * spacing
+            f.write(f'    <Solar name="System {s}" x="{x!r}" y="{y!r}">\n'
+                    f'        <Star name="Star {s}" mass="1.989e27" x="{x!r}" y="{y!r}" colour="yellow" '
+                    f'size="15" body_radius="696340"/>\n')
+            for p in range(planets):
+                f.write(f'        <Planet name="Planet {s}-{p}" mass="5.972e21" radius="{(p + 2) * 7.5e7!r}" '
+                        f'colour="{rng.choice(("blue", "red", "cyan", "orange"))}" size="8" body_radius="6371">\n')
+                for m in range(moons):
+                    f.write(f'            <Moon name="Moon {s}-{p}-{m}" mass="7.342e19" '
+                            f'radius="{4e5 * (m + 1) / moons!r}" colour="gray" size="3" body_radius="1737"/>\n')
+                f.write('        </Planet>\n')
+            f.write('    </Solar>\n')
+        f.write('</Universe>\n')
+
+
+def generate_ships(path, ships, universe_path, systems=1, targets=False):
+    """在前 systems 个星系的行星附近轮流放 ships 艘飞船（第一艘为玩家），各自贴近一颗行星；
+    targets 为真时每艘飞船以同星系的下一颗行星为自动驾驶目标"""
+    from engine import load_universe
+    stars, bodies = load_universe(universe_path, use_cache=False)
+    anchors = [b for star in stars[:systems] for b in (star.children or [star])]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8" ?>\n<Ships>\n')
+        for i in range(ships):
+            body = anchors[i % len(anchors)]
+            angle = 2 * math.pi * i / ships
+            r = 30000.0 + 1000.0 * (i // len(anchors))
+            cls = ' class="Player"' if i == 0 else ""
+            siblings = body.parent.children if body.parent else [body]
+            target = f' target="{siblings[(siblings.index(body) + 1) % len(siblings)].name}"' if targets else ""
+            f.write(f'    <Ship name="Ship {i}"{cls}{target} mass="100.0" thrust="2.0" '
+                    f'x="{body.x + r * math.cos(angle)!r}" y="{body.y + r * math.sin(angle)!r}" colour="cyan" />\n')
+        f.write('</Ships>\n')
+
+
+def timed(fn, repeat, setup=None):
+    """调用 fn() repeat 次（每次前先调用 setup），返回每次耗时（毫秒）"""
+    times = []
+    for _ in range(repeat):
+        if setup: setup()
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000.0)
+    return times
+
+
+# --- 场景：每个函数接收 ctx（本规模的文件路径等），逐条 yield (场景名, 参数, 耗时列表) ---
+def bench_load(ctx, repeat):
+    from engine import load_universe, load_galaxy
+    path = ctx["universe"]
+    yield "load_universe", {"cache": False}, timed(lambda: load_universe(path, use_cache=False), repeat)
+    load_universe(path)  # 预热 npz 缓存
+    yield "load_universe", {"cache": True}, timed(lambda: load_universe(path), repeat)
+    yield "load_galaxy", {"cache": True}, timed(lambda: load_galaxy(path), repeat)
+
+
+def bench_bodies(ctx, repeat):
+    from engine import load_universe, compute_gravity, get_dominant_body
+    _, bodies = load_universe(ctx["universe"])
+    clock = iter(range(1, 1 << 62))
+    # 每次换一个时刻，避免命中星历的 LRU 缓存
+    yield "set_time", {"bodies": len(bodies)}, timed(lambda: bodies.set_time(next(clock) * 3600.0), repeat)
+    x, y = bodies[0].x + 1.5e8, bodies[0].y + 3e4
+    yield "compute_gravity", {"points": 1}, timed(lambda: compute_gravity(x, y, bodies), repeat)
+    xs = x + np.linspace(-1e6, 1e6, 1000)
+    ys = np.full_like(xs, y)
+    yield "compute_gravity", {"points": len(xs)}, timed(lambda: compute_gravity(xs, ys, bodies), repeat)
+    yield "get_dominant_body", {"points": 1}, timed(lambda: get_dominant_body(x, y, bodies), repeat)
+
+
+def bench_saves(ctx, repeat):
+    from engine import Camera, new_simulation, capture_state, save_game, load_game
+    sim, nearest = new_simulation(ctx["universe"], ctx["ships"])
+    camera = Camera()
+    camera.target = nearest
+    yield "capture_state", {"ships": len(sim.fleet)}, timed(lambda: capture_state(sim, camera), repeat)
+    for fmt in ("sav", "json"):
+        path = os.path.join(ctx["dir"], "bench_save." + fmt)
+        yield "save_game", {"format": fmt}, timed(lambda: save_game(path, capture_state(sim, camera)), repeat)
+        yield "load_game", {"format": fmt}, timed(lambda: load_game(path, sim, camera), repeat)
+
+
+def bench_frames(ctx, repeat, time_scales=(1.0, 1e3, 1e6, 1e9)):
+    from engine import new_simulation
+    for time_scale in time_scales:
+        sim, _ = new_simulation(ctx["universe"], ctx["ships"])
+        sim.time_scale = time_scale
+        yield "frame", {"time_scale": time_scale, "ships": len(sim.fleet)}, \
+            timed(lambda: sim.step(time_scale), repeat)
+
+
+def bench_render(ctx, repeat):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from settings import SCREEN_WIDTH, SCREEN_HEIGHT
+    from engine import Camera, TrajectoryPredictor, new_simulation
+    from worker import PhysicsWorker
+    from render import Renderer
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    font = pygame.font.Font(None, 14)
+
+    sim, nearest = new_simulation(ctx["universe"], ctx["ships"])
+    camera, predictor = Camera(), TrajectoryPredictor()
+    camera.target = nearest
+
+    def trajectory():
+        body, points = predictor.update(sim.ship, sim.all_bodies, sim.time_elapsed)
+        if points is not None: camera.apply_array(body.x + points[0], body.y + points[1])
+    yield "draw_trajectory", {"samples": predictor.samples}, timed(trajectory, repeat, predictor.invalidate)
+
+    snap = PhysicsWorker(sim).snapshot
+    renderer = Renderer(screen, font, font, font)
+    camera.locate = snap.position
+    for view, scale in (("system", 0.002), ("star", 2e-6), ("galaxy", 1e-10)):
+        camera.scale = scale
+        camera.target = nearest if view == "system" else sim.stars[0]
+
+        def frame():
+            screen.fill((5, 5, 15))
+            renderer.draw_scene(snap, camera)
+        yield "render", {"view": view, "bodies": len(snap.bodies)}, timed(frame, repeat)
+    pygame.quit()
+
+
+def bench_partitioned(ctx, repeat, time_scale=100.0):
+    """飞船分散在各星系、都开着自动驾驶时，单进程与按星系分区（串行 / 进程池）推进一帧的耗时"""
+    from engine import new_simulation
+    from partition import PartitionedSimulation
+    stars = ctx["stars"]
+    path = os.path.join(ctx["dir"], f"Ships_spread_{stars}.xml")
+    generate_ships(path, max(ctx["ship_count"], 4 * stars), ctx["universe"], systems=stars, targets=True)
+    for workers in (0, 1, os.cpu_count() or 1):
+        sim, _ = new_simulation(ctx["universe"], path)
+        sim.time_scale = time_scale
+        target = PartitionedSimulation(sim, workers) if workers else sim
+        try:
+            yield "partitioned_frame", {"workers": workers, "ships": len(sim.fleet)}, \
+                timed(lambda: target.step(time_scale), repeat)
+        finally:
+            if workers: target.close()
+        if workers == 1 and (os.cpu_count() or 1) == 1: break
+
+
+SCENARIOS = {"load": bench_load, "bodies": bench_bodies, "saves": bench_saves, "frames": bench_frames,
+             "render": bench_render, "partitioned": bench_partitioned}
+
+
+def parse_size(text):
+    stars, planets, moons = (int(v) for v in text.lower().split("x"))
+    return stars, planets, moons
+
+
+def run(sizes, scenarios, repeat, ships=1, workdir=None):
+    """对每个规模生成宇宙并跑选中的场景；返回结果字典（可直接写成 JSON）"""
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for stars, planets, moons in sizes:
+            size = f"{stars}x{planets}x{moons}"
+            ctx = {"dir": tmp, "universe": os.path.join(tmp, f"Universe_{size}.xml"),
+                   "ships": os.path.join(tmp, f"Ships_{size}.xml"), "stars": stars, "ship_count": ships}
+            generate_universe(ctx["universe"], stars, planets, moons)
+            generate_ships(ctx["ships"], ships, ctx["universe"])
+            bodies = stars * (1 + planets * (1 + moons))
+            for key in scenarios:
+                for name, params, times in SCENARIOS[key](ctx, repeat):
+                    entry = {"scenario": name, "size": size, "bodies": bodies, "params": params,
+                             "repeat": len(times), "min_ms": min(times), "median_ms": statistics.median(times),
+                             "mean_ms": statistics.fmean(times), "max_ms": max(times)}
+                    results.append(entry)
+                    print(f"{size:>14} {name:<18} {json.dumps(params):<40} "
+                          f"median {entry['median_ms']:10.3f} ms  min {entry['min_ms']:10.3f} ms")
+    return {"meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+                     "numpy": np.__version__, "platform": platform.platform(), "machine": platform.machine(),
+                     "repeat": repeat, "ships": ships},
+            "results": results}
+
+
+def _key(entry):
+    return entry["scenario"], entry["size"], json.dumps(entry["params"], sort_keys=True)
+
+
+def compare(report, baseline, threshold=1.25):
+    """按 (场景, 规模, 参数) 对齐两次结果，返回中位耗时比 baseline 慢 threshold 倍以上的条目"""
+    old = {_key(e): e for e in baseline["results"]}
+    regressions = []
+    for entry in report["results"]:
+        base = old.get(_key(entry))
+        if base and base["median_ms"] > 0 and entry["median_ms"] / base["median_ms"] > threshold:
+            regressions.append((entry, base["median_ms"], entry["median_ms"] / base["median_ms"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the engine on synthetic universes.")
+    parser.add_argument("--sizes", default="1x10x4,10x10x4,100x10x4",
+                        help="comma separated stars x planets x moons, e.g. 10x8x2")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--ships", type=int, default=1, help="ships in the generated fleet")
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--baseline", help="earlier JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="report a regression when the median is this many times slower than the baseline")
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown: parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    report = run([parse_size(s) for s in args.sizes.split(",")], scenarios, args.repeat, args.ships)
+    if args.out:
+        with open(args.out, "w") as f: json.dump(report, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for entry, old, ratio in regressions:
+            print(f"REGRESSION {entry['scenario']} {entry['size']} {json.dumps(entry['params'])}: "
+                  f"{old:.3f} -> {entry['median_ms']:.3f} ms ({ratio:.2f}x)")
+        if regressions: sys.exit(1)
+    return report
+
+
+if __name__ == "__main__":
+    main()
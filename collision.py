@@ -0,0 +1,108 @@
+# collision.py
+"""碰撞与接近检测的宽相位 + 窄相位：天体（带半径的圆）放进多层均匀空间哈希，飞船每个积分子步的位移作为线段查询，
+只对落在同一格子里的 (线段, 天体) 对做连续（扫掠）求交，高倍速下大步长也不会穿过天体。
+本模块只依赖 numpy；天体表、飞船状态与事件的含义由 engine 决定"""
+import math
+import numpy as np
+
+_BIAS = 1 << 31  # 格子坐标 (cx, cy) 合成一个 int64 键：cx << 32 | (cy + 2^31)
+
+
+def _keys(cx, cy):
+    return (cx << 32) + (cy + _BIAS)
+
+
+def _expand(lo, counts):
+    """把 [lo, lo + counts) 这些区间首尾相接展开成一个下标数组"""
+    total = int(counts.sum())
+    if not total: return np.zeros(0, dtype=np.int64)
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    return starts + np.arange(total)
+
+
+def _cells(x0, y0, x1, y1, size):
+    """轴对齐包围盒 [x0, x1] × [y0, y1] 覆盖的格子（盒子不大于一格时至多 2×2 个）；返回 (键, 有效) 两个 (M, 4) 数组"""
+    cx0, cx1 = np.floor(x0 / size).astype(np.int64), np.floor(x1 / size).astype(np.int64)
+    cy0, cy1 = np.floor(y0 / size).astype(np.int64), np.floor(y1 / size).astype(np.int64)
+    keys = np.stack([_keys(cx0, cy0), _keys(cx1, cy0), _keys(cx0, cy1), _keys(cx1, cy1)], axis=1)
+    same_x, same_y = cx0 == cx1, cy0 == cy1
+    valid = np.stack([np.ones_like(same_x), ~same_x, ~same_y, ~same_x & ~same_y], axis=1)
+    return keys, valid
+
+
+class SpatialHash:
+    """多层均匀空间哈希：第 L 层格子边长 cell * branching**L。每个圆（半径不超过 cell / 2）在每层至多占 2×2 格；
+    线段按长度选层，使其包围盒也至多占 2×2 格，长线段落在粗层，不用逐格遍历。
+    各层按需建立；天体移动后只有格子真的变了的那一层才重新排序"""
+
+    def __init__(self, branching=8):
+        self.branching = branching
+        self.x = self.y = self.r = None
+        self.cell, self.levels = 1.0, {}
+
+    def update(self, x, y, r):
+        """换成新的一批圆（圆心 x, y，半径 r）；半径分布变了才重设格子边长"""
+        x, y, r = (np.asarray(v, dtype=np.float64) for v in (x, y, r))
+        cell = 2.0 * float(r.max()) if len(r) else 1.0
+        if self.r is None or len(r) != len(self.r) or cell != self.cell or not np.array_equal(r, self.r):
+            self.cell, self.levels = max(cell, 1e-9), {}
+        self.x, self.y, self.r = x, y, r
+
+    def _level(self, level):
+        """第 level 层：(排好序的键, 对应的圆下标)；圆所在格子与上次相同则直接复用"""
+        size = self.cell * self.branching ** level
+        corners = np.floor(np.stack([self.x - self.r, self.x + self.r, self.y - self.r, self.y + self.r]) / size)
+        cached = self.levels.get(level)
+        if cached is not None and np.array_equal(cached[0], corners): return cached[1], cached[2]
+        keys, valid = _cells(self.x - self.r, self.y - self.r, self.x + self.r, self.y + self.r, size)
+        owner = np.broadcast_to(np.arange(len(self.x))[:, None], keys.shape)[valid]
+        keys = keys[valid]
+        order = np.argsort(keys, kind="stable")
+        self.levels[level] = (corners, keys[order], owner[order])
+        return keys[order], owner[order]
+
+    def query(self, x0, y0, x1, y1, pad=0.0):
+        """线段 (x0, y0) -> (x1, y1) 的候选圆（包围盒再向外扩 pad，容纳圆在这段时间里的移动）：
+        返回 (线段下标, 圆下标) 两个等长数组，每对只出现一次"""
+        x0, y0, x1, y1 = (np.asarray(v, dtype=np.float64).ravel() for v in (x0, y0, x1, y1))
+        none = np.zeros(0, dtype=np.int64)
+        if self.x is None or not len(self.x) or not len(x0): return none, none
+        extent = np.maximum(np.abs(x1 - x0), np.abs(y1 - y0)) + 2 * pad
+        with np.errstate(divide="ignore"):
+            level = np.maximum(np.ceil(np.log(extent / self.cell) / math.log(self.branching)), 0)
+        level = np.nan_to_num(level, posinf=0.0).astype(np.int64)
+        segs, bodies = [], []
+        for lv in np.unique(level).tolist():
+            sel = np.flatnonzero(level == lv)
+            keys, owner = self._level(lv)
+            a, b = (x0[sel], y0[sel]), (x1[sel], y1[sel])
+            q, valid = _cells(*(np.minimum(a, b) - pad), *(np.maximum(a, b) + pad), self.cell * self.branching ** lv)
+            lo, hi = np.searchsorted(keys, q, "left"), np.searchsorted(keys, q, "right")
+            counts = np.where(valid, hi - lo, 0).ravel()
+            segs.append(np.repeat(np.repeat(sel, 4), counts))
+            bodies.append(owner[_expand(lo.ravel(), counts)])
+        seg, body = np.concatenate(segs), np.concatenate(bodies)
+        pair = np.unique(seg * len(self.x) + body)  # 圆与线段同时跨两格时会重复
+        return pair // len(self.x), pair % len(self.x)
+
+
+def sweep(x0, y0, x1, y1, cx, cy, radius, inside=False):
+    """线段与静止圆的连续求交（逐对广播；圆也在匀速移动时先换到圆心坐标系）：返回首次从外部进入圆的线段参数 s ∈ [0, 1]，不进入为 NaN。
+    inside 为真时，起点已在圆内且正朝圆心运动也算进入（s = 0）"""
+    dx, dy, fx, fy = x1 - x0, y1 - y0, x0 - cx, y0 - cy
+    a, b, c = dx * dx + dy * dy, fx * dx + fy * dy, fx * fx + fy * fy - radius * radius
+    with np.errstate(all="ignore"):
+        s = (-b - np.sqrt(b * b - a * c)) / a
+    return np.where(c <= 0, np.where(inside & (b < 0), 0.0, np.nan), np.where((s >= 0) & (s <= 1), s, np.nan))
+
+
+def closest(x0, y0, x1, y1, cx, cy):
+    """线段上离圆心最近的点：返回 (线段参数 s, 最近距离, 是否为内部极小)。
+    内部极小即 s ∈ (0, 1]：沿线段先接近后远离，相邻线段共享端点时同一次接近只算一次"""
+    dx, dy, fx, fy = x1 - x0, y1 - y0, x0 - cx, y0 - cy
+    a, b = dx * dx + dy * dy, fx * dx + fy * dy
+    with np.errstate(all="ignore"):
+        s = np.where(a > 0, -b / a, 0.0)
+    interior = (s > 0) & (s <= 1)
+    s = np.clip(s, 0.0, 1.0)
+    return s, np.hypot(fx + s * dx, fy + s * dy), interior
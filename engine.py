@@ -1,9 +1,18 @@
 # engine.py
+import gc
 import math
 import json
 import os
+import time
+from collections import OrderedDict, namedtuple
+import zipfile
 import xml.etree.ElementTree as ET
-from settings import G, COLORS, SCREEN_WIDTH, SCREEN_HEIGHT
+import numpy as np
+from settings import G, COLORS, SCREEN_WIDTH, SCREEN_HEIGHT, MAX_NUMERIC_DT, PLAN_BURN_DT, PLAN_DV_TOL, \
+    FORECAST_SAMPLES, FORECAST_ETA, FORECAST_TOL, FORECAST_BUDGET, ATMOSPHERE_HEIGHT, CLOSE_APPROACH
+from profiler import PROFILER
+from collision import SpatialHash, sweep, closest
+import planner
 
 
 def safe_float(node, attr_name, default_value=0.0):
@@ -14,6 +23,7 @@ def safe_float(node, attr_name, default_value=0.0):
 
 
 def get_dominant_body(x, y, bodies):
+    if isinstance(bodies, BodyTable): return bodies.dominant(x, y)
     best_body, max_g = None, -1
     for b in bodies:
         r2 = max((x - b.x) ** 2 + (y - b.y) ** 2, b.body_radius ** 2)
@@ -22,34 +32,74 @@ def get_dominant_body(x, y, bodies):
     return best_body
 
 
-def compute_gravity(pos_x, pos_y, bodies):
-    ax, ay = 0.0, 0.0
-    for body in bodies:
-        dx, dy = body.x - pos_x, body.y - pos_y
-        dist_sq = max(dx ** 2 + dy ** 2, body.body_radius ** 2)
-        f = G * body.mass / dist_sq
-        dist = math.sqrt(dist_sq)
-        ax += f * (dx / dist)
-        ay += f * (dy / dist)
-    return ax, ay
+def get_nearest_body(x, y, bodies):
+    if isinstance(bodies, BodyTable): return bodies.nearest(x, y)
+    return min(bodies, key=lambda b: math.hypot(x - b.x, y - b.y), default=None)
+
+
+def find_body(bodies, name):
+    """按名字查找天体；bodies 为 Galaxy 时会按需物化该天体所在的星系"""
+    if isinstance(bodies, Galaxy): return bodies.find(name)
+    return next((b for b in bodies if b.name == name), None)
+
+
+def get_local_scale(x, y, bodies, t=None):
+    """潮汐主导天体（GM/r^3 最大者）的距离与动力学时间 sqrt(r^3/GM)，供自适应步长使用；
+    t 为天体所取的时刻（None 为表的当前时刻）"""
+    return bodies.local_scale(x, y, t)
+
+
+def get_soi_body(x, y, bodies):
+    """引力影响球（拉普拉斯 SOI）层级中包含该点的最深天体；不在任何有限 SOI 内时取引力最大的恒星"""
+    if isinstance(bodies, BodyTable): return bodies.soi_body(x, y)
+    inside = [b for b in bodies if math.hypot(x - b.x, y - b.y) < b.soi_radius < math.inf]
+    if inside: return min(inside, key=lambda b: b.soi_radius)
+    roots = [b for b in bodies if b.parent is None]
+    return get_dominant_body(x, y, roots) if roots else None
+
+
+def compute_gravity(pos_x, pos_y, bodies, t=None):
+    return bodies.gravity(pos_x, pos_y, t)
 
 
 class CelestialBody:
     def __init__(self, name, parent, orbit_radius, mass, render_size, body_radius, color, offset_x=0, offset_y=0):
+        self._table, self._index = None, -1  # 加入 BodyTable 后位置/速度直接读写表内数组
         self.name, self.parent = name, parent
         self.orbit_radius, self.mass = orbit_radius, mass
         self.render_size, self.body_radius = render_size, body_radius
         self.color = COLORS.get(color, COLORS["white"])
-        self.children, self.x, self.y = [], offset_x, offset_y
+        self.children, self._x, self._y = [], offset_x, offset_y
         self.theta, self.omega = 0.0, 0.0
+        self.soi_radius = math.inf
 
         if self.parent and self.orbit_radius > 0:
             self.omega = math.sqrt(G * self.parent.mass / (self.orbit_radius ** 3))
-            self.x = self.parent.x + self.orbit_radius
-            self.y = self.parent.y
+            self._x = self.parent.x + self.orbit_radius
+            self._y = self.parent.y
+            if self.parent.mass > 0: self.soi_radius = self.orbit_radius * (self.mass / self.parent.mass) ** 0.4
+
+    @property
+    def x(self):
+        return self._x if self._table is None else float(self._table.x[self._index])
+
+    @x.setter
+    def x(self, value):
+        if self._table is None: self._x = value
+        else: self._table.x[self._index] = value
+
+    @property
+    def y(self):
+        return self._y if self._table is None else float(self._table.y[self._index])
+
+    @y.setter
+    def y(self, value):
+        if self._table is None: self._y = value
+        else: self._table.y[self._index] = value
 
     def set_time(self, current_time):
         """采用绝对时间计算轨道位置，确保读档绝对精准无漂移"""
+        if self._table is not None: return self._table.set_time(current_time)
         if self.parent:
             self.theta = self.omega * current_time
             self.x = self.parent.x + self.orbit_radius * math.cos(self.theta)
@@ -57,7 +107,13 @@ class CelestialBody:
         for child in self.children:
             child.set_time(current_time)
 
+    def relative_position(self, t):
+        """t 时刻相对父天体的位置（t 可为数组）"""
+        theta = self.omega * np.asarray(t, dtype=np.float64)
+        return self.orbit_radius * np.cos(theta), self.orbit_radius * np.sin(theta)
+
     def get_velocity(self):
+        if self._table is not None: return float(self._table.vx[self._index]), float(self._table.vy[self._index])
         if not self.parent: return 0.0, 0.0
         v_mag = self.omega * self.orbit_radius
         vx, vy = -v_mag * math.sin(self.theta), v_mag * math.cos(self.theta)
@@ -65,8 +121,336 @@ class CelestialBody:
         return pvx + vx, pvy + vy
 
 
+class BodyTable(list):
+    """天体列表 + 结构数组：x/y/质量/半径存为连续 float64 数组，引力与查找一次向量化完成"""
+
+    def __init__(self, bodies=()):
+        super().__init__(bodies)
+        self.roots = [b for b in self if b.parent is None]
+        self.mass = np.array([b.mass for b in self], dtype=np.float64)
+        self.body_radius = np.array([b.body_radius for b in self], dtype=np.float64)
+        self.gm = G * self.mass
+        self.radius_sq = self.body_radius ** 2
+        self.soi_sq = np.array([b.soi_radius for b in self], dtype=np.float64) ** 2
+        self.is_root = np.array([b.parent is None for b in self], dtype=bool)
+        self.x = np.array([b.x for b in self], dtype=np.float64)
+        self.y = np.array([b.y for b in self], dtype=np.float64)
+        self.ephemeris = Ephemeris(self)
+        # 初速度 = 绕父天体的圆周速度 + 父天体速度，按层级逐层累加
+        theta, eph = np.array([b.theta for b in self], dtype=np.float64), self.ephemeris
+        v_mag = eph.omega * eph.radius
+        self.vx, self.vy = -v_mag * np.sin(theta), v_mag * np.cos(theta)
+        self.vx[eph.parent < 0], self.vy[eph.parent < 0] = 0.0, 0.0
+        for level in eph.levels:
+            self.vx[level] += self.vx[eph.parent[level]]
+            self.vy[level] += self.vy[eph.parent[level]]
+        for i, b in enumerate(self): b._table, b._index = self, i
+        self.time = None
+
+    def set_time(self, current_time):
+        self.time = current_time
+        self.x[:], self.y[:], self.vx[:], self.vy[:] = self.ephemeris.state_at(current_time)
+
+    def positions(self, t=None):
+        """t 时刻的位置数组；缺省为当前时刻"""
+        if t is None or t == self.time: return self.x, self.y
+        x, y, _, _ = self.ephemeris.state_at(t)
+        return x, y
+
+    def _dist_sq(self, x, y, t=None):
+        """查询点可为标量或形如 (M,) 的数组，后者结果广播为 (M, N)"""
+        bx, by = self.positions(t)
+        dx, dy = bx - np.asarray(x)[..., None], by - np.asarray(y)[..., None]
+        return dx, dy, dx * dx + dy * dy
+
+    def gravity(self, pos_x, pos_y, t=None, chunk=1 << 18):
+        if np.ndim(pos_x):
+            if not len(self): return np.zeros(np.shape(pos_x)), np.zeros(np.shape(pos_x))
+            rows = max(1, chunk // len(self))
+            if len(pos_x) <= rows:
+                dx, dy, dist_sq = self._dist_sq(pos_x, pos_y, t)
+                dist_sq = np.maximum(dist_sq, self.radius_sq)
+                f = self.gm / (dist_sq * np.sqrt(dist_sq))
+                return np.einsum("ij,ij->i", f, dx), np.einsum("ij,ij->i", f, dy)
+            ax, ay = np.zeros(np.shape(pos_x)), np.zeros(np.shape(pos_x))
+            for i in range(0, len(ax), rows):
+                dx, dy, dist_sq = self._dist_sq(pos_x[i:i + rows], pos_y[i:i + rows], t)
+                dist_sq = np.maximum(dist_sq, self.radius_sq)
+                f = self.gm / (dist_sq * np.sqrt(dist_sq))
+                ax[i:i + rows], ay[i:i + rows] = (f * dx).sum(axis=1), (f * dy).sum(axis=1)
+            return ax, ay
+        if not len(self): return 0.0, 0.0
+        dx, dy, dist_sq = self._dist_sq(pos_x, pos_y, t)
+        dist_sq = np.maximum(dist_sq, self.radius_sq)
+        f = self.gm / (dist_sq * np.sqrt(dist_sq))
+        return float(f @ dx), float(f @ dy)
+
+    def dominant(self, x, y):
+        if not len(self): return None
+        _, _, dist_sq = self._dist_sq(x, y)
+        return self[int(np.argmax(self.gm / np.maximum(dist_sq, self.radius_sq)))]
+
+    def nearest(self, x, y):
+        if not len(self): return None
+        return self[int(np.argmin(self._dist_sq(x, y)[2]))]
+
+    def soi_index(self, x, y, t=None):
+        """每个查询点所在的最深 SOI 天体下标（不在任何有限 SOI 内时取引力最大的恒星）"""
+        _, _, dist_sq = self._dist_sq(x, y, t)
+        inside = (dist_sq < self.soi_sq) & np.isfinite(self.soi_sq)
+        deepest = np.argmin(np.where(inside, self.soi_sq, np.inf), axis=-1)
+        g = np.where(self.is_root, self.gm / np.maximum(dist_sq, self.radius_sq), -1.0)
+        return np.where(inside.any(axis=-1), deepest, np.argmax(g, axis=-1))
+
+    def soi_body(self, x, y, t=None):
+        return self[int(self.soi_index(x, y, t))] if len(self) else None
+
+    def local_scale(self, x, y, t=None):
+        if not len(self):
+            return (1.0, math.inf) if np.ndim(x) == 0 else (np.ones(np.shape(x)), np.full(np.shape(x), np.inf))
+        _, _, dist_sq = self._dist_sq(x, y, t)
+        r = np.sqrt(np.maximum(dist_sq, np.maximum(self.radius_sq, 1e-18)))
+        k = self.gm / r ** 3
+        i = np.argmax(k, axis=-1)
+        if np.ndim(x) == 0:
+            return float(r[i]), (1.0 / math.sqrt(k[i]) if k[i] > 0 else math.inf)
+        rows = np.arange(len(i))
+        r_best, k_best = r[rows, i], k[rows, i]
+        with np.errstate(divide="ignore"):
+            t_dyn = np.where(k_best > 0, 1.0 / np.sqrt(k_best), np.inf)
+        return r_best, t_dyn
+
+
+class Ephemeris:
+    """星历：加载时按层级（恒星→行星→卫星…）排好天体，任意时刻的全部位置/速度逐层向量化一次算出，
+    并按时间戳缓存。t 也可以是一维时间数组，此时返回形如 (len(t), N) 的数组"""
+
+    def __init__(self, bodies, cache_size=16):
+        index = {id(b): i for i, b in enumerate(bodies)}
+        self.parent = np.array([index.get(id(b.parent), -1) for b in bodies], dtype=np.int64)
+        depth, up = np.zeros(len(bodies), dtype=np.int64), self.parent.copy()
+        while (up >= 0).any():  # 沿父链整体上跳，每轮所有天体同时走一层
+            has = up >= 0
+            depth[has] += 1
+            up[has] = self.parent[up[has]]
+        self.levels = [np.flatnonzero(depth == d) for d in range(1, int(depth.max(initial=0)) + 1)]
+        # 层级 0（恒星，或父天体不在表内者）位置固定为加载时的值
+        is_base = depth == 0
+        self.base_x = np.where(is_base, [b.x for b in bodies], 0.0) if len(bodies) else np.zeros(0)
+        self.base_y = np.where(is_base, [b.y for b in bodies], 0.0) if len(bodies) else np.zeros(0)
+        self.radius = np.array([b.orbit_radius for b in bodies], dtype=np.float64)
+        self.omega = np.array([b.omega for b in bodies], dtype=np.float64)
+        self.cache_size, self._cache = cache_size, OrderedDict()
+
+    def state_at(self, t):
+        if np.ndim(t) == 0:
+            key = float(t)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        state = self._compute(np.asarray(t, dtype=np.float64))
+        if np.ndim(t) == 0:
+            for arr in state: arr.flags.writeable = False
+            self._cache[key] = state
+            if len(self._cache) > self.cache_size: self._cache.popitem(last=False)
+        return state
+
+    def _compute(self, t):
+        shape = np.shape(t) + self.radius.shape
+        x, y = np.broadcast_to(self.base_x, shape).copy(), np.broadcast_to(self.base_y, shape).copy()
+        vx, vy = np.zeros(shape), np.zeros(shape)
+        t = t[..., None]
+        for idx in self.levels:
+            par, r, w = self.parent[idx], self.radius[idx], self.omega[idx]
+            theta = w * t
+            cos_t, sin_t = np.cos(theta), np.sin(theta)
+            x[..., idx] = x[..., par] + r * cos_t
+            y[..., idx] = y[..., par] + r * sin_t
+            vx[..., idx] = vx[..., par] - r * w * sin_t
+            vy[..., idx] = vy[..., par] + r * w * cos_t
+        return x, y, vx, vy
+
+    def relative_state(self, i, t, ancestor=-1):
+        """天体 i 相对其祖先 ancestor（-1 为绝对坐标）在 t（标量或任意形状的时间数组）的 (x, y, vx, vy)；
+        只沿 i 的父链计算，不展开整张表"""
+        t = np.asarray(t, dtype=np.float64)
+        x, y, vx, vy = np.zeros(t.shape), np.zeros(t.shape), np.zeros(t.shape), np.zeros(t.shape)
+        while i != ancestor and self.parent[i] >= 0:
+            r, w = self.radius[i], self.omega[i]
+            cos_t, sin_t = np.cos(w * t), np.sin(w * t)
+            x += r * cos_t; y += r * sin_t
+            vx -= r * w * sin_t; vy += r * w * cos_t
+            i = self.parent[i]
+        if ancestor < 0: x += self.base_x[i]; y += self.base_y[i]
+        return x, y, vx, vy
+
+
+class Galaxy:
+    """星系分页：恒星连同星系位置与包围半径作为星系级索引常驻；行星和卫星只在某个激活点
+    （飞船、自动驾驶目标、镜头焦点）进入其激活半径时才实例化，参与引力、星历与渲染。
+    离开后的星系先留在 LRU 缓存里，超出 budget 才淘汰。已物化的集合变化时重建 table，
+    并以 (旧表, 新表) 通知 listeners，持有天体下标的一方据此重映射"""
+
+    def __init__(self, cols, activation_scale=2.0, budget=8):
+        self.cols, self.budget, self.time = cols, budget, 0.0
+        parent = np.array(cols["parent"], dtype=np.int64)
+        self.star_rows = np.flatnonzero(parent < 0)
+        self.bounds = np.append(self.star_rows, len(parent))  # 第 k 个星系占 [bounds[k], bounds[k+1]) 行
+        self.stars = [CelestialBody(cols["name"][i], None, *(cols[k][i] for k in UNIVERSE_COLUMNS[2:]))
+                      for i in self.star_rows.tolist()]
+        self.x = np.array([s.x for s in self.stars], dtype=np.float64)
+        self.y = np.array([s.y for s in self.stars], dtype=np.float64)
+        self.radius = _system_radius(cols, parent)[self.star_rows]
+        self.activation = activation_scale * self.radius
+        # 激活网格：格子边长取最大激活半径，查询点只需检查周围 3x3 格内的星系
+        self.cell = float(self.activation.max(initial=0.0)) or 1.0
+        self.grid = {}
+        for k in np.flatnonzero(self.activation > 0).tolist():
+            self.grid.setdefault((math.floor(self.x[k] / self.cell), math.floor(self.y[k] / self.cell)), []).append(k)
+        self.systems = OrderedDict()  # 已物化的星系下标 -> 其行星与卫星，最近使用的在后
+        self.listeners, self._rows = [], None
+        self.table = None
+        self._rebuild()
+
+    def update(self, xs, ys, t):
+        """按激活点物化/淘汰星系；已物化的集合有变化时返回 True"""
+        self.time, changed = t, False
+        near = self._near(xs, ys)
+        for k in sorted(near):
+            if k not in self.systems: self._materialize(k); changed = True
+            self.systems.move_to_end(k)
+        idle = [k for k in self.systems if k not in near]
+        for k in idle[:max(0, len(idle) - self.budget)]: self._evict(k); changed = True
+        if changed: self._rebuild()
+        return changed
+
+    def find(self, name):
+        i = self.row(name)
+        if i < 0: return None
+        k = int(np.searchsorted(self.star_rows, i, side="right")) - 1
+        if i == self.star_rows[k]: return self.stars[k]
+        if k not in self.systems: self._materialize(k); self._rebuild()
+        self.systems.move_to_end(k)
+        return self.systems[k][i - self.bounds[k] - 1]  # 物化按行序进行，系内下标即行偏移
+
+    def row(self, name):
+        """天体在列表中的行号（同名取第一个，与线性查找一致）；找不到为 -1"""
+        if self._rows is None: self._rows = {n: i for i, n in reversed(list(enumerate(self.cols["name"])))}
+        return self._rows.get(name, -1)
+
+    def locate(self, xs, ys):
+        """每个点所属的星系：激活半径内最近的恒星下标，不在任何星系内为 -1"""
+        xs, ys = np.atleast_1d(np.asarray(xs, dtype=np.float64)), np.atleast_1d(np.asarray(ys, dtype=np.float64))
+        result = np.full(len(xs), -1, dtype=np.int64)
+        for i, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+            gx, gy = math.floor(x / self.cell), math.floor(y / self.cell)
+            cand = [k for dx in (-1, 0, 1) for dy in (-1, 0, 1) for k in self.grid.get((gx + dx, gy + dy), ())]
+            if not cand: continue
+            cand = np.array(cand)
+            d_sq = (self.x[cand] - x) ** 2 + (self.y[cand] - y) ** 2
+            inside = d_sq <= self.activation[cand] ** 2
+            if inside.any(): result[i] = cand[inside][np.argmin(d_sq[inside])]
+        return result
+
+    def _near(self, xs, ys):
+        """激活半径内至少有一个查询点的星系下标"""
+        xs, ys = np.atleast_1d(np.asarray(xs, dtype=np.float64)), np.atleast_1d(np.asarray(ys, dtype=np.float64))
+        if not self.grid or not len(xs): return set()
+        cells = np.stack([np.floor(xs / self.cell), np.floor(ys / self.cell)]).astype(np.int64)
+        cells, inverse, counts = np.unique(cells, axis=1, return_inverse=True, return_counts=True)
+        groups = np.split(np.argsort(inverse.reshape(-1), kind="stable"), np.cumsum(counts)[:-1])
+        near = set()
+        for (gx, gy), pts in zip(cells.T.tolist(), groups):
+            cand = [k for dx in (-1, 0, 1) for dy in (-1, 0, 1) for k in self.grid.get((gx + dx, gy + dy), ())]
+            if not cand: continue
+            cand = np.array(cand)
+            d_sq = (xs[pts, None] - self.x[cand]) ** 2 + (ys[pts, None] - self.y[cand]) ** 2
+            near.update(cand[(d_sq <= self.activation[cand] ** 2).any(axis=0)].tolist())
+        return near
+
+    def _materialize(self, k):
+        c, made = self.cols, {int(self.star_rows[k]): self.stars[k]}
+        for i in range(self.bounds[k] + 1, self.bounds[k + 1]):
+            p = made[c["parent"][i]]
+            body = CelestialBody(c["name"][i], p, *(c[key][i] for key in UNIVERSE_COLUMNS[2:]))
+            p.children.append(body)
+            made[i] = body
+        self.systems[k] = list(made.values())[1:]
+
+    def detached(self, k=None):
+        """第 k 个星系（k 为 None 时只有各恒星）的一张独立天体表：天体都是新建的对象，与分页用的表互不影响。
+        表内顺序即行号顺序"""
+        c, made = self.cols, {}
+        rows = self.star_rows.tolist() if k is None else range(self.bounds[k], self.bounds[k + 1])
+        for i in rows:
+            p = made.get(c["parent"][i])
+            body = CelestialBody(c["name"][i], p, *(c[key][i] for key in UNIVERSE_COLUMNS[2:]))
+            if p is not None: p.children.append(body)
+            made[i] = body
+        return BodyTable(list(made.values()))
+
+    def _evict(self, k):
+        self.systems.pop(k)
+        self.stars[k].children = []
+
+    def _rebuild(self):
+        old, bodies = self.table, []
+        for k, star in enumerate(self.stars):
+            bodies.append(star)
+            bodies.extend(self.systems.get(k, ()))
+        self.table = BodyTable(bodies)
+        self.table.set_time(self.time)
+        for listener in self.listeners: listener(old, self.table)
+
+
+def _system_radius(cols, parent):
+    """每个天体影响范围的半径上界：自身 SOI 与各子天体（轨道半径 + 其范围）的最大值，自下而上累加"""
+    r = np.array(cols["orbit_radius"], dtype=np.float64)
+    m = np.array(cols["mass"], dtype=np.float64)
+    pm = m[np.maximum(parent, 0)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        reach = np.where((parent >= 0) & (r > 0) & (pm > 0), r * (m / pm) ** 0.4, 0.0)
+    depth, up = np.zeros(len(parent), dtype=np.int64), parent.copy()
+    while (up >= 0).any():
+        has = up >= 0
+        depth[has] += 1
+        up[has] = parent[up[has]]
+    for d in range(int(depth.max(initial=0)), 0, -1):
+        level = np.flatnonzero(depth == d)
+        np.maximum.at(reach, parent[level], r[level] + reach[level])
+    return reach
+
+
+AP_STATES = ("IDLE", "MANUAL", "ALIGNING", "TRANSFER BURN", "ORBIT INSERTION", "STABLE ORBIT",
+             "WAIT WINDOW", "DEPARTURE BURN", "CRUISE", "CORRECTION BURN", "LANDED")
+AP_CODES = {name: i for i, name in enumerate(AP_STATES)}
+
+
+class _FleetField:
+    """Ship 的数组字段：未编队时存在实例上，编队后读写 Fleet 中对应数组的那一行"""
+
+    def __set_name__(self, owner, name):
+        self.name, self.private = name, "_" + name
+
+    def __get__(self, ship, owner=None):
+        if ship is None: return self
+        if ship._fleet is None: return getattr(ship, self.private)
+        return ship._fleet.get(self.name, ship._index)
+
+    def __set__(self, ship, value):
+        if ship._fleet is None: setattr(ship, self.private, value)
+        else: ship._fleet.set(self.name, ship._index, value)
+
+
 class Ship:
+    x, y, vx, vy = _FleetField(), _FleetField(), _FleetField(), _FleetField()
+    heading, thrust, mass = _FleetField(), _FleetField(), _FleetField()
+    turn_cmd, thrust_percent = _FleetField(), _FleetField()
+    autopilot_target, ap_state = _FleetField(), _FleetField()
+    orbit = _FleetField()  # 非空表示正在 on-rails 解析滑行
+
     def __init__(self, name, x, y, thrust, mass, color):
+        self._fleet, self._index = None, -1
         self.name, self.x, self.y = name, x, y
         self.vx, self.vy = 0.0, 0.0
         self.thrust, self.mass = thrust, mass
@@ -78,6 +462,440 @@ class Ship:
         self.show_ui = True
         self.autopilot_target = None
         self.ap_state = "IDLE"
+        self.orbit = None
+
+
+class Fleet:
+    """编队：全部飞船的状态存于连续数组，飞控、引力与推力整队批量更新；Ship 对象只是其中一行的视图"""
+    FLOAT_FIELDS = ("x", "y", "vx", "vy", "heading", "thrust", "mass", "thrust_percent")
+
+    def __init__(self, ships, bodies):
+        self.ships, self.bodies = list(ships), bodies
+        for name in self.FLOAT_FIELDS:
+            setattr(self, name, np.array([getattr(s, name) for s in self.ships], dtype=np.float64))
+        self.turn_cmd = np.array([s.turn_cmd for s in self.ships], dtype=np.int8)
+        self.ap_code = np.array([AP_CODES[s.ap_state] for s in self.ships], dtype=np.int8)
+        self.target = np.array([self._body_index(s.autopilot_target) for s in self.ships], dtype=np.int64)
+        # on-rails 轨道根数（rails_body < 0 表示数值积分中）与最近一次由轨道写回的状态
+        n = len(self.ships)
+        self.rails_body = np.full(n, -1, dtype=np.int64)
+        self.el_a, self.el_e, self.el_arg_pe = np.zeros(n), np.zeros(n), np.zeros(n)
+        self.el_sense, self.el_mean_anomaly, self.el_epoch = np.ones(n), np.zeros(n), np.zeros(n)
+        self.rails_state = np.full((4, n), np.nan)
+        self.step_hint = {}  # 数值积分分档 -> 上一帧的建议步长
+        # 转移计划（plan_arrive 为 NaN 表示没有计划）：出发/到达时刻、出发天体（-1 为绕中心天体直接出发）与
+        # 中心天体下标、出发时相对出发天体的双曲剩余速度；plans 存完整的 TransferPlan
+        self.plan_depart, self.plan_arrive = np.full(n, np.nan), np.full(n, np.nan)
+        self.plan_origin, self.plan_central = np.full(n, -1, dtype=np.int64), np.full(n, -1, dtype=np.int64)
+        self.plan_vx, self.plan_vy = np.zeros(n), np.zeros(n)
+        self.plans = [None] * n
+        # 停在天体表面的飞船：landed 为天体下标（-1 表示没有），(land_x, land_y) 为相对天体中心的位置
+        self.landed = np.full(n, -1, dtype=np.int64)
+        self.land_x, self.land_y = np.zeros(n), np.zeros(n)
+        self.traces = None  # 为列表时，数值积分把每批的 (飞船下标, 起始时刻, 起始状态, 各子步) 追加进来，供碰撞检测
+        for i, s in enumerate(self.ships): s._fleet, s._index = self, i
+
+    def __len__(self):
+        return len(self.ships)
+
+    def _body_index(self, body):
+        if body is None: return -1
+        if body._table is self.bodies: return body._index
+        return self.bodies.index(body)
+
+    def get(self, name, i):
+        if name in self.FLOAT_FIELDS: return float(getattr(self, name)[i])
+        if name == "turn_cmd": return int(self.turn_cmd[i])
+        if name == "ap_state": return AP_STATES[self.ap_code[i]]
+        if name == "autopilot_target": return self.bodies[self.target[i]] if self.target[i] >= 0 else None
+        if name == "orbit": return self.orbit_of(i)
+        raise AttributeError(name)
+
+    def set(self, name, i, value):
+        if name in self.FLOAT_FIELDS or name == "turn_cmd": getattr(self, name)[i] = value
+        elif name == "ap_state": self.ap_code[i] = AP_CODES[value]
+        elif name == "autopilot_target":
+            self.target[i], self.plan_arrive[i] = self._body_index(value), np.nan  # 换目标即放弃转移计划
+        elif name == "orbit":
+            if value is not None: raise ValueError("fleet orbits are set by Fleet.coast")
+            self.rails_body[i] = -1
+        else: raise AttributeError(name)
+
+    def rebind(self, bodies):
+        """天体表重建后把目标与 on-rails 天体下标映射到新表；已被淘汰的天体置为 -1"""
+        remap = np.full(len(self.bodies) + 1, -1, dtype=np.int64)  # 末位留给 -1
+        for i, b in enumerate(self.bodies):
+            if b._table is bodies: remap[i] = b._index
+        self.target, self.rails_body = remap[self.target], remap[self.rails_body]
+        self.plan_origin, self.plan_central = remap[self.plan_origin], remap[self.plan_central]
+        self.landed = remap[self.landed]
+        self.bodies = bodies
+
+    def _orbit(self, b, idx):
+        body = self.bodies[b]
+        return KeplerOrbit(body, G * body.mass, self.el_a[idx], self.el_e[idx], self.el_arg_pe[idx],
+                           self.el_sense[idx], self.el_mean_anomaly[idx], self.el_epoch[idx])
+
+    def orbit_of(self, i):
+        return self._orbit(int(self.rails_body[i]), i) if self.rails_body[i] >= 0 else None
+
+    def state(self, idx):
+        return self.x[idx], self.y[idx], self.vx[idx], self.vy[idx]
+
+    def set_state(self, idx, x, y, vx, vy):
+        self.x[idx], self.y[idx], self.vx[idx], self.vy[idx] = x, y, vx, vy
+
+    # --- 物理：推力飞船整批数值积分，滑行飞船按 SOI 天体分组解析推进 ---
+    def integrate(self, idx, dt, thrust_x, thrust_y, integrator, t0=0.0):
+        """数值积分 idx 中的飞船从 t0 起 dt 秒（每次求引力时天体按星历放到该时刻）；返回 (步数, 引力求值次数)。
+        按主导天体动力学时间分档（相邻档差 4 倍），每档一次积分器调用整批推进，
+        深引力井里的少数飞船不会拖小整队的步长；自适应积分器的建议步长按档分别保留"""
+        if not len(idx) or dt <= 0: return 0, 0
+        _, t_dyn = self.bodies.local_scale(self.x[idx], self.y[idx])
+        level = np.floor(np.log(np.minimum(t_dyn, 1e300)) / math.log(4)).astype(np.int64)
+        steps = evals = 0
+        for lv in np.unique(level):
+            if hasattr(integrator, "h"): integrator.h = self.step_hint.get(lv)
+            s, e = self._integrate_batch(idx[level == lv], dt, thrust_x, thrust_y, integrator, t0)
+            if hasattr(integrator, "h"): self.step_hint[lv] = integrator.h
+            steps, evals = steps + s, evals + e
+        self.rails_body[idx] = -1
+        return steps, evals
+
+    def _integrate_batch(self, idx, dt, thrust_x, thrust_y, integrator, t0):
+        tx, ty = thrust_x[idx], thrust_y[idx]
+
+        def accel(t, x, y):
+            ax, ay = self.bodies.gravity(x, y, t0 + t)
+            return ax + tx, ay + ty
+
+        state = self.state(idx)
+        if len(idx) == 1:  # 单艘飞船走标量路径，省去 (1, N) 广播的开销
+            state, tx, ty = [float(v[0]) for v in state], float(tx[0]), float(ty[0])
+        if self.traces is not None:
+            integrator.trace = []
+            self.traces.append((idx, t0, [np.array(v, dtype=np.float64) for v in state], integrator.trace))
+        x, y, vx, vy, steps, evals = integrator.integrate(*state, accel, dt, self.bodies, t0)
+        integrator.trace = None
+        self.set_state(idx, x, y, vx, vy)
+        return steps, evals
+
+    def coast(self, idx, t0, t1, integrator):
+        """无推力飞船从 t0 解析推进到 t1，每帧 O(1) 与倍速无关；返回边界交接时数值积分的 (步数, 求值次数)"""
+        if not len(idx): return 0, 0
+        stale = (self.rails_body[idx] < 0) | np.any(np.stack(self.state(idx)) != self.rails_state[:, idx], axis=0)
+        if stale.any(): self._rebuild(idx[stale], t0)
+
+        steps = evals = 0
+        railed, degenerate = idx[self.rails_body[idx] >= 0], idx[self.rails_body[idx] < 0]
+        for b in np.unique(self.rails_body[railed]):
+            group = railed[self.rails_body[railed] == b]
+            orbit = self._orbit(b, group)
+            t_exit, t_entry = orbit.soi_exit_time(t0), orbit.soi_entry_time(t0, t1)
+            done = np.minimum(t_exit, t_entry) >= t1
+            if done.any(): self._place(group[done], orbit.subset(done), t1)
+            for k in np.flatnonzero(~done):
+                s, e = self._cross(int(group[k]), float(t_exit[k]), float(t_entry[k]), t1, integrator)
+                steps, evals = steps + s, evals + e
+
+        # 径向等退化轨道无法上轨，直接数值积分（穿越边界时已由 _cross 积分过的不在其中）
+        if len(degenerate):
+            zero = np.zeros(len(self))
+            s, e = self.integrate(degenerate, t1 - t0, zero, zero, integrator, t0)
+            steps, evals = steps + s, evals + e
+        return steps, evals
+
+    def _rebuild(self, sel, t, body=None):
+        """以 t 时刻的状态为 sel 中飞船重建相对其 SOI 天体（或指定天体）的轨道根数"""
+        bx, by, bvx, bvy = self.bodies.ephemeris.state_at(t)
+        soi = np.full(len(sel), body) if body is not None else self.bodies.soi_index(self.x[sel], self.y[sel], t)
+        for b in np.unique(soi):
+            g = sel[soi == b]
+            a, e, arg_pe, sense, mean_anomaly, valid = KeplerOrbit.elements(
+                self.bodies.gm[b], self.x[g] - bx[b], self.y[g] - by[b], self.vx[g] - bvx[b], self.vy[g] - bvy[b])
+            self.el_a[g], self.el_e[g], self.el_arg_pe[g] = a, e, arg_pe
+            self.el_sense[g], self.el_mean_anomaly[g], self.el_epoch[g] = sense, mean_anomaly, t
+            self.rails_body[g] = np.where(valid, b, -1)
+
+    def _place(self, sel, orbit, t):
+        """把 sel 中飞船放到其轨道上 t 时刻的位置，并记下写回的状态"""
+        bx, by, bvx, bvy = self.bodies.ephemeris.state_at(t)
+        b = self.rails_body[sel]
+        rx, ry, rvx, rvy = orbit.state_at(t)
+        self.set_state(sel, bx[b] + rx, by[b] + ry, bvx[b] + rvx, bvy[b] + rvy)
+        self.rails_state[:, sel] = np.stack(self.state(sel))
+
+    def _cross(self, i, t_exit, t_entry, t1, integrator):
+        """处理第 i 艘飞船在本帧内穿越 SOI 边界：停在边界上，剩余时间不长时交给数值积分
+        （下一帧再以新的 SOI 天体上轨）；超高倍速下剩余时间过长，则直接在新天体上重新上轨"""
+        sel, zero = np.array([i]), np.zeros(len(self))
+        for _ in range(4):
+            t_cross = min(t_exit, t_entry)
+            self._place(sel, self._orbit(self.rails_body[i], sel), t_cross)
+            if t1 - t_cross <= MAX_NUMERIC_DT: return self.integrate(sel, t1 - t_cross, zero, zero, integrator, t_cross)
+            parent = self.bodies[self.rails_body[i]].parent if t_exit <= t_entry else None
+            self._rebuild(sel, t_cross, None if parent is None else parent._index)
+            if self.rails_body[i] < 0: return self.integrate(sel, t1 - t_cross, zero, zero, integrator, t_cross)
+            orbit = self._orbit(self.rails_body[i], sel)
+            t_exit, t_entry = float(orbit.soi_exit_time(t_cross)[0]), float(orbit.soi_entry_time(t_cross, t1)[0])
+            if min(t_exit, t_entry) >= t1: break
+        self._place(sel, self._orbit(self.rails_body[i], sel), t1)
+        return 0, 0
+
+    def touch_down(self, sel, body, rx, ry):
+        """sel 中飞船停到天体 body（下标）表面上相对中心 (rx, ry) 处，此后随天体平移，向外点火即起飞。
+        着陆即结束自动驾驶与转移计划，否则贪心自动驾驶下一帧又会起飞、再撞回来"""
+        self.landed[sel], self.land_x[sel], self.land_y[sel] = body, rx, ry
+        self.ap_code[sel], self.thrust_percent[sel], self.rails_body[sel] = AP_CODES["LANDED"], 0.0, -1
+        self.target[sel], self.plan_arrive[sel] = -1, np.nan
+        self.carry(sel)
+
+    def carry(self, sel):
+        """把着陆的飞船放到所在天体当前的位置上，速度与天体相同"""
+        b = self.landed[sel]
+        self.set_state(sel, self.bodies.x[b] + self.land_x[sel], self.bodies.y[b] + self.land_y[sel],
+                       self.bodies.vx[b], self.bodies.vy[b])
+
+    # --- 飞控：手动操控（仅玩家）+ 整队向量化自动驾驶 ---
+    def fly(self, dt, time_scale, player=None, left=False, right=False, up=False, t=0.0):
+        """返回每艘飞船本帧的推力加速度数组 (thrust_x, thrust_y)；t 为本帧开始的模拟时间（执行转移计划用）"""
+        max_accel = self.thrust / self.mass
+        accel = np.zeros(len(self))
+        self.turn_cmd[:], self.thrust_percent[:] = 0, 0.0
+
+        if player is not None and (left or right or up):
+            self.target[player], self.ap_code[player] = -1, AP_CODES["MANUAL"]
+            self.plan_arrive[player] = np.nan
+            if left:  self.heading[player] -= 0.05; self.turn_cmd[player] = -1
+            if right: self.heading[player] += 0.05; self.turn_cmd[player] = 1
+            if up:    self.thrust_percent[player], accel[player] = 1.0, max_accel[player]
+
+        ap = np.flatnonzero(self.target >= 0)
+        planned = np.isfinite(self.plan_arrive[ap])
+        if planned.any():
+            pl = ap[planned]
+            following = self._navigate(pl, t, dt, time_scale, max_accel[pl], accel)
+            ap = np.concatenate([ap[~planned], pl[~following]])  # 到达的飞船本帧起交给贪心自动驾驶
+        if len(ap): self._autopilot(ap, dt, time_scale, max_accel[ap], accel)
+        return np.cos(self.heading) * accel, np.sin(self.heading) * accel
+
+    def _steer(self, k, dvx, dvy, dv_mag, dt, time_scale, max_accel, accel, gain=0.5):
+        """k 中飞船转向速度差 (dvx, dvy)，对准后点火补上（加速度不超过 gain * |dv|，防止震荡）；
+        返回 (转向中, 点火) 掩码"""
+        target_heading = np.arctan2(dvy, dvx)
+        angle_diff = (target_heading - self.heading[k] + math.pi) % (2 * math.pi) - math.pi
+        side = np.where(angle_diff > 0, 1, -1)
+
+        # 如果时间加速开启（流速很快），允许飞船瞬间完成姿态调整，防止因错过窗口而卡住
+        turn_speed = 0.1 if time_scale < 50 else math.pi
+
+        turning = np.abs(angle_diff) > turn_speed
+        t = k[turning]
+        self.heading[t] += turn_speed * side[turning]
+        self.turn_cmd[t] = side[turning]
+
+        aligned = ~turning
+        self.heading[k[aligned]] = target_heading[aligned]
+        burn = aligned & (np.abs(angle_diff) < 0.2)
+        t = k[burn]
+        actual_accel = np.minimum(np.minimum(max_accel[burn], dv_mag[burn] * gain), dv_mag[burn] / max(dt, 0.001))
+        self.thrust_percent[t], accel[t] = actual_accel / max_accel[burn], actual_accel
+        return turning, burn
+
+    def _autopilot(self, ap, dt, time_scale, max_accel, accel):
+        b, tgt = self.bodies, self.target[ap]
+        tx, ty = b.x[tgt], b.y[tgt]
+        rel_x, rel_y = tx - self.x[ap], ty - self.y[ap]
+        dist = np.hypot(rel_x, rel_y)
+        sync_dist = np.maximum(b.body_radius[tgt] * 1.5, 100.0)
+
+        ur_x, ur_y = rel_x / dist, rel_y / dist
+        ut_x, ut_y = -ur_y, ur_x
+        v_tan_mag = np.sqrt(b.gm[tgt] / np.maximum(dist, 1.0))
+
+        # 平滑径向靠近速度，防止震荡
+        v_rad_desired = 0.05 * (dist - sync_dist)
+        max_app_speed = np.sqrt(np.maximum(0, 2 * max_accel * np.abs(dist - sync_dist))) * 0.5
+        v_rad_desired = np.clip(v_rad_desired, -max_app_speed, max_app_speed)
+
+        tvx, tvy = b.vx[tgt], b.vy[tgt]
+        desired_vx, desired_vy = tvx + v_tan_mag * ut_x + v_rad_desired * ur_x, tvy + v_tan_mag * ut_y + v_rad_desired * ur_y
+        dvx, dvy = desired_vx - self.vx[ap], desired_vy - self.vy[ap]
+        dv_mag = np.hypot(dvx, dvy)
+
+        # --- 优化2：更强大的高倍速容差捕捉机制 ---
+        # 速度误差放宽至 0.5 km/s，距离误差放宽至目标半径的 20%
+        lock = (dv_mag < 0.5) & (np.abs(dist - sync_dist) < b.body_radius[tgt] * 0.2)
+        k = ap[lock]
+        if len(k):
+            self.ap_code[k] = AP_CODES["STABLE ORBIT"]
+            # 瞬间将其绝对锁定在完美圆形轨道上
+            vt_x, vt_y = (v_tan_mag * ut_x)[lock], (v_tan_mag * ut_y)[lock]
+            self.set_state(k, tx[lock] - ur_x[lock] * sync_dist[lock], ty[lock] - ur_y[lock] * sync_dist[lock],
+                           tvx[lock] + vt_x, tvy[lock] + vt_y)
+            self.heading[k] = np.arctan2(vt_y, vt_x)
+
+        free = ~lock
+        k, dist, sync_dist = ap[free], dist[free], sync_dist[free]
+        turning, burn = self._steer(k, dvx[free], dvy[free], dv_mag[free], dt, time_scale, max_accel[free], accel)
+        self.ap_code[k[turning]] = AP_CODES["ALIGNING"]
+        self.ap_code[k[burn]] = np.where(dist[burn] > sync_dist[burn] * 2, AP_CODES["TRANSFER BURN"],
+                                         AP_CODES["ORBIT INSERTION"])
+
+    def _navigate(self, pl, t, dt, time_scale, max_accel, accel):
+        """执行转移计划：等待窗口 → 出发点火 → 巡航（飞出出发天体 SOI 后按 Lambert 重算一次中途修正，
+        进入目标 SOI 后把近拱点修到同步轨道高度）→ 飞过近拱点时点火圆化（入轨），停在这条轨道上结束计划。
+        到达时刻已过仍未进入目标 SOI、或中心天体已被分页淘汰时放弃计划；返回仍在按计划飞行的掩码"""
+        b, eph = self.bodies, self.bodies.ephemeris
+        code, origin, tgt = self.ap_code[pl], self.plan_origin[pl], self.target[pl]
+        cruise, sync = code == AP_CODES["CRUISE"], np.maximum(b.body_radius[tgt] * 1.5, 100.0)
+        near = b.soi_index(self.x[pl], self.y[pl]) == tgt
+        rx, ry, rvx, rvy = self.x[pl] - b.x[tgt], self.y[pl] - b.y[tgt], self.vx[pl] - b.vx[tgt], self.vy[pl] - b.vy[tgt]
+        r, h = np.hypot(rx, ry), rx * rvy - ry * rvx
+        with np.errstate(all="ignore"):
+            e = np.sqrt(np.maximum(1 + (rvx * rvx + rvy * rvy - 2 * b.gm[tgt] / r) * h * h / b.gm[tgt] ** 2, 0))
+            periapsis = h * h / b.gm[tgt] / (1 + e)
+        approaching = rx * rvx + ry * rvy < 0
+        # 已飞出出发天体的 SOI：此后的点火改为绕中心天体直接对准 Lambert 转移（中途修正）
+        o = np.maximum(origin, 0)
+        left = (self.x[pl] - b.x[o]) ** 2 + (self.y[pl] - b.y[o]) ** 2 > b.soi_sq[o]
+        fix = cruise & ~near & (origin >= 0) & left
+        self.plan_origin[pl[fix]] = -1
+        # 在目标 SOI 内：近拱点偏离同步轨道高度 10% 以上就修正；飞过近拱点即圆化
+        fix |= cruise & near & approaching & (np.abs(periapsis - sync) > 0.1 * sync)
+        self.ap_code[pl[fix]] = AP_CODES["CORRECTION BURN"]
+        self.ap_code[pl[cruise & near & ~approaching]] = AP_CODES["ORBIT INSERTION"]
+        self.ap_code[pl[(code == AP_CODES["WAIT WINDOW"]) & (t >= self.plan_depart[pl])]] = AP_CODES["DEPARTURE BURN"]
+
+        code = self.ap_code[pl]
+        done = (self.plan_central[pl] < 0) | ((t >= self.plan_arrive[pl]) & ~near)
+        self.plan_arrive[pl[done]] = np.nan
+        burning = ~done & np.isin(code, (AP_CODES["DEPARTURE BURN"], AP_CODES["CORRECTION BURN"],
+                                         AP_CODES["ORBIT INSERTION"]))
+        if not burning.any(): return ~done
+        k, code, max_accel, near = pl[burning], code[burning], max_accel[burning], near[burning]
+        rx, ry, rvx, rvy, r, sync = rx[burning], ry[burning], rvx[burning], rvy[burning], r[burning], sync[burning]
+        tgt, o = self.target[k], self.plan_origin[k]
+        sense = np.where(rx * rvy - ry * rvx >= 0, 1.0, -1.0)
+        capture = code == AP_CODES["ORBIT INSERTION"]
+        trim = ~capture & near
+        escape = ~capture & ~trim & (o >= 0)
+        direct = ~capture & ~trim & ~escape
+        desired_vx, desired_vy = np.empty(len(k)), np.empty(len(k))
+        if escape.any():
+            e, o = k[escape], o[escape]
+            vx, vy = planner.escape_velocity(b.gm[o], self.x[e] - b.x[o], self.y[e] - b.y[o], self.vx[e] - b.vx[o],
+                                             self.vy[e] - b.vy[o], self.plan_vx[e], self.plan_vy[e])
+            desired_vx[escape], desired_vy[escape] = b.vx[o] + vx, b.vy[o] + vy
+        if direct.any():
+            # 每帧从当前位置重新求解，点火跨越多帧或推迟开始都不会偏离。先瞄准目标中心求出到达时的剩余速度，
+            # 再把瞄准点偏到能在同步轨道高度逆时针掠过目标的位置
+            d = k[direct]
+            c, tof = self.plan_central[d], self.plan_arrive[d] - t
+            x1, y1 = self.x[d] - b.x[c], self.y[d] - b.y[c]
+            x2, y2, tvx, tvy = np.array([eph.relative_state(self.target[j], self.plan_arrive[j], self.plan_central[j])
+                                         for j in d.tolist()], dtype=np.float64).T
+            _, _, v2x, v2y = planner.lambert(b.gm[c], x1, y1, x2, y2, tof)
+            ox, oy = planner.aim_offset(b.gm[tgt[direct]], sync[direct], v2x - tvx, v2y - tvy)
+            v1x, v1y, _, _ = planner.lambert(b.gm[c], x1, y1, x2 + ox, y2 + oy, tof)
+            desired_vx[direct], desired_vy[direct] = b.vx[c] + v1x, b.vy[c] + v1y
+        # 近拱点修正保持速率只转方向：角动量取近拱点在同步轨道高度时的值；圆化则直接换成当前半径上的圆轨道速度
+        mu, v2 = b.gm[tgt], rvx * rvx + rvy * rvy
+        with np.errstate(invalid="ignore"):
+            v_t = np.where(capture, np.sqrt(mu / r), sync * np.sqrt(np.maximum(v2 - 2 * mu / r + 2 * mu / sync, 0)) / r)
+            v_r = np.where(capture, 0.0, -np.sqrt(np.maximum(v2 - v_t * v_t, 0)))
+        local = capture | trim
+        v_t = sense * v_t
+        desired_vx[local] = (b.vx[tgt] + (v_r * rx - v_t * ry) / r)[local]
+        desired_vy[local] = (b.vy[tgt] + (v_r * ry + v_t * rx) / r)[local]
+
+        dvx, dvy = desired_vx - self.vx[k], desired_vy - self.vy[k]
+        dv_mag = np.hypot(dvx, dvy)
+        # 出发点火的余差留给中途修正，圆化只要求到圆轨道速度的 1%（低轨上圆化方向每帧都在转）；无解（NaN）时也不再点火
+        tol = np.where(escape, 10 * PLAN_DV_TOL, np.where(capture, np.maximum(PLAN_DV_TOL, 0.01 * np.abs(v_t)),
+                                                             PLAN_DV_TOL))
+        finished = ~(dv_mag >= tol)
+        self.ap_code[k[finished]] = np.where(capture[finished], AP_CODES["STABLE ORBIT"], AP_CODES["CRUISE"])
+        # 入轨完成，计划结束：停在这条圆轨道上，不再交给贪心自动驾驶
+        parked = k[finished & capture]
+        self.plan_arrive[parked], self.target[parked] = np.nan, -1
+        active = ~finished
+        self._steer(k[active], dvx[active], dvy[active], dv_mag[active], dt, time_scale, max_accel[active], accel,
+                    gain=math.inf)  # 计划点火按脉冲近似，全推力直到补足
+        following = ~done
+        following[np.flatnonzero(burning)[finished & capture]] = True
+        return following
+
+    def plan_horizon(self, t):
+        """按计划飞行的飞船允许本帧推进的最长时间：不越过出发时刻，点火时近似脉冲，巡航时逐步加密以及时发现进入目标 SOI"""
+        pl = np.flatnonzero((self.target >= 0) & np.isfinite(self.plan_arrive))
+        if not len(pl): return math.inf
+        code = self.ap_code[pl]
+        wait = self.plan_depart[pl] - t
+        horizon = np.where(code == AP_CODES["CRUISE"], (self.plan_arrive[pl] - t) / 20, PLAN_BURN_DT)
+        horizon = np.where((code == AP_CODES["WAIT WINDOW"]) & (wait > 0), wait, np.maximum(horizon, PLAN_BURN_DT))
+        return float(horizon.min())
+
+    # --- 转移规划：Lambert porkchop 搜索（planner），计划交给 _navigate 执行 ---
+    def plan_transfer(self, i, target, t, departures=128, durations=128, workers=None):
+        """为第 i 艘飞船搜索飞往天体 target（下标）的转移，返回 TransferPlan；目标是恒星、
+        与飞船不在同一星系或飞船已在其 SOI 内时返回 None。出发窗口取一个会合周期，飞行时长取霍曼时间的 0.4–1.6 倍"""
+        b, eph = self.bodies, self.bodies.ephemeris
+        central = int(eph.parent[target])
+        origin = int(b.soi_index(self.x[i], self.y[i], t))
+        if central < 0 or origin == target: return None
+        while origin >= 0 and origin != central and eph.parent[origin] != central: origin = int(eph.parent[origin])
+        if origin < 0 or origin == target: return None
+        mu = b.gm[central]
+
+        def arrive(ts): return eph.relative_state(target, ts, central)
+        if origin == central:  # 直接绕中心天体飞行：出发点是飞船自己的轨道
+            origin = -1
+            cx, cy, cvx, cvy = eph.relative_state(central, t)
+            orbit = KeplerOrbit.from_state(b[central], self.x[i] - cx, self.y[i] - cy, self.vx[i] - cvx,
+                                           self.vy[i] - cvy, t)
+            if orbit is None: return None
+            start, period, r_start = orbit.state_at, float(orbit.period), float(orbit.a)
+        else:
+            def start(ts): return eph.relative_state(origin, ts, central)
+            period, r_start = 2 * math.pi / eph.omega[origin], eph.radius[origin]
+        period_t, r_target = 2 * math.pi / eph.omega[target], eph.radius[target]
+
+        with np.errstate(divide="ignore"):
+            synodic = 1.0 / abs(1.0 / period - 1.0 / period_t)
+        window = min(synodic, 2 * max(period_t, period if math.isfinite(period) else 0.0))
+        hohmann = math.pi * math.sqrt(((r_start + r_target) / 2) ** 3 / mu)
+        plan = planner.search(mu, start, arrive, t + np.linspace(0.0, window, departures),
+                              hohmann * np.linspace(0.4, 1.6, durations), workers)
+        if plan is None: return None
+        soi = int(b.soi_index(self.x[i], self.y[i], t))
+        if origin >= 0 and soi == origin:
+            # 停泊轨道上不同位置出发的代价差别很大：在出发前一圈里挑需要 Δv 最小的时刻
+            ox, oy, ovx, ovy = eph.relative_state(origin, t)
+            parking = KeplerOrbit.from_state(b[origin], self.x[i] - ox, self.y[i] - oy, self.vx[i] - ovx,
+                                             self.vy[i] - ovy, t)
+            if parking is not None and parking.elliptic:
+                ts = np.linspace(max(t, plan.t_depart - float(parking.period)), plan.t_depart, 64)
+                rx, ry, rvx, rvy = parking.state_at(ts)
+                vx, vy = planner.escape_velocity(b.gm[origin], rx, ry, rvx, rvy, *plan.v_inf)
+                dv = np.hypot(vx - rvx, vy - rvy)
+                if np.isfinite(dv).any():
+                    k = int(np.nanargmin(dv))
+                    plan = plan._replace(t_depart=float(ts[k]), dv_depart=float(dv[k]))
+        return plan._replace(origin=b[origin] if origin >= 0 else None, target=b[target], central=b[central])
+
+    def follow(self, i, plan):
+        """让第 i 艘飞船执行 plan；plan 为 None 时取消计划"""
+        self.plans[i] = plan
+        if plan is None:
+            self.plan_arrive[i] = np.nan
+            return
+        self.target[i] = self._body_index(plan.target)
+        self.plan_origin[i] = self._body_index(plan.origin)
+        self.plan_central[i] = self._body_index(plan.central)
+        self.plan_depart[i], self.plan_arrive[i] = plan.t_depart, plan.t_arrive
+        self.plan_vx[i], self.plan_vy[i] = plan.v_inf
+        self.ap_code[i] = AP_CODES["WAIT WINDOW"]
 
 
 class Camera:
@@ -86,63 +904,857 @@ class Camera:
         self.scale = 0.003
         self.offset_x, self.offset_y = 0.0, 0.0
         self.view_level = 3
+        self.locate = None  # 可选 body -> (x, y)：渲染线程从物理快照取位置，而不是读实时天体
+
+    def center(self):
+        """镜头中心的世界坐标"""
+        if self.target is None: tx, ty = 0, 0
+        elif self.locate: tx, ty = self.locate(self.target)
+        else: tx, ty = self.target.x, self.target.y
+        return tx + self.offset_x, ty + self.offset_y
 
     def apply(self, x, y):
-        tx = (self.target.x if self.target else 0) + self.offset_x
-        ty = (self.target.y if self.target else 0) + self.offset_y
+        tx, ty = self.center()
         sx = int((x - tx) * self.scale + SCREEN_WIDTH / 2)
         sy = int((y - ty) * self.scale + SCREEN_HEIGHT / 2)
         return sx, sy
 
+    def apply_array(self, xs, ys):
+        """批量版 apply：世界坐标数组 -> 屏幕坐标 int 数组"""
+        tx, ty = self.center()
+        sx = ((np.asarray(xs) - tx) * self.scale + SCREEN_WIDTH / 2).astype(np.int64)
+        sy = ((np.asarray(ys) - ty) * self.scale + SCREEN_HEIGHT / 2).astype(np.int64)
+        return sx, sy
+
     def reset_offset(self):
         self.offset_x, self.offset_y = 0.0, 0.0
 
 
+# --- 开普勒轨道：无推力滑行时按圆锥曲线解析推进 (on-rails) ---
+class KeplerOrbit:
+    """相对 body 的二维圆锥曲线（椭圆或双曲线）。根数可以是同一 body 下多艘飞船的数组，
+    时间参数也可为数组，两者按 numpy 规则广播"""
+
+    def __init__(self, body, mu, a, e, arg_pe, sense, mean_anomaly, epoch):
+        self.body, self.mu = body, mu
+        self.a, self.e, self.arg_pe, self.sense, self.mean_anomaly, self.epoch = (
+            np.asarray(v, dtype=np.float64) for v in (a, e, arg_pe, sense, mean_anomaly, epoch))
+        self.elliptic = self.e < 1.0
+        self.p = self.a * np.abs(1.0 - self.e * self.e)
+        self.n = np.sqrt(mu / self.a ** 3)
+
+    @staticmethod
+    def elements(mu, rx, ry, rvx, rvy):
+        """由相对位置/速度求 (a, e, arg_pe, sense, mean_anomaly, valid)；
+        径向、近抛物线等退化情况 valid 为 False（交回数值积分）"""
+        rx, ry, rvx, rvy = (np.asarray(v, dtype=np.float64) for v in (rx, ry, rvx, rvy))
+        with np.errstate(all="ignore"):
+            r, v2 = np.hypot(rx, ry), rvx * rvx + rvy * rvy
+            h, rv = rx * rvy - ry * rvx, rx * rvx + ry * rvy
+            ex = ((v2 - mu / r) * rx - rv * rvx) / mu
+            ey = ((v2 - mu / r) * ry - rv * rvy) / mu
+            e = np.hypot(ex, ey)
+            a = np.abs(1.0 / (2.0 / r - v2 / mu))
+            arg_pe, sense = np.arctan2(ey, ex), np.where(h > 0, 1.0, -1.0)
+            nu = sense * (np.arctan2(ry, rx) - arg_pe)
+            ecc = np.arctan2(np.sqrt(np.maximum(1 - e * e, 0)) * np.sin(nu), e + np.cos(nu))
+            hyp = 2.0 * np.arctanh(np.sqrt(np.maximum((e - 1) / (e + 1), 0)) * np.tan(nu / 2))
+            mean_anomaly = np.where(e < 1.0, ecc - e * np.sin(ecc), e * np.sinh(hyp) - hyp)
+            valid = (mu > 0) & (r > 0) & (h * h >= 1e-12 * mu * r) & (np.abs(e - 1.0) >= 1e-8) & \
+                    np.isfinite(mean_anomaly) & np.isfinite(a)
+        return a, e, arg_pe, sense, mean_anomaly, valid
+
+    @classmethod
+    def from_state(cls, body, rx, ry, rvx, rvy, epoch):
+        """单艘飞船：退化轨道返回 None"""
+        mu = G * body.mass
+        a, e, arg_pe, sense, mean_anomaly, valid = cls.elements(mu, rx, ry, rvx, rvy)
+        return cls(body, mu, a, e, arg_pe, sense, mean_anomaly, epoch) if valid else None
+
+    @property
+    def period(self):
+        return np.where(self.elliptic, 2 * math.pi / self.n, np.inf)
+
+    @property
+    def apoapsis(self):
+        return np.where(self.elliptic, self.a * (1 + self.e), np.inf)
+
+    @property
+    def periapsis(self):
+        return self.p / (1 + self.e)
+
+    def subset(self, idx):
+        return KeplerOrbit(self.body, self.mu, self.a[idx], self.e[idx], self.arg_pe[idx], self.sense[idx],
+                           self.mean_anomaly[idx], self.epoch[idx])
+
+    def _mean_anomaly_at(self, t):
+        m = self.mean_anomaly + self.n * (np.asarray(t, dtype=np.float64) - self.epoch)
+        return np.where(self.elliptic, np.mod(m + math.pi, 2 * math.pi) - math.pi, m)
+
+    def true_anomaly_at(self, t):
+        m = self._mean_anomaly_at(t)
+        e = np.broadcast_to(self.e, m.shape)
+        ell = e < 1.0
+        nu = np.empty(m.shape)
+        if ell.any(): nu[ell] = _solve_elliptic(m[ell], e[ell])
+        if not ell.all(): nu[~ell] = _solve_hyperbolic(m[~ell], e[~ell])
+        return nu
+
+    def time_of_true_anomaly(self, nu, after):
+        """after 之后（含）首次到达真近点角 nu 的时刻；双曲线已飞过则为 inf"""
+        e, m_now = self.e, self._mean_anomaly_at(after)
+        with np.errstate(all="ignore"):
+            ecc = np.arctan2(np.sqrt(np.maximum(1 - e * e, 0)) * np.sin(nu), e + np.cos(nu))
+            dm_ell = np.mod((ecc - e * np.sin(ecc)) - m_now, 2 * math.pi)
+            hyp = 2.0 * np.arctanh(np.sqrt(np.maximum((e - 1) / (e + 1), 0)) * np.tan(nu / 2))
+            dm_hyp = (e * np.sinh(hyp) - hyp) - m_now
+            dm = np.where(self.elliptic, dm_ell, np.where(dm_hyp >= 0, dm_hyp, np.inf))
+            return after + dm / self.n
+
+    def state_at(self, t):
+        """t 时刻相对 body 的 (x, y, vx, vy)"""
+        nu = self.true_anomaly_at(t)
+        r = self.p / (1 + self.e * np.cos(nu))
+        theta = self.arg_pe + self.sense * nu
+        cos_t, sin_t = np.cos(theta), np.sin(theta)
+        k = np.sqrt(self.mu / self.p)
+        v_r, v_t = k * self.e * np.sin(nu), self.sense * k * (1 + self.e * np.cos(nu))
+        return r * cos_t, r * sin_t, v_r * cos_t - v_t * sin_t, v_r * sin_t + v_t * cos_t
+
+    def soi_exit_time(self, after):
+        """飞出 body 引力影响球的时刻（解析求解 r = soi_radius），不会飞出时为 inf"""
+        r_soi = self.body.soi_radius
+        if r_soi == math.inf: return np.full(self.e.shape, np.inf)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            nu = np.arccos(np.clip((self.p / r_soi - 1) / self.e, -1.0, 1.0))
+        return np.where(self.apoapsis <= r_soi, np.inf, self.time_of_true_anomaly(nu, after))
+
+    def soi_entry_time(self, t0, t1, max_samples=512, samples_per_period=32):
+        """[t0, t1] 内首次进入某个子天体 SOI 的时刻（没有则为 inf）：按最短周期采样，再逐艘二分细化"""
+        result = np.full(self.e.shape, np.inf)
+        children = [c for c in self.body.children if c.soi_radius < math.inf]
+        if not children or t1 <= t0: return result
+        orbit, result = (self, result) if self.e.ndim else (self.subset(np.newaxis), result.reshape(1))
+        # 径向范围 [近拱点, 远拱点] 碰不到任何子天体 SOI 环带的轨道不可能进入，免去采样
+        reach = np.zeros(orbit.e.shape, dtype=bool)
+        for c in children:
+            reach |= (orbit.periapsis < c.orbit_radius + c.soi_radius) & (orbit.apoapsis > c.orbit_radius - c.soi_radius)
+        if not reach.any(): return result.reshape(self.e.shape)
+        full, orbit, result = result, orbit.subset(reach), result[reach]
+        min_period = min([float(np.min(orbit.period))] + [2 * math.pi / c.omega for c in children])
+        n = int(min(max_samples, max(1, math.ceil((t1 - t0) * samples_per_period / min_period))))
+        ts = np.linspace(t0, t1, n + 1)
+
+        def inside(o, t):
+            sx, sy, _, _ = o.state_at(t)
+            hit = np.zeros(np.shape(sx), dtype=bool)
+            for c in children:
+                cx, cy = c.relative_position(t)
+                hit |= (sx - cx) ** 2 + (sy - cy) ** 2 < c.soi_radius ** 2
+            return hit
+
+        hits = inside(orbit, ts[:, None])
+        k = np.argmax(hits, axis=0)
+        entered = hits.any(axis=0)
+        result[entered & (k == 0)] = t0
+        refine = entered & (k > 0)
+        if refine.any():
+            sub = orbit.subset(refine)
+            lo, hi = ts[k[refine] - 1], ts[k[refine]]
+            for _ in range(64):
+                if np.max(hi - lo) <= 1e-3: break
+                mid = 0.5 * (lo + hi)
+                now = inside(sub, mid)
+                hi, lo = np.where(now, mid, hi), np.where(now, lo, mid)
+            result[refine] = hi
+        full[reach] = result
+        return full.reshape(self.e.shape)
+
+    def polyline(self, samples, nu_now=0.0, r_min=0.0, r_max=math.inf):
+        """单条轨道上 r_min <= r <= r_max 的一段弧（相对 body 的 xs, ys）。
+        弧段被天体表面截成两段时取飞船当前所在的那段；完整椭圆首尾闭合"""
+        e, p = float(self.e), float(self.p)
+
+        def nu_at(r):
+            return math.acos(max(-1.0, min(1.0, (p / r - 1) / e))) if e > 0 else math.pi
+
+        if self.elliptic and r_max >= self.apoapsis:
+            hi = math.pi
+        else:
+            if not self.elliptic and r_max == math.inf: r_max = 10 * self.periapsis
+            hi = nu_at(r_max)
+        if self.periapsis >= r_min:
+            arcs = [(-hi, hi)]
+        else:
+            lo = nu_at(r_min)
+            arcs = [(lo, 2 * math.pi - lo)] if hi == math.pi else [(-hi, -lo), (lo, hi)]
+        nu_now = (nu_now + math.pi) % (2 * math.pi) - math.pi
+        arc = next((a for a in arcs if a[0] <= nu_now <= a[1] or a[0] <= nu_now + 2 * math.pi <= a[1]), arcs[0])
+        nu = np.linspace(arc[0], arc[1], samples)
+        r = p / (1 + e * np.cos(nu))
+        theta = float(self.arg_pe) + float(self.sense) * nu
+        return r * np.cos(theta), r * np.sin(theta)
+
+
+
+def _solve_elliptic(m, e):
+    """开普勒方程 E - e sinE = M 的牛顿迭代，返回真近点角"""
+    ecc = np.where(e < 0.8, m + e * np.sin(m), np.where(m < 0, -math.pi, math.pi))
+    for _ in range(50):
+        d = (ecc - e * np.sin(ecc) - m) / (1 - e * np.cos(ecc))
+        ecc = ecc - d
+        if np.max(np.abs(d), initial=0.0) < 1e-13: break
+    return 2 * np.arctan2(np.sqrt(1 + e) * np.sin(ecc / 2), np.sqrt(1 - e) * np.cos(ecc / 2))
+
+
+def _solve_hyperbolic(m, e):
+    """双曲开普勒方程 e sinhH - H = M 的牛顿迭代，返回真近点角"""
+    hyp = np.arcsinh(m / e)
+    for _ in range(50):
+        d = (e * np.sinh(hyp) - hyp - m) / (e * np.cosh(hyp) - 1)
+        hyp = hyp - d
+        if np.max(np.abs(d), initial=0.0) < 1e-13: break
+    return 2 * np.arctan(np.sqrt((e + 1) / (e - 1)) * np.tanh(hyp / 2))
+
+
+# --- 轨迹预测：闭式圆锥曲线折线，按天体相对坐标缓存 ---
+class TrajectoryPredictor:
+    """只在 SOI 天体或轨道根数变化时重算折线（推力、锁定轨道、读档等改动飞船状态的操作都会改变根数，
+    在轨滑行时根数不变）；平移缩放只需重新变换缓存的点"""
+
+    def __init__(self, samples=200):
+        self.samples = samples
+        self.body, self.key, self.points = None, None, None
+
+    def invalidate(self):
+        self.body = None
+
+    def update(self, ship, bodies, current_time):
+        """返回 (body, (xs, ys))，点相对 body；退化轨道时点为 None"""
+        orbit = ship.orbit
+        body = orbit.body if orbit else get_soi_body(ship.x, ship.y, bodies)
+        if orbit is None and body is not None:
+            bvx, bvy = body.get_velocity()
+            orbit = KeplerOrbit.from_state(body, ship.x - body.x, ship.y - body.y, ship.vx - bvx, ship.vy - bvy,
+                                           current_time)
+        key = None if orbit is None else (float(orbit.a), float(orbit.e), float(orbit.arg_pe), float(orbit.sense))
+        if body is self.body and key == self.key: return self.body, self.points
+
+        self.body, self.key, self.points = body, key, None
+        if orbit is not None:
+            r_max = body.soi_radius if body.soi_radius < math.inf else \
+                (math.inf if orbit.elliptic else 10 * math.hypot(ship.x - body.x, ship.y - body.y))
+            self.points = orbit.polyline(self.samples, float(orbit.true_anomaly_at(current_time)),
+                                         body.body_radius, r_max)
+        return self.body, self.points
+
+
+# --- 长程轨迹预报：对所在星系全部天体做 n 体积分，结果缓存在缓冲区里逐帧续算 ---
+# t/rx/ry 为各样本的时刻与相对该时刻 SOI 天体的位置，body 为样本所在 SOI 天体在 bodies 中的下标；
+# events 为按时间排列的 ForecastEvent
+Forecast = namedtuple("Forecast", "t rx ry body bodies events")
+# kind："enter" / "exit" 进出 SOI，"periapsis" 进入某 SOI 后的首个近拱点，"impact" 撞上天体（预报到此为止），
+# "closest" 与自动驾驶目标的最近距离；(rx, ry) 为事件点相对 body 的位置
+ForecastEvent = namedtuple("ForecastEvent", "t kind body distance rx ry")
+
+
+class Forecaster:
+    """飞船未来轨迹的长程预报：对飞船所在星系的全部天体（连同各恒星）按随时间变化的星历做 RK4 n 体积分，
+    步长取最近天体动力学时间的 eta 倍。每次 update 只在 budget 墙钟秒内续算一批步，
+    飞船沿预报滑行期间缓冲区一直有效，只丢弃已经过去的样本；推力（或偏离超过 tol）才使当前时刻之后的预报作废"""
+
+    def __init__(self, capacity=FORECAST_SAMPLES, eta=FORECAST_ETA, tol=FORECAST_TOL, budget=FORECAST_BUDGET):
+        self.capacity, self.eta, self.tol, self.budget = capacity, eta, tol, budget
+        self.table, self.star, self.bodies, self.massive = None, None, [], np.zeros(0, dtype=bool)
+        size = 2 * capacity  # 写到末尾时把有效段挪回开头
+        self.t, self.x, self.y, self.vx, self.vy, self.rx, self.ry = (np.zeros(size) for _ in range(7))
+        self.body = np.zeros(size, dtype=np.int64)
+        self.lo = self.hi = 0
+        self.events, self.done, self.target, self._forecast = [], False, None, None
+
+    def invalidate(self):
+        self.lo = self.hi = 0
+
+    @property
+    def pending(self):
+        """缓冲区还没填满，也没有撞上天体"""
+        return not self.done and self.hi - self.lo < self.capacity
+
+    def update(self, sim, i=None, budget=None):
+        """把第 i 艘飞船（缺省为玩家）的预报推进到当前时刻并续算一批；返回 Forecast（发布后不再改动）"""
+        i = sim.player if i is None else i
+        fleet, t = sim.fleet, sim.time_elapsed
+        state = float(fleet.x[i]), float(fleet.y[i]), float(fleet.vx[i]), float(fleet.vy[i])
+        target = fleet.target[i]
+        target = sim.all_bodies[target] if target >= 0 else None
+        if sim.all_bodies is not self.table or self.star is not self._star_of(sim.all_bodies, state[0], state[1], t):
+            self._select(sim.all_bodies, state[0], state[1], t)
+        if fleet.thrust_percent[i] > 0 or not self._on_track(t, state): self._seed(t, state)
+        if target is not self.target: self.target, self._forecast = target, None
+        deadline = time.perf_counter() + (self.budget if budget is None else budget)
+        if self.pending: self._extend(deadline)
+        if self._forecast is None: self._forecast = self._publish()
+        return self._forecast
+
+    # --- 天体集合：飞船所在星系的全部天体 + 各恒星，子表自带星历 ---
+    @staticmethod
+    def _star_of(table, x, y, t):
+        if not len(table): return None
+        i = int(table.soi_index(x, y, t))
+        while table.ephemeris.parent[i] >= 0: i = int(table.ephemeris.parent[i])
+        return table[i]
+
+    def _select(self, table, x, y, t):
+        self.table, self.star = table, self._star_of(table, x, y, t)
+        keep = []
+        for b in table:
+            root = b
+            while root.parent is not None: root = root.parent
+            if b.parent is None or root is self.star: keep.append(b)
+        self.bodies, self.eph = keep, Ephemeris(keep)
+        self.gm = np.array([G * b.mass for b in keep], dtype=np.float64)
+        self.r2 = np.array([b.body_radius for b in keep], dtype=np.float64) ** 2
+        soi = np.array([b.soi_radius for b in keep], dtype=np.float64)
+        self.soi2 = np.where(np.isfinite(soi), soi * soi, np.inf)
+        self.is_root = np.array([b.parent is None for b in keep], dtype=bool)
+        self.massive = self.gm > 0
+        self.invalidate()
+
+    # --- 缓冲区 ---
+    def _on_track(self, t, state):
+        """当前状态是否仍落在预报上（按样本位置、速度做三次 Hermite 插值比较）；顺带丢弃已经过去的样本"""
+        lo, hi = self.lo, self.hi
+        if hi - lo < 2 or not self.t[lo] <= t <= self.t[hi - 1]: return False
+        k = lo + int(np.searchsorted(self.t[lo:hi], t, side="right")) - 1
+        k = min(k, hi - 2)
+        if k > lo: self.lo, self._forecast, self.events = k, None, [e for e in self.events if e.t >= self.t[k]]
+        h = self.t[k + 1] - self.t[k]
+        s = (t - self.t[k]) / h if h > 0 else 0.0
+        h00, h10, h01, h11 = 2 * s ** 3 - 3 * s * s + 1, s ** 3 - 2 * s * s + s, -2 * s ** 3 + 3 * s * s, s ** 3 - s * s
+        x = h00 * self.x[k] + h10 * h * self.vx[k] + h01 * self.x[k + 1] + h11 * h * self.vx[k + 1]
+        y = h00 * self.y[k] + h10 * h * self.vy[k] + h01 * self.y[k + 1] + h11 * h * self.vy[k + 1]
+        return math.hypot(x - state[0], y - state[1]) <= self.tol * math.hypot(self.rx[k], self.ry[k])
+
+    def _seed(self, t, state):
+        self.lo = self.hi = 0
+        self.events, self.done, self._forecast, self._visit = [], False, None, None
+        if not self.massive.any(): self.done = True; return
+        bx, by, _, _ = self.eph._compute(np.array([t]))
+        self._k = self._accel(bx[0], by[0], state[0], state[1])
+        self._append(t, *state, bx[0], by[0], self._k[2])
+
+    def _append(self, t, x, y, vx, vy, bx, by, d2):
+        """写入一个样本，确定其 SOI 天体并检查进出 SOI、近拱点与撞击；返回是否撞击"""
+        if self.hi == len(self.t):
+            n = self.hi - self.lo
+            for a in (self.t, self.x, self.y, self.vx, self.vy, self.rx, self.ry, self.body):
+                a[:n] = a[self.lo:self.hi]
+            self.lo, self.hi = 0, n
+        inside = d2 < self.soi2
+        if inside.any(): b = int(np.argmin(np.where(inside, self.soi2, np.inf)))
+        else: b = int(np.argmax(np.where(self.is_root, self.gm / d2, -1.0)))
+        k = self.hi
+        self.t[k], self.x[k], self.y[k], self.vx[k], self.vy[k], self.body[k] = t, x, y, vx, vy, b
+        self.rx[k], self.ry[k] = x - bx[b], y - by[b]
+        self.hi += 1
+        self._forecast = None
+        if k == self.lo: return False
+
+        p = self.body[k - 1]
+        if b != p:
+            # SOI 边界处按到边界的距离线性插值出穿越时刻
+            deeper = self.soi2[b] < self.soi2[p]
+            c = b if deeper else p
+            r_soi = math.sqrt(self.soi2[c])
+            d0, d1 = self._distance(k - 1, c), self._distance(k, c)
+            w = min(max((d0 - r_soi) / (d0 - d1), 0.0), 1.0) if d0 != d1 else 1.0
+            ex, ey = (self._relative(k - 1, c)[0] * (1 - w) + self._relative(k, c)[0] * w,
+                      self._relative(k - 1, c)[1] * (1 - w) + self._relative(k, c)[1] * w)
+            self.events.append(ForecastEvent(self.t[k - 1] + w * (t - self.t[k - 1]), "enter" if deeper else "exit",
+                                             self.bodies[c], r_soi, ex, ey))
+            self._visit = [b, math.inf, False] if deeper else None
+        elif self._visit is not None and not self._visit[2]:
+            r = math.hypot(self.rx[k], self.ry[k])
+            if r > self._visit[1] and k - 1 > self.lo:
+                self._visit[2] = True
+                self.events.append(ForecastEvent(self.t[k - 1], "periapsis", self.bodies[b], self._visit[1],
+                                                 self.rx[k - 1], self.ry[k - 1]))
+            self._visit[1] = min(self._visit[1], r)
+        hit = d2 <= self.r2
+        if hit.any():
+            c = int(np.argmax(hit))
+            self.events.append(ForecastEvent(t, "impact", self.bodies[c], math.sqrt(self.r2[c]),
+                                             x - bx[c], y - by[c]))
+            self.done = True
+        return self.done
+
+    def _distance(self, k, c):
+        return math.hypot(*self._relative(k, c))
+
+    def _relative(self, k, c):
+        """样本 k 相对天体 c 的位置"""
+        x, y, _, _ = self.eph.relative_state(c, self.t[k])
+        return float(self.x[k] - x), float(self.y[k] - y)
+
+    def _accel(self, bx, by, x, y):
+        dx, dy = bx - x, by - y
+        d2 = dx * dx + dy * dy
+        s = np.maximum(d2, self.r2)
+        f = self.gm / (s * np.sqrt(s))
+        return float(f @ dx), float(f @ dy), d2
+
+    def _extend(self, deadline):
+        """RK4 逐步续算，直到缓冲区满、撞击或用完本次墙钟预算；相邻步共用端点的星历与加速度"""
+        k = self.hi - 1
+        t, x, y, vx, vy = self.t[k], self.x[k], self.y[k], self.vx[k], self.vy[k]
+        ax1, ay1, d2 = self._k
+        steps = 0
+        while self.hi - self.lo < self.capacity:
+            if steps & 15 == 15 and time.perf_counter() > deadline: break
+            steps += 1
+            s = d2[self.massive]
+            h = self.eta * math.sqrt(float(np.min(s * np.sqrt(s) / self.gm[self.massive])))
+            bx, by, _, _ = self.eph._compute(np.array([t + 0.5 * h, t + h]))
+            ax2, ay2, _ = self._accel(bx[0], by[0], x + 0.5 * h * vx, y + 0.5 * h * vy)
+            vx2, vy2 = vx + 0.5 * h * ax1, vy + 0.5 * h * ay1
+            ax3, ay3, _ = self._accel(bx[0], by[0], x + 0.5 * h * vx2, y + 0.5 * h * vy2)
+            vx3, vy3 = vx + 0.5 * h * ax2, vy + 0.5 * h * ay2
+            ax4, ay4, _ = self._accel(bx[1], by[1], x + h * vx3, y + h * vy3)
+            vx4, vy4 = vx + h * ax3, vy + h * ay3
+            x, y = x + h / 6 * (vx + 2 * vx2 + 2 * vx3 + vx4), y + h / 6 * (vy + 2 * vy2 + 2 * vy3 + vy4)
+            vx, vy = vx + h / 6 * (ax1 + 2 * ax2 + 2 * ax3 + ax4), vy + h / 6 * (ay1 + 2 * ay2 + 2 * ay3 + ay4)
+            t += h
+            ax1, ay1, d2 = self._accel(bx[1], by[1], x, y)
+            if self._append(t, x, y, vx, vy, bx[1], by[1], d2): break
+        self._k = ax1, ay1, d2
+        PROFILER.count("forecast_steps", steps)
+
+    def _publish(self):
+        lo, hi = self.lo, self.hi
+        events = list(self.events)
+        if self.target is not None and hi - lo > 1:
+            c = next((j for j, b in enumerate(self.bodies) if b is self.target), None)
+            if c is not None:
+                ts = self.t[lo:hi]
+                tx, ty, _, _ = self.eph.relative_state(c, ts)
+                dx, dy = self.x[lo:hi] - tx, self.y[lo:hi] - ty
+                j = int(np.argmin(dx * dx + dy * dy))
+                events.append(ForecastEvent(float(ts[j]), "closest", self.target, float(math.hypot(dx[j], dy[j])),
+                                            float(dx[j]), float(dy[j])))
+                events.sort(key=lambda e: e.t)
+        arrays = [a[lo:hi].copy() for a in (self.t, self.rx, self.ry, self.body)]
+        for a in arrays: a.flags.writeable = False
+        return Forecast(*arrays, self.bodies, tuple(events))
+
+
+# --- 碰撞与接近：每帧把飞船的运动与天体求交 ---
+# kind："impact" 撞上天体表面（飞船随即停在撞击点，ap_state 为 LANDED，再点火即起飞），"atmosphere" 进入大气层，
+# "approach" 非束缚飞掠中距天体中心不到 CLOSE_APPROACH 倍半径（在最近点记一次）；
+# ship 为飞船下标，distance 为事件点到天体中心的距离，speed 为相对天体的速率
+Contact = namedtuple("Contact", "t kind ship body distance speed")
+CONTACT_KINDS = ("impact", "atmosphere", "approach")
+
+
+class Collider:
+    """飞船本帧的运动全部完成后检测撞击、大气层进入与近距离接近（由 Simulation.step 调用）。
+    数值积分的飞船按积分器每个子步的位移线段扫掠。一个子步里天体也在移动，
+    所以扫掠在各天体的坐标系里做（子步两端的天体位置取自星历，子步内按匀速），候选天体由 SpatialHash 给出；
+    on-rails 滑行的飞船只会碰到所绕的天体，直接解析求出本帧内到达各半径的时刻，高倍速下也不会穿过去"""
+
+    def __init__(self):
+        self.hash = SpatialHash()
+
+    def check(self, fleet, t0, t1, railed, traces):
+        """railed：本帧滑行结束仍在轨的飞船；traces：本帧数值积分的 Fleet.traces。
+        撞击的飞船就地着陆；返回按时间排列的 Contact 列表"""
+        found = [f for f in (self._swept(fleet, t0, t1, traces), self._railed(fleet, t0, t1, railed)) if f is not None]
+        if not found: return []
+        t, kind, ship, body, distance, speed, rx, ry = (np.concatenate(c) for c in zip(*found))
+        # 每艘飞船只算第一次撞击，之后的事件作废
+        imp = np.flatnonzero(kind == 0)
+        imp = imp[np.argsort(t[imp], kind="stable")]
+        imp = imp[np.unique(ship[imp], return_index=True)[1]]
+        cutoff = np.full(len(fleet), np.inf)
+        cutoff[ship[imp]] = t[imp]
+        keep = t < cutoff[ship]
+        keep[imp] = True
+        if len(imp):
+            b = body[imp]
+            scale = fleet.bodies.body_radius[b] / np.maximum(np.hypot(rx[imp], ry[imp]), 1e-9)  # 落点投影到表面
+            fleet.touch_down(ship[imp], b, rx[imp] * scale, ry[imp] * scale)
+        order = np.flatnonzero(keep)[np.argsort(t[keep], kind="stable")]
+        PROFILER.count("contacts", len(order))
+        return [Contact(float(t[k]), CONTACT_KINDS[kind[k]], int(ship[k]), fleet.bodies[body[k]], float(distance[k]),
+                        float(speed[k])) for k in order.tolist()]
+
+    def _swept(self, fleet, t0, t1, traces):
+        """数值积分的飞船：各子步线段 × 哈希给出的候选天体"""
+        segments = []
+        for idx, start, state, trace in traces or ():
+            if not trace: continue
+            m, k = len(idx), len(trace)
+            t = start + np.array([0.0] + [p[0] for p in trace])
+            x, y, vx, vy = (np.reshape([state[j]] + [p[j + 1] for p in trace], (k + 1, m)) for j in range(4))
+            segments.append((np.tile(idx, k), np.repeat(t[:-1], m), np.repeat(t[1:], m), x[:-1].ravel(),
+                             y[:-1].ravel(), x[1:].ravel(), y[1:].ravel(), vx[:-1].ravel(), vy[:-1].ravel()))
+        if not segments: return None
+        ship, ta, tb, x0, y0, x1, y1, vx, vy = (np.concatenate(c) for c in zip(*segments))
+        bodies = fleet.bodies
+        # 各子步端点时刻的天体状态（按星历精确取，帧很长时天体沿曲线走了很远）
+        times, at = np.unique(np.concatenate([ta, tb]), return_inverse=True)
+        bx, by, bvx, bvy = bodies.ephemeris.state_at(times)
+        ia, ib = at[:len(ta)], at[len(ta):]
+        # 宽相位按子步起点分组：哈希放该时刻的天体，再扩出子步内天体的位移
+        segs, cands = [], []
+        for g in np.unique(ia).tolist():
+            sel = np.flatnonzero(ia == g)
+            ends = np.unique(ib[sel])
+            pad = float(np.max(np.hypot(bx[ends] - bx[g], by[ends] - by[g]), initial=0.0))
+            self.hash.update(bx[g], by[g], bodies.body_radius * CLOSE_APPROACH)
+            seg, b = self.hash.query(x0[sel], y0[sel], x1[sel], y1[sel], pad)
+            segs.append(sel[seg])
+            cands.append(b)
+        seg, b = np.concatenate(segs), np.concatenate(cands)
+        radius = bodies.body_radius[b]
+        seg, b, radius = seg[radius > 0], b[radius > 0], radius[radius > 0]
+        if not len(seg): return None
+        ship, ta, tb, ia, ib = ship[seg], ta[seg], tb[seg], ia[seg], ib[seg]
+        # 换到天体坐标系：线段两端各减去天体在该时刻的位置（子步内天体视为匀速）
+        x0, y0 = x0[seg] - bx[ia, b], y0[seg] - by[ia, b]
+        x1, y1 = x1[seg] - bx[ib, b], y1[seg] - by[ib, b]
+        speed = np.hypot(vx[seg] - bvx[ia, b], vy[seg] - bvy[ia, b])
+        s_cl, d_cl, interior = closest(x0, y0, x1, y1, 0.0, 0.0)
+        unbound = 0.5 * speed * speed >= bodies.gm[b] / np.maximum(np.hypot(x0, y0), radius)
+        s_cl = np.where(interior & unbound & (d_cl < radius * CLOSE_APPROACH), s_cl, np.nan)
+        found = []
+        for code, s in enumerate((sweep(x0, y0, x1, y1, 0.0, 0.0, radius, inside=True),
+                                  sweep(x0, y0, x1, y1, 0.0, 0.0, radius * (1 + ATMOSPHERE_HEIGHT)), s_cl)):
+            k = np.flatnonzero(np.isfinite(s))
+            sk = s[k]
+            rx, ry = x0[k] + sk * (x1[k] - x0[k]), y0[k] + sk * (y1[k] - y0[k])
+            found.append((ta[k] + sk * (tb[k] - ta[k]), np.full(len(k), code), ship[k], b[k], np.hypot(rx, ry),
+                          speed[k], rx, ry))
+        return tuple(np.concatenate(c) for c in zip(*found))
+
+    def _railed(self, fleet, t0, t1, railed):
+        """在轨滑行的飞船：按所绕天体分组，解析求本帧内向内穿过表面/大气层半径、飞过近拱点的时刻"""
+        # 近拱点高于接近半径的轨道（绝大多数）直接跳过，不必构造轨道
+        e, b = fleet.el_e[railed], fleet.rails_body[railed]
+        pe = fleet.el_a[railed] * np.abs(1 - e * e) / (1 + e)
+        railed = railed[pe < fleet.bodies.body_radius[b] * CLOSE_APPROACH]
+        found = []
+        for b in np.unique(fleet.rails_body[railed]).tolist():
+            radius = float(fleet.bodies.body_radius[b])
+            if radius <= 0: continue
+            g = railed[fleet.rails_body[railed] == b]
+            orbit = fleet._orbit(b, g)
+            ts = np.maximum(t0, orbit.epoch)
+            rx, ry, _, _ = orbit.state_at(ts)
+            r, pe = np.hypot(rx, ry), orbit.periapsis
+
+            def inbound(level):
+                with np.errstate(all="ignore"):
+                    nu = np.arccos(np.clip((orbit.p / level - 1) / orbit.e, -1.0, 1.0))
+                t = orbit.time_of_true_anomaly(-nu, ts)
+                return np.where((pe < level) & (r > level) & (t <= t1), t, np.inf)
+
+            t_pe = orbit.time_of_true_anomaly(0.0, ts)
+            times = (np.where(r < radius, ts, inbound(radius)), inbound(radius * (1 + ATMOSPHERE_HEIGHT)),
+                     np.where(~orbit.elliptic & (pe >= radius) & (pe < radius * CLOSE_APPROACH) & (t_pe <= t1),
+                              t_pe, np.inf))
+            for code, t in enumerate(times):
+                k = np.flatnonzero(np.isfinite(t))
+                if not len(k): continue
+                px, py, pvx, pvy = orbit.subset(k).state_at(t[k])
+                found.append((t[k], np.full(len(k), code), g[k], np.full(len(k), b), np.hypot(px, py),
+                              np.hypot(pvx, pvy), px, py))
+        if not found: return None
+        return tuple(np.concatenate(c) for c in zip(*found))
+
+
+# --- 积分器：integrate(x, y, vx, vy, accel, dt, bodies, t0) -> (x, y, vx, vy, 步数, 引力求值次数) ---
+# accel(t, x, y) 返回总加速度（引力 + 推力），t 为帧内相对时间；状态可以是标量或整批飞船的数组。
+# t0 为帧起点的绝对时刻（天体不随时间移动时为 None），自适应积分器据此取步长参考天体的位置。
+# trace 不为 None 时，每个子步结束把 (t, x, y, vx, vy) 追加进去（碰撞检测按子步扫掠）
+class EulerIntegrator:
+    """半隐式欧拉，固定子步（旧版行为）"""
+    name = "euler"
+
+    def __init__(self, max_step=3600.0):
+        self.max_step, self.trace = max_step, None
+
+    def integrate(self, x, y, vx, vy, accel, dt, bodies, t0=None):
+        steps = max(1, int(dt / self.max_step))
+        h = dt / steps
+        for i in range(steps):
+            ax, ay = accel(i * h, x, y)
+            vx, vy = vx + ax * h, vy + ay * h
+            x, y = x + vx * h, y + vy * h
+            if self.trace is not None: self.trace.append(((i + 1) * h, x, y, vx, vy))
+        return x, y, vx, vy, steps, steps
+
+
+class LeapfrogIntegrator:
+    """速度 Verlet (KDK)，辛积分器，长期能量无漂移"""
+    name = "leapfrog"
+
+    def __init__(self, max_step=3600.0):
+        self.max_step, self.trace = max_step, None
+
+    def integrate(self, x, y, vx, vy, accel, dt, bodies, t0=None):
+        steps = max(1, int(math.ceil(dt / self.max_step)))
+        h = dt / steps
+        ax, ay = accel(0.0, x, y)
+        for i in range(steps):
+            vx, vy = vx + 0.5 * h * ax, vy + 0.5 * h * ay
+            x, y = x + h * vx, y + h * vy
+            ax, ay = accel((i + 1) * h, x, y)
+            vx, vy = vx + 0.5 * h * ax, vy + 0.5 * h * ay
+            if self.trace is not None: self.trace.append(((i + 1) * h, x, y, vx, vy))
+        return x, y, vx, vy, steps, steps + 1
+
+
+class AdaptiveIntegrator:
+    """Dormand-Prince RK45 自适应步长：误差按主导天体的距离/轨道速度归一化，
+    并把步长限制在主导天体动力学时间的 max_orbit_frac 以内，因此引力圈内小步、星际空间大步"""
+    name = "rk45"
+
+    C = (0.0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1.0, 1.0)
+    A = ((),
+         (1 / 5,),
+         (3 / 40, 9 / 40),
+         (44 / 45, -56 / 15, 32 / 9),
+         (19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729),
+         (9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656),
+         (35 / 384, 0.0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84))
+    E = (71 / 57600, 0.0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40)
+
+    def __init__(self, tol=1e-7, max_orbit_frac=0.2, min_step=1e-3):
+        self.tol, self.max_orbit_frac, self.min_step = tol, max_orbit_frac, min_step
+        self.h, self.trace = None, None  # 跨帧保留上一次建议步长
+
+    def _deriv(self, accel, t, s):
+        ax, ay = accel(t, s[0], s[1])
+        return np.array([s[2], s[3], ax, ay])
+
+    def integrate(self, x, y, vx, vy, accel, dt, bodies, t0=None):
+        s = np.array([x, y, vx, vy], dtype=np.float64)
+        t, steps, evals = 0.0, 0, 1
+        k1 = self._deriv(accel, 0.0, s)
+        h = self.h or dt
+        while dt - t > 1e-9 * dt:
+            r_scale, t_dyn = get_local_scale(s[0], s[1], bodies, None if t0 is None else t0 + t)
+            h = max(min(h, dt - t, self.max_orbit_frac * float(np.min(t_dyn))), min(self.min_step, dt - t))
+            ks = [k1]
+            for i in range(1, 7):
+                si = s + h * sum(a * k for a, k in zip(self.A[i], ks) if a)
+                ks.append(self._deriv(accel, t + self.C[i] * h, si))
+            evals += 6
+            err = h * sum(e * k for e, k in zip(self.E, ks) if e)
+            # 整批飞船共用一个步长，取误差最大的那艘
+            with np.errstate(divide="ignore", invalid="ignore"):
+                v_scale = np.where(np.isfinite(t_dyn), r_scale / t_dyn, np.maximum(np.hypot(s[2], s[3]), 1e-9))
+            err_norm = float(np.max(np.maximum(abs(err[0]), abs(err[1])) / (self.tol * r_scale) +
+                                    np.maximum(abs(err[2]), abs(err[3])) / (self.tol * v_scale)))
+            if err_norm <= 1.0 or h <= self.min_step:
+                t, s, k1 = t + h, si, ks[6]  # FSAL：第 7 级即下一步的第 1 级
+                steps += 1
+                if self.trace is not None: self.trace.append((t, s[0], s[1], s[2], s[3]))
+            h *= min(5.0, max(0.2, 0.9 * (err_norm + 1e-30) ** -0.2))
+        self.h = h
+        return s[0], s[1], s[2], s[3], steps, evals
+
+
+INTEGRATORS = {cls.name: cls for cls in (EulerIntegrator, LeapfrogIntegrator, AdaptiveIntegrator)}
+
+
+class Simulation:
+    """一局游戏的动态世界：天体、编队与时间，按帧推进（与窗口无关，供 main 与 headless 共用）"""
+
+    def __init__(self, stars, all_bodies, fleet, player=0, time_elapsed=0.0, integrator="rk45", galaxy=None):
+        self.stars, self.all_bodies, self.fleet = stars, all_bodies, fleet
+        self.player, self.ship = player, fleet.ships[player]
+        self.galaxy, self.focus = galaxy, []  # focus：镜头等额外的激活点 (x, y)
+        if galaxy: galaxy.listeners.append(self._rebind)
+        self.time_elapsed, self.time_scale = time_elapsed, 1.0
+        self.set_integrator(integrator)
+        self.last_steps, self.last_evals = 0, 0
+        self.collider, self.contacts = Collider(), []  # contacts：最近一帧的 Contact 列表
+        self.all_bodies.set_time(time_elapsed)
+
+    def set_integrator(self, name):
+        self.integrator = INTEGRATORS[name]()
+
+    def _rebind(self, old, new):
+        self.all_bodies = new
+        self.fleet.rebind(new)
+
+    def plan_transfer(self, target, i=None, **kwargs):
+        """为第 i 艘飞船（缺省为玩家）规划飞往 target 的转移并交给自动驾驶执行；无法规划时返回 None"""
+        i = self.player if i is None else i
+        plan = self.fleet.plan_transfer(i, self.fleet._body_index(target), self.time_elapsed, **kwargs)
+        if plan is not None: self.fleet.follow(i, plan)
+        return plan
+
+    def page(self):
+        """按飞船、自动驾驶目标与 focus 物化/淘汰星系"""
+        fleet, aimed = self.fleet, self.fleet.target[self.fleet.target >= 0]
+        xs = np.concatenate([fleet.x, self.all_bodies.x[aimed], [p[0] for p in self.focus]])
+        ys = np.concatenate([fleet.y, self.all_bodies.y[aimed], [p[1] for p in self.focus]])
+        self.galaxy.update(xs, ys, self.time_elapsed)
+
+    def step(self, dt, left=False, right=False, up=False):
+        """推进一帧；返回本帧数值积分步数，引力求值次数记在 last_evals。
+        无推力的飞船走 on-rails 解析滑行，每帧 O(1)；只要有飞船在推进，本帧最多推进 MAX_NUMERIC_DT；
+        有飞船按转移计划飞行时再按 Fleet.plan_horizon 缩短本帧。着陆的飞船随天体平移，推力朝外才起飞；
+        全部飞船推进完后做碰撞与接近检测，结果记在 contacts"""
+        if self.galaxy:
+            with PROFILER.scope("sim.page"): self.page()
+        fleet, t0 = self.fleet, self.time_elapsed
+        dt = min(dt, fleet.plan_horizon(t0))
+        with PROFILER.scope("sim.autopilot"):
+            thrust_x, thrust_y = fleet.fly(min(dt, MAX_NUMERIC_DT), self.time_scale, self.player, left, right, up, t0)
+        burning = (thrust_x != 0) | (thrust_y != 0)
+        held = burning & (fleet.landed >= 0)  # 着陆的飞船朝地面点火推不动，仍停在原地
+        held[held] = thrust_x[held] * fleet.land_x[held] + thrust_y[held] * fleet.land_y[held] <= 0
+        thrust_x[held] = thrust_y[held] = 0.0
+        burning &= ~held
+        fleet.landed[burning] = -1
+        landed = fleet.landed >= 0
+        fleet.ap_code[landed], fleet.thrust_percent[landed] = AP_CODES["LANDED"], 0.0
+        if burning.any(): dt = min(dt, MAX_NUMERIC_DT)
+        self.time_elapsed = t0 + dt
+        with PROFILER.scope("sim.set_time"): self.all_bodies.set_time(self.time_elapsed)
+        fleet.traces, coasting = [], np.flatnonzero(~burning & ~landed)
+        with PROFILER.scope("sim.coast"):
+            coast_steps, coast_evals = fleet.coast(coasting, t0, self.time_elapsed, self.integrator)
+        with PROFILER.scope("sim.integrate"):
+            steps, evals = fleet.integrate(np.flatnonzero(burning), dt, thrust_x, thrust_y, self.integrator, t0)
+        traces, fleet.traces = fleet.traces, None
+        fleet.carry(np.flatnonzero(landed))
+        with PROFILER.scope("sim.collide"):
+            self.contacts = self.collider.check(fleet, t0, self.time_elapsed,
+                                                coasting[fleet.rails_body[coasting] >= 0], traces)
+        self.last_steps, self.last_evals = steps + coast_steps, evals + coast_evals
+        PROFILER.count("substeps", self.last_steps)
+        PROFILER.count("gravity_evals", self.last_evals)
+        return self.last_steps
+
+
 # --- 数据与存档管理 ---
-def load_universe(filepath):
-    tree = ET.parse(filepath)
-    root = tree.getroot()
-    all_bodies, stars = [], []
-    for solar_node in root.findall("Solar"):
-        star = CelestialBody(
-            name=solar_node.find("Star").attrib["name"], parent=None, orbit_radius=0,
-            mass=safe_float(solar_node.find("Star"), "mass", 1.989e27),
-            render_size=safe_float(solar_node.find("Star"), "size", 15.0),
-            body_radius=safe_float(solar_node.find("Star"), "body_radius", 696340.0),
-            color=solar_node.find("Star").attrib["colour"],
-            offset_x=safe_float(solar_node.find("Star"), "x", 0.0),
-            offset_y=safe_float(solar_node.find("Star"), "y", 0.0)
-        )
-        stars.append(star);
-        all_bodies.append(star)
-        for p_node in solar_node.findall("Planet"):
-            planet = CelestialBody(
-                name=p_node.attrib["name"], parent=star, orbit_radius=safe_float(p_node, "radius"),
-                mass=safe_float(p_node, "mass"), render_size=safe_float(p_node, "size"),
-                body_radius=safe_float(p_node, "body_radius"), color=p_node.attrib["colour"]
-            )
-            star.children.append(planet);
-            all_bodies.append(planet)
-            for m_node in p_node.findall("Moon"):
-                moon = CelestialBody(
-                    name=m_node.attrib["name"], parent=planet, orbit_radius=safe_float(m_node, "radius"),
-                    mass=safe_float(m_node, "mass"), render_size=safe_float(m_node, "size"),
-                    body_radius=safe_float(m_node, "body_radius"), color=m_node.attrib["colour"]
-                )
-                planet.children.append(moon);
-                all_bodies.append(moon)
-    return stars, all_bodies
-
-
-def load_ship(filepath):
-    tree = ET.parse(filepath)
-    s = tree.getroot().find("Ship")
-    return Ship(s.attrib["name"], safe_float(s, "x"), safe_float(s, "y"), safe_float(s, "thrust"),
-                safe_float(s, "mass"), s.attrib["colour"])
+UNIVERSE_CACHE_VERSION = 1
+# 列顺序与 CelestialBody 的构造参数一致（parent 存为父天体下标，恒星为 -1）
+UNIVERSE_COLUMNS = ("name", "parent", "orbit_radius", "mass", "size", "body_radius", "colour", "x", "y")
+_BODY_DEFAULTS = {"Star": (1.989e27, 15.0, 696340.0), "Planet": (0.0, 0.0, 0.0), "Moon": (0.0, 0.0, 0.0)}
+
+
+def _parse_universe(filepath):
+    """iterparse 流式读取 Universe.xml：每读完一个 <Solar> 就追加进列表并释放其元素，
+    内存只随单个星系增长。返回按 UNIVERSE_COLUMNS 排列的各列"""
+    cols = {k: [] for k in UNIVERSE_COLUMNS}
+
+    def add(node, kind, parent):
+        mass, size, body_radius = _BODY_DEFAULTS[kind]
+        cols["parent"].append(parent)
+        cols["name"].append(node.attrib["name"]); cols["colour"].append(node.attrib["colour"])
+        cols["orbit_radius"].append(safe_float(node, "radius") if parent >= 0 else 0.0)
+        cols["mass"].append(safe_float(node, "mass", mass)); cols["size"].append(safe_float(node, "size", size))
+        cols["body_radius"].append(safe_float(node, "body_radius", body_radius))
+        cols["x"].append(safe_float(node, "x") if parent < 0 else 0.0)
+        cols["y"].append(safe_float(node, "y") if parent < 0 else 0.0)
+        return len(cols["parent"]) - 1
+
+    stack, root, star, planets = [], None, None, []
+    for event, node in ET.iterparse(filepath, events=("start", "end")):
+        if event == "start":
+            if root is None: root = node
+            stack.append(node.tag)
+            path = tuple(stack[1:])  # 只认 <Solar>/<Star>、<Solar>/<Planet>、<Solar>/<Planet>/<Moon>
+            if path == ("Solar", "Star") and star is None: star = node
+            elif path == ("Solar", "Planet"): planets.append((node, []))
+            elif path == ("Solar", "Planet", "Moon"): planets[-1][1].append(node)
+            continue
+        stack.pop()
+        if len(stack) != 1 or node.tag != "Solar": continue
+        # 星系读完：恒星在前，行星各自紧跟其卫星（与原先的 find/findall 顺序一致）
+        if star is None: raise ValueError(f"{filepath}: <Solar> without <Star>")
+        s = add(star, "Star", -1)
+        for p_node, moons in planets:
+            p = add(p_node, "Planet", s)
+            for m_node in moons: add(m_node, "Moon", p)
+        star, planets = None, []
+        root.clear()
+    return cols
+
+
+def _universe_cache_path(filepath):
+    """编译缓存放在 XML 同目录的 __pycache__ 下，文件名随 XML 文件名"""
+    folder, name = os.path.split(os.path.abspath(filepath))
+    return os.path.join(folder, "__pycache__", name + ".npz")
+
+
+def _universe_key(filepath):
+    st = os.stat(filepath)
+    return np.array([UNIVERSE_CACHE_VERSION, st.st_mtime_ns, st.st_size], dtype=np.int64)
+
+
+def _read_universe_cache(filepath):
+    """缓存的版本、源文件路径、mtime 与大小都一致时返回各列，否则返回 None"""
+    try:
+        with np.load(_universe_cache_path(filepath), allow_pickle=False) as data:
+            if not np.array_equal(data["key"], _universe_key(filepath)) or \
+                    str(data["source"]) != os.path.abspath(filepath): return None
+            return {k: data[k].tolist() for k in UNIVERSE_COLUMNS}
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def _write_universe_cache(filepath, cols):
+    path = _universe_cache_path(filepath)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, key=_universe_key(filepath), source=np.array(os.path.abspath(filepath)),
+                 **{k: np.array(v) for k, v in cols.items()})
+        os.replace(tmp, path)
+    except OSError:
+        pass  # 目录只读时放弃缓存，下次照常解析 XML
+
+
+def _load_columns(filepath, use_cache=True):
+    """二次启动直接读取编译好的二进制缓存，跳过 XML 解析"""
+    cols = _read_universe_cache(filepath) if use_cache else None
+    if cols is None:
+        cols = _parse_universe(filepath)
+        if use_cache: _write_universe_cache(filepath, cols)
+    return cols
+
+
+def load_universe(filepath, use_cache=True):
+    """一次性实例化全部天体；返回 (stars, BodyTable)"""
+    cols = _load_columns(filepath, use_cache)
+    # 一次性创建大量对象时暂停循环垃圾回收，否则分代 GC 会被反复触发
+    all_bodies, stars, gc_enabled = [], [], gc.isenabled()
+    gc.disable()
+    try:
+        for name, parent, *attrs in zip(*(cols[k] for k in UNIVERSE_COLUMNS)):
+            p = all_bodies[parent] if parent >= 0 else None
+            body = CelestialBody(name, p, *attrs)
+            if p is None: stars.append(body)
+            else: p.children.append(body)
+            all_bodies.append(body)
+        return stars, BodyTable(all_bodies)
+    finally:
+        if gc_enabled: gc.enable()
+
+
+def load_galaxy(filepath, use_cache=True, **kwargs):
+    """分页载入：只实例化恒星，行星与卫星按激活半径由 Galaxy.update 按需物化"""
+    return Galaxy(_load_columns(filepath, use_cache), **kwargs)
 
 
 def init_ship_orbit(ship, all_bodies):
-    nearest = min(all_bodies, key=lambda b: math.hypot(ship.x - b.x, ship.y - b.y))
+    nearest = get_nearest_body(ship.x, ship.y, all_bodies)
     dist = math.hypot(ship.x - nearest.x, ship.y - nearest.y)
     if dist > 0:
         v_circ = math.sqrt(G * nearest.mass / dist)
@@ -154,27 +1766,232 @@ def init_ship_orbit(ship, all_bodies):
     return nearest
 
 
-def save_game(filepath, time_elapsed, ship, camera):
-    data = {
-        "time_elapsed": time_elapsed,
-        "ship": {
-            "x": ship.x, "y": ship.y, "vx": ship.vx, "vy": ship.vy,
-            "heading": ship.heading, "ap_state": ship.ap_state,
-            "target": ship.autopilot_target.name if ship.autopilot_target else None
-        },
-        "camera": {"target": camera.target.name if camera.target else None, "scale": camera.scale}
-    }
-    with open(filepath, "w") as f: json.dump(data, f)
+def load_fleet(filepath, all_bodies):
+    """读取全部 <Ship>，各自放上最近天体的圆轨道；可选 target 属性指定自动驾驶目标。
+    all_bodies 为 Galaxy 时先物化飞船附近与目标所在的星系。
+    返回 (fleet, player)，player 为第一艘 class="Player" 的下标（没有则为 0）"""
+    ships, targets, player = [], [], None
+    for s in ET.parse(filepath).getroot().findall("Ship"):
+        ships.append(Ship(s.attrib["name"], safe_float(s, "x"), safe_float(s, "y"), safe_float(s, "thrust"),
+                          safe_float(s, "mass"), s.attrib["colour"]))
+        targets.append(s.attrib.get("target"))
+        if player is None and s.attrib.get("class") == "Player": player = len(ships) - 1
+    if isinstance(all_bodies, Galaxy):
+        all_bodies.update([s.x for s in ships], [s.y for s in ships], all_bodies.time)
+        targets = [all_bodies.find(name) if name else None for name in targets]
+        all_bodies = all_bodies.table
+    else:
+        resolve = _body_resolver(all_bodies)
+        targets = [resolve(name) if name else None for name in targets]
+    for ship, target in zip(ships, targets):
+        init_ship_orbit(ship, all_bodies)
+        ship.autopilot_target = target
+    return Fleet(ships, all_bodies), player or 0
+
+
+def new_simulation(uni_path, shp_path):
+    """载入宇宙与编队；返回 (sim, 离玩家飞船最近的天体)"""
+    galaxy = load_galaxy(uni_path)
+    fleet, player = load_fleet(shp_path, galaxy)
+    sim = Simulation(galaxy.stars, galaxy.table, fleet, player, galaxy=galaxy)
+    return sim, get_nearest_body(sim.ship.x, sim.ship.y, sim.all_bodies)
+
+
+def replay_simulation(uni_path, shp_path, names, xs, ys, t=0.0):
+    """回放录像用的世界：编队按录像的飞船名单建立（颜色与玩家取 shp_path 里同名的飞船，找不到时用缺省），
+    星系按录像经过的位置 (xs, ys) 物化。飞船状态全部来自录像，这个世界只提供天体与名单"""
+    known, player = {}, None
+    for s in ET.parse(shp_path).getroot().findall("Ship"):
+        known.setdefault(s.attrib["name"], s.attrib["colour"])
+        if player is None and s.attrib.get("class") == "Player": player = s.attrib["name"]
+    galaxy = load_galaxy(uni_path)
+    galaxy.update(xs, ys, t)
+    fleet = Fleet([Ship(n, 0.0, 0.0, 0.0, 1.0, known.get(n, "cyan")) for n in names], galaxy.table)
+    return Simulation(galaxy.stars, galaxy.table, fleet, names.index(player) if player in names else 0, t,
+                      galaxy=galaxy)
+
+
+# --- 存档：全部动态状态（每艘飞船、自动驾驶、时间、镜头）的快照 ---
+# 二进制格式为不含 pickle 的 npz；天体引用存成名字表 body_names 的下标，读档时每个名字只解析一次。
+# 以 .json 结尾的路径写成 JSON 导出，读档两种格式都认（包括只有一艘船的旧版 JSON）
+SAVE_VERSION = 3
+SAVE_BODY_FIELDS = ("target", "landed", "plan_origin", "plan_central")  # 存成 body_names 下标的天体引用（-1 为无）
+# 转移计划：plan_arrive 为 NaN 表示没有；plan_dv 为 (出发, 到达) Δv。porkchop 网格不入档
+SAVE_PLAN_FIELDS = ("plan_depart", "plan_arrive", "plan_vx", "plan_vy")
+
 
+def capture_state(sim, camera):
+    """拷贝一份只含数组与字符串的世界状态；在推进模拟的线程里调用，之后可交给别的线程写盘"""
+    fleet = sim.fleet
+    state = {k: getattr(fleet, k).copy() for k in Fleet.FLOAT_FIELDS + SAVE_PLAN_FIELDS + ("land_x", "land_y")}
+    state["plan_dv"] = np.array([(p.dv_depart, p.dv_arrive) if p is not None else (np.nan, np.nan)
+                                 for p in fleet.plans], dtype=np.float64).reshape(-1, 2)
+    refs = np.concatenate([getattr(fleet, k) for k in SAVE_BODY_FIELDS])
+    used = np.unique(refs[refs >= 0])
+    names = [fleet.bodies[i].name for i in used.tolist()]
+    for k in SAVE_BODY_FIELDS:
+        index = getattr(fleet, k)
+        state[k] = np.where(index >= 0, np.searchsorted(used, index), -1)
+    cam_target = -1
+    if camera.target is not None:
+        if camera.target.name not in names: names.append(camera.target.name)
+        cam_target = names.index(camera.target.name)
+    state.update(
+        ship_name=np.array([s.name for s in fleet.ships], dtype=str),
+        show_ui=np.array([s.show_ui for s in fleet.ships], dtype=bool),
+        turn_cmd=fleet.turn_cmd.copy(), ap_code=fleet.ap_code.copy(), ap_states=np.array(AP_STATES),
+        body_names=np.array(names, dtype=str), player=np.array(sim.player),
+        time_elapsed=np.array(sim.time_elapsed), time_scale=np.array(sim.time_scale),
+        integrator=np.array(sim.integrator.name), camera_target=np.array(cam_target),
+        camera=np.array([camera.scale, camera.offset_x, camera.offset_y]), view_level=np.array(camera.view_level))
+    return state
 
-def load_game(filepath, ship, camera, all_bodies):
+
+def save_game(filepath, state):
+    """原子写入（先写临时文件再改名），写到一半中断也不会损坏已有存档"""
+    tmp = filepath + ".tmp"
+    if filepath.endswith(".json"):
+        with open(tmp, "w") as f: json.dump(_state_to_json(state), f, indent=1)
+    else:
+        with open(tmp, "wb") as f:
+            np.savez(f, version=np.array(SAVE_VERSION), **state)
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, filepath)
+
+
+def read_state(filepath):
+    """读出存档，返回与 capture_state 同形的字典（旧版 JSON 缺的字段不出现）"""
+    if not zipfile.is_zipfile(filepath):
+        with open(filepath, "r") as f: return _state_from_json(json.load(f))
+    with np.load(filepath, allow_pickle=False) as data:
+        if int(data["version"]) > SAVE_VERSION: raise ValueError(f"save file is newer than this build: {filepath}")
+        return {k: data[k] for k in data.files if k != "version"}
+
+
+def load_game(filepath, sim, camera):
+    """把存档应用到 sim 与 camera；飞船按名字对应（旧版 JSON 的飞船即玩家）。返回存档时间，文件不存在时返回 None"""
     if not os.path.exists(filepath): return None
-    with open(filepath, "r") as f: data = json.load(f)
-    ship.x, ship.y, ship.vx, ship.vy = data["ship"]["x"], data["ship"]["y"], data["ship"]["vx"], data["ship"]["vy"]
-    ship.heading, ship.ap_state = data["ship"]["heading"], data["ship"]["ap_state"]
-    tgt = data["ship"]["target"]
-    ship.autopilot_target = next((b for b in all_bodies if b.name == tgt), None)
-    cam_tgt = data["camera"]["target"]
-    camera.target = next((b for b in all_bodies if b.name == cam_tgt), None)
-    camera.scale = data["camera"]["scale"]
-    return data["time_elapsed"]
\ No newline at end of file
+    state = read_state(filepath)
+    resolve = _body_resolver(sim.galaxy or sim.all_bodies)
+    refs = [resolve(name) for name in state["body_names"].tolist()]  # 可能物化星系并重建天体表
+    fleet = sim.fleet
+    rows = {s.name: i for i, s in enumerate(fleet.ships)}
+    match = np.array([rows.get(n, sim.player if n == "" else -1) for n in state["ship_name"].tolist()],
+                     dtype=np.int64)
+    src = np.flatnonzero(match >= 0)
+    dst = match[src]
+    fleet.landed[dst], fleet.plan_arrive[dst] = -1, np.nan  # 旧版存档没有的着陆、计划信息一律视为无
+    for k in Fleet.FLOAT_FIELDS + SAVE_PLAN_FIELDS + ("turn_cmd", "land_x", "land_y"):
+        if k in state: getattr(fleet, k)[dst] = state[k][src]
+    if "ap_code" in state:
+        codes = np.array([AP_CODES.get(n, 0) for n in state["ap_states"].tolist()], dtype=np.int8)
+        fleet.ap_code[dst] = codes[state["ap_code"][src]]
+    index = np.array([fleet._body_index(b) if b else -1 for b in refs] + [-1], dtype=np.int64)
+    for k in SAVE_BODY_FIELDS:
+        if k in state: getattr(fleet, k)[dst] = index[state[k][src]]  # -1 取到末位的 -1
+    if "show_ui" in state:
+        for i, show in zip(dst.tolist(), state["show_ui"][src].tolist()): fleet.ships[i].show_ui = show
+    fleet.rails_body[dst] = -1  # 从存下的状态重新上轨
+    fleet.step_hint.clear()
+    # 按存下的字段重建 TransferPlan（没有 porkchop 网格），自动驾驶接着执行
+    def body(j): return fleet.bodies[int(j)] if j >= 0 else None
+    dv = state["plan_dv"][src] if "plan_dv" in state else np.full((len(src), 2), np.nan)
+    for i, (dv_depart, dv_arrive) in zip(dst.tolist(), dv.tolist()):
+        fleet.plans[i] = None
+        if not np.isfinite(fleet.plan_arrive[i]): continue
+        fleet.plans[i] = planner.TransferPlan(
+            body(fleet.plan_origin[i]), body(fleet.target[i]), body(fleet.plan_central[i]),
+            float(fleet.plan_depart[i]), float(fleet.plan_arrive[i]), None,
+            (float(fleet.plan_vx[i]), float(fleet.plan_vy[i])), dv_depart, dv_arrive, None, None, None)
+
+    if "player" in state and match[int(state["player"])] >= 0:
+        sim.player = int(match[int(state["player"])])
+        sim.ship = fleet.ships[sim.player]
+    if "time_scale" in state: sim.time_scale = float(state["time_scale"])
+    if "integrator" in state and str(state["integrator"]) in INTEGRATORS: sim.set_integrator(str(state["integrator"]))
+    sim.time_elapsed = float(state["time_elapsed"])
+    sim.all_bodies.set_time(sim.time_elapsed)
+
+    cam_target = int(state["camera_target"])
+    camera.target = refs[cam_target] if cam_target >= 0 else None
+    camera.scale, camera.offset_x, camera.offset_y = state["camera"].tolist()
+    if "view_level" in state: camera.view_level = int(state["view_level"])
+    return sim.time_elapsed
+
+
+def _body_resolver(bodies):
+    """名字 -> 天体的查找函数（同名取第一个）；Galaxy 会按需物化"""
+    if isinstance(bodies, Galaxy): return bodies.find
+    by_name = {}
+    for b in bodies: by_name.setdefault(b.name, b)
+    return by_name.get
+
+
+def _state_to_json(state):
+    names, ap_states = state["body_names"].tolist(), state["ap_states"].tolist()
+    ships = []
+    for i, name in enumerate(state["ship_name"].tolist()):
+        target, landed = int(state["target"][i]), int(state["landed"][i])
+        origin, central = int(state["plan_origin"][i]), int(state["plan_central"][i])
+        plan = None
+        if np.isfinite(state["plan_arrive"][i]):
+            plan = {"origin": names[origin] if origin >= 0 else None, "central": names[central] if central >= 0 else None,
+                    "t_depart": float(state["plan_depart"][i]), "t_arrive": float(state["plan_arrive"][i]),
+                    "v_inf": [float(state["plan_vx"][i]), float(state["plan_vy"][i])],
+                    "dv": [None if math.isnan(v) else v for v in state["plan_dv"][i].tolist()]}
+        ships.append(dict({k: float(state[k][i]) for k in Fleet.FLOAT_FIELDS}, name=name, plan=plan,
+                          turn_cmd=int(state["turn_cmd"][i]), ap_state=ap_states[state["ap_code"][i]],
+                          target=names[target] if target >= 0 else None, show_ui=bool(state["show_ui"][i]),
+                          landed={"body": names[landed], "x": float(state["land_x"][i]),
+                                  "y": float(state["land_y"][i])} if landed >= 0 else None))
+    cam_target = int(state["camera_target"])
+    scale, offset_x, offset_y = state["camera"].tolist()
+    return {
+        "version": SAVE_VERSION, "time_elapsed": float(state["time_elapsed"]),
+        "time_scale": float(state["time_scale"]), "integrator": str(state["integrator"]),
+        "player": int(state["player"]), "ship": ships[int(state["player"])], "ships": ships,
+        "camera": {"target": names[cam_target] if cam_target >= 0 else None, "scale": scale,
+                   "offset_x": offset_x, "offset_y": offset_y, "view_level": int(state["view_level"])}
+    }
+
+
+def _state_from_json(data):
+    """JSON 导出（或只有 ship 的旧版存档）-> 状态字典；旧版的飞船名记为空串，读档时对应到玩家"""
+    ships = data.get("ships") or [dict(data["ship"], name="")]
+    names = sorted({s["target"] for s in ships if s.get("target")} |
+                   {s["landed"]["body"] for s in ships if s.get("landed")} |
+                   {s["plan"][k] for s in ships if s.get("plan") for k in ("origin", "central") if s["plan"][k]} |
+                   ({data["camera"]["target"]} if data["camera"].get("target") else set()))
+    state = {k: np.array([s[k] for s in ships], dtype=np.float64) for k in Fleet.FLOAT_FIELDS
+             if all(k in s for s in ships)}
+    state.update(
+        ship_name=np.array([s["name"] for s in ships], dtype=str), body_names=np.array(names, dtype=str),
+        ap_states=np.array(AP_STATES),
+        ap_code=np.array([AP_CODES.get(s.get("ap_state"), 0) for s in ships], dtype=np.int8),
+        target=np.array([names.index(s["target"]) if s.get("target") else -1 for s in ships], dtype=np.int64),
+        time_elapsed=np.array(data["time_elapsed"]),
+        camera_target=np.array(names.index(data["camera"]["target"]) if data["camera"].get("target") else -1),
+        camera=np.array([data["camera"]["scale"], data["camera"].get("offset_x", 0.0),
+                         data["camera"].get("offset_y", 0.0)]))
+    if all("turn_cmd" in s for s in ships): state["turn_cmd"] = np.array([s["turn_cmd"] for s in ships])
+    if all("show_ui" in s for s in ships): state["show_ui"] = np.array([s["show_ui"] for s in ships])
+    if all("landed" in s for s in ships):
+        landed = [s["landed"] or {} for s in ships]
+        state["landed"] = np.array([names.index(l["body"]) if l else -1 for l in landed], dtype=np.int64)
+        state["land_x"], state["land_y"] = (np.array([l.get(k, 0.0) for l in landed], dtype=np.float64)
+                                            for k in ("x", "y"))
+    if all("plan" in s for s in ships):
+        plans = [s["plan"] or {} for s in ships]
+        for k, key in (("plan_origin", "origin"), ("plan_central", "central")):
+            state[k] = np.array([names.index(p[key]) if p.get(key) else -1 for p in plans], dtype=np.int64)
+        state["plan_depart"], state["plan_arrive"] = (np.array([p.get(k, np.nan) for p in plans], dtype=np.float64)
+                                                      for k in ("t_depart", "t_arrive"))
+        state["plan_vx"], state["plan_vy"] = (np.array([p.get("v_inf", (0.0, 0.0))[j] for p in plans])
+                                              for j in (0, 1))
+        state["plan_dv"] = np.array([[np.nan if v is None else v for v in p.get("dv", (None, None))] for p in plans],
+                                    dtype=np.float64).reshape(-1, 2)
+    for k in ("player", "time_scale", "integrator"):
+        if k in data: state[k] = np.array(data[k])
+    if "view_level" in data["camera"]: state["view_level"] = np.array(data["camera"]["view_level"])
+    return state
@@ -0,0 +1,137 @@
+# headless.py
+"""无窗口模拟器：直接调用 engine 以 CPU 允许的最快速度推进模拟，用于批量跑图与吞吐量测量"""
+import argparse
+import json
+import math
+import os
+import time
+from engine import INTEGRATORS, Camera, Forecaster, new_simulation, get_dominant_body, find_body, capture_state, \
+    save_game, load_game
+from partition import PartitionedSimulation
+from profiler import PROFILER
+from recorder import FlightRecorder
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def ship_state(sim, ship=None):
+    ship = ship or sim.ship
+    dom = get_dominant_body(ship.x, ship.y, sim.all_bodies)
+    return {
+        "t": sim.time_elapsed, "x": ship.x, "y": ship.y, "vx": ship.vx, "vy": ship.vy,
+        "heading": ship.heading, "thrust_percent": ship.thrust_percent, "ap_state": ship.ap_state,
+        "target": ship.autopilot_target.name if ship.autopilot_target else None,
+        "dominant": dom.name if dom else None,
+        "speed": math.hypot(ship.vx, ship.vy)
+    }
+
+
+def run(sim, duration, dt, sample_every=0.0, recorder=None):
+    """推进 duration 模拟秒，每帧步长 dt；返回 (samples, stats, contacts)。recorder 不为空时每帧记录全部飞船"""
+    samples, contacts, next_sample = [], [], sim.time_elapsed
+    end_time = sim.time_elapsed + duration
+    frames, physics_steps, gravity_evals = 0, 0, 0
+    wall_start = time.perf_counter()
+    while sim.time_elapsed < end_time:
+        if sample_every > 0 and sim.time_elapsed >= next_sample:
+            samples.append(ship_state(sim))
+            next_sample += sample_every
+        physics_steps += sim.step(min(dt, end_time - sim.time_elapsed))
+        gravity_evals += sim.last_evals
+        contacts += sim.contacts
+        frames += 1
+        if recorder is not None: recorder.record(sim.time_elapsed, sim.fleet)
+        PROFILER.end_frame("physics")
+    wall = time.perf_counter() - wall_start
+    stats = {
+        "sim_seconds": duration, "wall_seconds": wall, "frames": frames, "physics_steps": physics_steps,
+        "gravity_evals": gravity_evals, "contacts": len(contacts), "integrator": sim.integrator.name,
+        "sim_seconds_per_wall_second": duration / wall if wall > 0 else float("inf")
+    }
+    return samples, stats, contacts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the orbital simulation without a window.")
+    parser.add_argument("--universe", default=os.path.join(BASE_DIR, "Data", "Universe.xml"))
+    parser.add_argument("--ships", default=os.path.join(BASE_DIR, "Data", "Ships.xml"))
+    parser.add_argument("--load", help="start from a save file instead of a new game")
+    parser.add_argument("--duration", type=float, default=86400.0, help="simulated seconds to run")
+    parser.add_argument("--time-scale", type=float, default=1000.0, help="simulated seconds per frame")
+    parser.add_argument("--integrator", choices=list(INTEGRATORS), default="rk45")
+    parser.add_argument("--target", help="engage the autopilot towards this body")
+    parser.add_argument("--plan", action="store_true",
+                        help="fly a planned (porkchop-optimal) transfer to --target instead of the greedy autopilot")
+    parser.add_argument("--forecast", action="store_true",
+                        help="after the run, forecast the player's coasting path (n-body) and list its encounters")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="step each star system in its own worker process (ships hand over at system borders)")
+    parser.add_argument("--workers", type=int, help="worker processes for --partitioned (default: CPU count)")
+    parser.add_argument("--sample-every", type=float, default=0.0, help="simulated seconds between samples")
+    parser.add_argument("--out", help="write final state, samples and stats as JSON")
+    parser.add_argument("--save", help="also write the final state as a save file (.json for a JSON export)")
+    parser.add_argument("--profile", help="write per-frame phase timings and counters as CSV")
+    parser.add_argument("--record", help="write a flight recording (ring file) of every ship, every frame")
+    args = parser.parse_args(argv)
+
+    sim, nearest = new_simulation(args.universe, args.ships)
+    camera = Camera()
+    camera.target = nearest
+    if args.load:
+        if load_game(args.load, sim, camera) is None: parser.error(f"save file not found: {args.load}")
+    if args.target:
+        sim.ship.autopilot_target = find_body(sim.galaxy, args.target)
+        if sim.ship.autopilot_target is None: parser.error(f"unknown body: {args.target}")
+    elif args.plan: parser.error("--plan needs --target")
+    if args.plan and args.partitioned: parser.error("--plan cannot be combined with --partitioned")
+    plan = None
+    if args.plan:
+        plan = sim.plan_transfer(sim.ship.autopilot_target)
+        if plan is None: parser.error(f"no transfer to {args.target} from the ship's current orbit")
+        print(f"Transfer to {plan.target.name}: depart t={plan.t_depart:.0f} s, arrive t={plan.t_arrive:.0f} s, "
+              f"dv {plan.dv_depart:.3f} + {plan.dv_arrive:.3f} km/s")
+    sim.time_scale = args.time_scale
+    sim.set_integrator(args.integrator)
+
+    if args.profile: PROFILER.start_export(args.profile)
+    recorder = FlightRecorder.for_fleet(args.record, sim.fleet) if args.record else None
+    if recorder is not None: recorder.record(sim.time_elapsed, sim.fleet)
+    if args.partitioned:
+        with PartitionedSimulation(sim, args.workers) as stepper:
+            samples, stats, contacts = run(stepper, args.duration, args.time_scale, args.sample_every, recorder)
+        stats["partitioned"] = {"workers": stepper.workers, "handovers": stepper.handovers}
+    else: samples, stats, contacts = run(sim, args.duration, args.time_scale, args.sample_every, recorder)
+    if recorder is not None: recorder.flush()
+    if args.profile:
+        PROFILER.stop_export()
+        stats["profile"] = {name: dict(zip(("p50", "p95", "p99"), p))
+                            for name, p in PROFILER.summary().get("physics", {}).items()}
+    result = {"final": ship_state(sim), "fleet": [ship_state(sim, s) for s in sim.fleet.ships],
+              "samples": samples, "stats": stats,
+              "contacts": [{"t": c.t, "kind": c.kind, "ship": sim.fleet.ships[c.ship].name, "body": c.body.name,
+                            "distance": c.distance, "speed": c.speed} for c in contacts]}
+    for c in contacts:
+        print(f"Contact: {sim.fleet.ships[c.ship].name} {c.kind} {c.body.name} at t={c.t:.0f} s "
+              f"({c.distance - c.body.body_radius:,.0f} km up, {c.speed:.2f} km/s)")
+    if plan is not None:
+        result["plan"] = {"origin": plan.origin.name if plan.origin is not None else None,
+                          "target": plan.target.name, "central": plan.central.name, "t_depart": plan.t_depart,
+                          "t_arrive": plan.t_arrive, "dv_depart": plan.dv_depart, "dv_arrive": plan.dv_arrive}
+    if args.forecast:
+        forecast = Forecaster().update(sim, budget=math.inf)
+        result["forecast"] = {"until": float(forecast.t[-1]) if len(forecast.t) else sim.time_elapsed,
+                              "events": [{"t": e.t, "kind": e.kind, "body": e.body.name, "distance": e.distance}
+                                         for e in forecast.events]}
+        for e in forecast.events:
+            print(f"Forecast: {e.kind} {e.body.name} at t={e.t:.0f} s ({e.distance:.0f} km)")
+    if args.out:
+        with open(args.out, "w") as f: json.dump(result, f)
+    if args.save: save_game(args.save, capture_state(sim, camera))
+    print(f"{stats['sim_seconds']:.0f} sim s in {stats['wall_seconds']:.3f} wall s "
+          f"({stats['sim_seconds_per_wall_second']:.3g} sim s / wall s, "
+          f"{stats['physics_steps']} physics steps, {stats['gravity_evals']} gravity evals)")
+    return result
+
+
+if __name__ == "__main__":
+    main()
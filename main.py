@@ -1,145 +1,171 @@
-import pygame
+import time
+_STARTED = time.perf_counter()  # 启动计时从解释器执行到本文件开头算起
+import argparse
 import math
 import os
-from settings import G, COLORS, SCREEN_WIDTH, SCREEN_HEIGHT, FPS
-from engine import CelestialBody, Ship, Camera, load_universe, load_ship, init_ship_orbit, compute_gravity, \
-    get_dominant_body, save_game, load_game
-
-pygame.init()
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Orbital Mechanics 7.1 - Perfect Insertion & FX")
-clock = pygame.time.Clock()
-font = pygame.font.SysFont("Consolas", 14)
-ui_font = pygame.font.SysFont("Consolas", 12)
-title_font = pygame.font.SysFont("Consolas", 48, bold=True)
-
-
-# ================= 渲染系统 =================
-def draw_ship(screen, ship, camera, font):
-    sx, sy = camera.apply(ship.x, ship.y)
-    length, width = 12, 7
-    cos_h, sin_h = math.cos(ship.heading), math.sin(ship.heading)
-    nose = (sx + cos_h * length, sy + sin_h * length)
-    left = (sx - cos_h * length + sin_h * width, sy - sin_h * length - cos_h * width)
-    right = (sx - cos_h * length - sin_h * width, sy - sin_h * length + cos_h * width)
-
-    # --- 优化1：主引擎火焰大幅加长 ---
-    if ship.thrust_percent > 0:
-        flame_len = length * 5.0 * ship.thrust_percent  # 从2.0提升到5.0
-        flame_width = width * 0.4
-        f_left = (sx - cos_h * length + sin_h * flame_width, sy - sin_h * length - cos_h * flame_width)
-        f_right = (sx - cos_h * length - sin_h * flame_width, sy - sin_h * length + cos_h * flame_width)
-        flame_tip = (sx - cos_h * (length + flame_len), sy - sin_h * (length + flame_len))
-        pygame.draw.polygon(screen, COLORS["orange"], [f_left, f_right, flame_tip])
-
-    if ship.turn_cmd != 0:
-        rcs_color, rcs_len = COLORS["white"], 6
-        if ship.turn_cmd < 0:
-            pygame.draw.line(screen, rcs_color, nose, (nose[0] - sin_h * rcs_len, nose[1] + cos_h * rcs_len), 2)
-            pygame.draw.line(screen, rcs_color, left, (left[0] + sin_h * rcs_len, left[1] - cos_h * rcs_len), 2)
-        else:
-            pygame.draw.line(screen, rcs_color, nose, (nose[0] + sin_h * rcs_len, nose[1] - cos_h * rcs_len), 2)
-            pygame.draw.line(screen, rcs_color, right, (right[0] - sin_h * rcs_len, right[1] + cos_h * rcs_len), 2)
-
-    pygame.draw.polygon(screen, ship.color, [nose, left, right])
-
-    if ship.show_ui:
-        panel_w, panel_h = 180, 75
-        panel_x, panel_y = sx + 20, sy - panel_h // 2
-        surf = pygame.Surface((panel_w, panel_h), pygame.SRCALPHA)
-        surf.fill(COLORS["ui_bg"])
-        screen.blit(surf, (panel_x, panel_y))
-        pygame.draw.rect(screen, ship.color, (panel_x, panel_y, panel_w, panel_h), 1)
-
-        lines = [
-            f"Vessel: {ship.name}",
-            f"Dest: {ship.autopilot_target.name if ship.autopilot_target else 'None'}",
-            f"Phase: {ship.ap_state}",
-            f"Thrust: {ship.thrust_percent * 100:.0f}%"
-        ]
-        for i, text in enumerate(lines):
-            color = COLORS["orange"] if "ORBIT" in text or ship.thrust_percent > 0 else COLORS["white"]
-            screen.blit(font.render(text, True, color), (panel_x + 5, panel_y + 5 + i * 16))
-
-
-def draw_trajectory(screen, ship, bodies, camera):
-    dom = get_dominant_body(ship.x, ship.y, bodies)
-    if not dom: return
-    rel_x, rel_y = ship.x - dom.x, ship.y - dom.y
-    rel_vx, rel_vy = ship.vx - dom.get_velocity()[0], ship.vy - dom.get_velocity()[1]
-
-    r, v = math.hypot(rel_x, rel_y), math.hypot(rel_vx, rel_vy)
-    eps = v ** 2 / 2 - G * dom.mass / r
-
-    if eps < 0:
-        a = -G * dom.mass / (2 * eps)
-        sim_dt, sim_steps = 2 * math.pi * math.sqrt(a ** 3 / (G * dom.mass)) / 200.0, 200
-    else:
-        sim_dt, sim_steps = max(10.0, r / max(v, 0.001) / 50.0), 200
-
-    points = []
-    for _ in range(sim_steps):
-        dist_sq = rel_x ** 2 + rel_y ** 2
-        if dist_sq < dom.body_radius ** 2:
-            sx, sy = camera.apply(dom.x + rel_x, dom.y + rel_y)
-            points.append((sx, sy));
-            break
-
-        dist = math.sqrt(dist_sq)
-        f = -G * dom.mass / dist_sq
-        rel_vx += f * (rel_x / dist) * sim_dt
-        rel_vy += f * (rel_y / dist) * sim_dt
-        rel_x += rel_vx * sim_dt
-        rel_y += rel_vy * sim_dt
-
-        sx, sy = camera.apply(dom.x + rel_x, dom.y + rel_y)
-        if -500 < sx < SCREEN_WIDTH + 500 and -500 < sy < SCREEN_HEIGHT + 500:
-            points.append((sx, sy))
-
-    if len(points) > 1:
-        pygame.draw.lines(screen, COLORS["cyan"], False, points, 1)
-
-
-def draw_menus(screen, state, menu_options, selected_index):
-    screen.fill(COLORS["menu_bg"])
-    title_str = "ORBITAL MECHANICS" if state == "MAIN_MENU" else "PAUSED"
-    t_surf = title_font.render(title_str, True, COLORS["white"])
-    screen.blit(t_surf, (SCREEN_WIDTH // 2 - t_surf.get_width() // 2, 200))
-
-    for i, opt in enumerate(menu_options):
-        color = COLORS["yellow"] if i == selected_index else COLORS["gray"]
-        prefix = ">> " if i == selected_index else "   "
-        opt_surf = title_font.render(prefix + opt, True, color)
-        screen.blit(opt_surf, (SCREEN_WIDTH // 2 - 150, 350 + i * 60))
+import threading
+from concurrent.futures import Future
+import pygame
+from settings import SCREEN_WIDTH, SCREEN_HEIGHT, FPS, MAX_TIME_SCALE, AUTOSAVE_INTERVAL
+from render import Renderer, system_font
+from profiler import PROFILER
+
+# 模拟相关模块（engine 连带 planner 等）由 preload 在后台线程导入，主菜单不必等它们
+planner = None
+
+
+def _import_game():
+    global INTEGRATORS, Camera, new_simulation, replay_simulation, load_game, PhysicsWorker, SaveWriter, ShipFrame
+    global FlightRecorder, Replay, new_recording_path, latest_recording, planner
+    from engine import INTEGRATORS, Camera, new_simulation, replay_simulation, load_game
+    from worker import PhysicsWorker, SaveWriter, ShipFrame
+    from recorder import FlightRecorder, Replay, new_recording_path, latest_recording
+    import planner
+
+
+def preload(uni_path, shp_path):
+    """后台线程里导入模拟模块并读入宇宙、建好新游戏的 Simulation；返回 Future，结果同 new_simulation"""
+    future = Future()
+
+    def run():
+        try:
+            _import_game()
+            future.set_result(new_simulation(uni_path, shp_path))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="preload", daemon=True).start()
+    return future
+
+
+def describe_event(event, now):
+    """预报事件的一行说明：进出 SOI、近拱点/最近距离（离表面高度）或撞击，以及距今多久"""
+    dt = event.t - now
+    when = f"{dt / 86400:.1f} d" if dt >= 86400 else f"{dt / 3600:.1f} h"
+    if event.kind in ("enter", "exit"): return f"{event.kind} {event.body.name} SOI in {when}"
+    if event.kind == "impact": return f"IMPACT {event.body.name} in {when}"
+    label = "Pe" if event.kind == "periapsis" else "closest"
+    return f"{label} {event.body.name} {event.distance - event.body.body_radius:,.0f} km in {when}"
+
+
+def describe_contact(contact, now):
+    """已发生的接触事件一行说明：撞击（着陆）、进入大气层或近距离飞掠，相对速率与离表面高度，以及多久以前"""
+    ago = now - contact.t
+    when = f"{ago / 86400:.1f} d" if ago >= 86400 else f"{ago / 3600:.1f} h"
+    if contact.kind == "impact": return f"IMPACT {contact.body.name} at {contact.speed:.2f} km/s, {when} ago"
+    label = "entered atmosphere of" if contact.kind == "atmosphere" else "flew by"
+    return (f"{label} {contact.body.name} at {contact.distance - contact.body.body_radius:,.0f} km, "
+            f"{contact.speed:.2f} km/s, {when} ago")
 
 
 # ================= 主控制流 =================
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Orbital mechanics sandbox.")
+    parser.add_argument("--replay", metavar="PATH", help="open a flight recording (e.g. from headless.py --record) "
+                                                         "read-only and play it back")
+    parser.add_argument("--universe", help="universe the recording was made in (default: Data/Universe.xml)")
+    parser.add_argument("--ships", help="ship list used for colours and the player (default: Data/Ships.xml)")
+    args = parser.parse_args(argv)
+
+    # 只初始化用得到的显示与字体模块（pygame.init 还会拉起音频、手柄等）
+    pygame.display.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Orbital Mechanics 7.1 - Perfect Insertion & FX")
+    clock = pygame.time.Clock()
+    renderer = Renderer(screen, system_font("Consolas", 14), system_font("Consolas", 12),
+                        system_font("Consolas", 48, bold=True))
+    first_frame = True
+
     base_dir = os.path.dirname(os.path.abspath(__file__))
-    uni_path = os.path.join(base_dir, "Data", "Universe.xml")
-    shp_path = os.path.join(base_dir, "Data", "Ships.xml")
-    sav_path = os.path.join(base_dir, "Data", "savegame.json")
+    data_dir = os.path.join(base_dir, "Data")
+    uni_path = args.universe or os.path.join(data_dir, "Universe.xml")
+    shp_path = args.ships or os.path.join(data_dir, "Ships.xml")
+    sav_path = os.path.join(base_dir, "Data", "savegame.sav")
+    auto_path = os.path.join(base_dir, "Data", "autosave.sav")
+    json_path = os.path.join(base_dir, "Data", "savegame.json")  # JSON 导出，也可以读回
+    pending = None  # 第一帧画出后开始后台预载；玩家还在看主菜单时宇宙已经载入
 
     game_state = "MAIN_MENU"
-    menu_options = ["New Game", "Load Game", "Quit"]
+    main_menu = ["New Game", "Load Game", "Replay Flight", "Quit"]
+    menu_options = main_menu
     selected_idx = 0
 
-    stars, all_bodies, ship, camera = None, None, None, None
-    time_elapsed, time_scale, base_dt = 0.0, 1.0, 1.0
-    view_targets, is_panning = [], False
+    # 物理在 worker 线程里推进；本线程只读它发布的快照，改动模拟状态一律经 worker.submit 排队
+    worker, snap, camera = None, None, None
+    paused, controls, is_panning = None, None, False
+    show_profile = False
+    # replay_only：回放的是打开的录像文件（不是本局），退出回放即回到主菜单
+    replay, replay_only, replay_keys = None, False, {pygame.K_SPACE: "toggle", pygame.K_LEFTBRACKET: "slower",
+                                 pygame.K_RIGHTBRACKET: "faster", pygame.K_BACKSPACE: "reverse",
+                                 pygame.K_LEFT: "back", pygame.K_RIGHT: "forward"}
+    # 存档在物理线程拷贝状态、在 writer 线程写盘，画面不会因此卡顿
+    writer, next_autosave = None, time.perf_counter() + AUTOSAVE_INTERVAL
 
     def setup_new_game():
-        nonlocal stars, all_bodies, ship, camera, time_elapsed, time_scale, view_targets
-        stars, all_bodies = load_universe(uni_path)
-        ship = load_ship(shp_path)
-        nearest = init_ship_orbit(ship, all_bodies)
+        nonlocal worker, snap, camera, paused, controls, replay, replay_only, writer, pending
+        if worker: worker.stop()
+        # 第一局直接用预载好的世界；之后每次重开都重新读入
+        sim, nearest = (pending or preload(uni_path, shp_path)).result()
+        pending, writer = None, writer or SaveWriter()
+        # 每局一段新录像，以前的录像留着可以回放
+        worker = PhysicsWorker(sim, recorder=FlightRecorder.for_fleet(new_recording_path(data_dir), sim.fleet)).start()
+        paused, controls, replay, replay_only = True, None, None, False
+        snap = worker.snapshot
         camera, camera.target = Camera(), nearest
-        time_elapsed, time_scale = 0.0, 1.0
-        view_targets = stars
+
+    def start_replay(path):
+        """只读打开录像 path 并回放（不再模拟）；打不开或没有样本时返回 False"""
+        nonlocal worker, snap, camera, paused, controls, replay, replay_only, writer
+        _import_game()
+        try:
+            recorder = FlightRecorder(path)
+        except (OSError, ValueError) as e:
+            print("Cannot open flight recording:", e)
+            return False
+        if not len(recorder):
+            print("Flight recording is empty:", path)
+            return False
+        if worker: worker.stop()
+        # 按录像经过的位置物化星系（抽样至多约 64 个时刻）
+        n = len(recorder)
+        rows = slice(0, n, max(1, n // 64))
+        start, _ = recorder.span()
+        sim = replay_simulation(uni_path, shp_path, recorder.names, recorder.x[rows].ravel(), recorder.y[rows].ravel(),
+                                start)
+        worker, writer = PhysicsWorker(sim).start(), writer or SaveWriter()
+        paused, controls, replay, replay_only = True, None, Replay(recorder), True
+        snap = worker.snapshot
+        x, y = recorder.sample(start)[:2]
+        camera, camera.target = Camera(), sim.all_bodies.nearest(float(x[sim.player]), float(y[sim.player]))
+        return True
+
+    def leave_replay():
+        nonlocal worker, replay, replay_only, game_state, menu_options, selected_idx
+        worker.stop()
+        worker, replay, replay_only = None, None, False
+        game_state, menu_options, selected_idx = "MAIN_MENU", main_menu, 0
+
+    def load_into(sim):
+        """读最新的一份存档（手动、自动或 JSON 导出）"""
+        saves = [p for p in (sav_path, auto_path, json_path) if os.path.exists(p)]
+        if not saves: return None
+        writer.flush()
+        loaded_time = load_game(max(saves, key=os.path.getmtime), sim, camera)
+        worker.recorder.clear()  # 读档后时间不再连续，录像从头开始
+        return loaded_time
+
+    if args.replay and start_replay(args.replay): game_state = "PLAYING"
 
     running = True
     while running:
-        dt = base_dt * time_scale
+        PROFILER.lap()
+        if worker:
+            if worker.error: raise worker.error
+            if paused != (game_state != "PLAYING" or replay is not None):
+                paused = game_state != "PLAYING" or replay is not None
+                worker.set_paused(paused)
+            snap = worker.snapshot
+            camera.locate = snap.position
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT: running = False
@@ -155,19 +181,28 @@ def main():
                             game_state = "PLAYING"
                         elif opt == "Load Game":
                             setup_new_game()
-                            loaded_time = load_game(sav_path, ship, camera, all_bodies)
-                            if loaded_time is not None:
-                                time_elapsed = loaded_time
+                            if worker.submit(load_into).result() is not None:
+                                snap = worker.snapshot
                                 game_state = "PLAYING"
                             else:
                                 print("No Save File Found!")
+                        elif opt == "Replay Flight":
+                            _import_game()
+                            path = latest_recording(data_dir)
+                            if path is None: print("No Flight Recording Found!")
+                            elif start_replay(path): game_state = "PLAYING"
                         elif opt == "Resume":
                             game_state = "PLAYING"
                         elif opt == "Save Game":
-                            save_game(sav_path, time_elapsed, ship, camera); game_state = "PLAYING"
+                            worker.save(writer, sav_path, camera)
+                            game_state = "PLAYING"
+                        elif opt == "Export JSON":
+                            worker.save(writer, json_path, camera)
+                            game_state = "PLAYING"
                         elif opt == "Quit to Menu":
+                            if replay_only: leave_replay()
                             game_state = "MAIN_MENU";
-                            menu_options = ["New Game", "Load Game", "Quit"];
+                            menu_options = main_menu;
                             selected_idx = 0
                         elif opt == "Quit":
                             running = False
@@ -175,7 +210,8 @@ def main():
             elif game_state == "PLAYING":
                 if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
                     game_state = "PAUSED";
-                    menu_options = ["Resume", "Save Game", "Quit to Menu"];
+                    menu_options = ["Resume", "Quit to Menu"] if replay_only else \
+                        ["Resume", "Save Game", "Export JSON", "Quit to Menu"];
                     selected_idx = 0
 
                 elif event.type == pygame.MOUSEWHEEL:
@@ -184,19 +220,13 @@ def main():
 
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     if event.button == 1:
-                        mx, my = event.pos
-                        sx, sy = camera.apply(ship.x, ship.y)
+                        hit = renderer.pick(*event.pos)
                         # 点击飞船本身即可切换UI显示
-                        if math.hypot(mx - sx, my - sy) <= 20:
-                            ship.show_ui = not ship.show_ui
-                        else:
-                            for body in all_bodies:
-                                bx, by = camera.apply(body.x, body.y)
-                                render_r = max(int(body.render_size), int(body.body_radius * camera.scale))
-                                if math.hypot(mx - bx, my - by) <= render_r + 15:
-                                    camera.target = body;
-                                    camera.reset_offset()
-                                    break
+                        if isinstance(hit, ShipFrame):
+                            worker.submit(lambda sim: setattr(sim.ship, "show_ui", not sim.ship.show_ui))
+                        elif hit is not None:
+                            camera.target = hit;
+                            camera.reset_offset()
                     elif event.button == 3:
                         is_panning = True
 
@@ -206,11 +236,32 @@ def main():
                     camera.offset_x -= event.rel[0] / camera.scale
                     camera.offset_y -= event.rel[1] / camera.scale
 
+                elif event.type == pygame.KEYDOWN and replay is not None and event.key in replay_keys:
+                    replay.control(replay_keys[event.key])
+
                 elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_RIGHTBRACKET:
-                        time_scale = min(time_scale * 2.0, 1000000.0)
+                    if event.key == pygame.K_r:
+                        # 回放期间物理线程暂停，录像不会被改写
+                        if replay_only: leave_replay()
+                        elif replay is not None: replay = None
+                        elif len(worker.recorder): replay = Replay(worker.recorder)
+                    elif event.key == pygame.K_RIGHTBRACKET:
+                        worker.submit(lambda sim: setattr(sim, "time_scale", min(sim.time_scale * 2.0, MAX_TIME_SCALE)))
                     elif event.key == pygame.K_LEFTBRACKET:
-                        time_scale = max(time_scale / 2.0, 1.0)
+                        worker.submit(lambda sim: setattr(sim, "time_scale", max(sim.time_scale / 2.0, 1.0)))
+                    elif event.key == pygame.K_F3:
+                        show_profile = not show_profile
+                        if show_profile and not PROFILER.enabled: PROFILER.reset()
+                        PROFILER.enabled = show_profile or PROFILER.export is not None
+                    elif event.key == pygame.K_F4:
+                        if PROFILER.export: PROFILER.stop_export()
+                        else: print("Profiling to", PROFILER.start_export(
+                            os.path.join(base_dir, "Data", time.strftime("profile-%Y%m%d-%H%M%S.csv"))))
+                        PROFILER.enabled = show_profile or PROFILER.export is not None
+                    elif event.key == pygame.K_i:
+                        names = list(INTEGRATORS)
+                        worker.submit(lambda sim: sim.set_integrator(
+                            names[(names.index(sim.integrator.name) + 1) % len(names)]))
                     elif event.key == pygame.K_1:
                         camera.view_level = 0;
                         camera.target = None;
@@ -218,129 +269,103 @@ def main():
                         camera.scale = 1e-8
                     elif event.key == pygame.K_2:
                         camera.view_level = 1;
-                        camera.target = stars[0];
+                        camera.target = snap.stars[0];
                         camera.reset_offset();
                         camera.scale = 2e-6
                     elif event.key == pygame.K_4:
                         camera.view_level = 3;
-                        camera.target = min(all_bodies, key=lambda b: math.hypot(ship.x - b.x, ship.y - b.y))
+                        camera.target = snap.nearest(snap.ship.x, snap.ship.y)
                         camera.reset_offset();
                         camera.scale = 0.002
+                    elif event.key == pygame.K_p and (snap.plan is not None or camera.target):
+                        # 有计划时取消；否则在会合窗口内搜索飞往所看天体的最省 Δv 转移，由自动驾驶按时点火
+                        if snap.plan is not None: worker.submit(lambda sim: sim.fleet.follow(sim.player, None))
+                        else:
+                            target = camera.target
+                            worker.submit(lambda sim: sim.plan_transfer(target)).add_done_callback(
+                                lambda f: f.exception() is None and f.result() is None and
+                                print("No transfer to", target.name))
                     elif event.key == pygame.K_RETURN and camera.target:
-                        ship.autopilot_target = None if ship.autopilot_target == camera.target else camera.target
+                        target = camera.target
+                        worker.submit(lambda sim: setattr(sim.ship, "autopilot_target",
+                                                          None if sim.ship.autopilot_target == target else target))
 
         if game_state != "PLAYING":
-            draw_menus(screen, game_state, menu_options, selected_idx)
+            renderer.draw_menus(game_state, menu_options, selected_idx)
             pygame.display.flip()
+            if first_frame:
+                print(f"First frame in {(time.perf_counter() - _STARTED) * 1000:.0f} ms")
+                # 单核机器上导入 engine 会和画第一帧抢 CPU，所以等第一帧出来再开始预载
+                if worker is None: pending = preload(uni_path, shp_path)
+                first_frame = False
             clock.tick(FPS)
             continue
 
-        # ================= 飞控系统 =================
-        keys = pygame.key.get_pressed()
-        max_accel = ship.thrust / ship.mass
-        ship.turn_cmd, ship.thrust_percent, accel_val = 0, 0.0, 0.0
-
-        if keys[pygame.K_LEFT] or keys[pygame.K_RIGHT] or keys[pygame.K_UP]:
-            ship.autopilot_target, ship.ap_state = None, "MANUAL"
-            if keys[pygame.K_LEFT]:  ship.heading -= 0.05; ship.turn_cmd = -1
-            if keys[pygame.K_RIGHT]: ship.heading += 0.05; ship.turn_cmd = 1
-            if keys[pygame.K_UP]:    ship.thrust_percent, accel_val = 1.0, max_accel
-
-        elif ship.autopilot_target:
-            target = ship.autopilot_target
-            rel_x, rel_y = target.x - ship.x, target.y - ship.y
-            dist = math.hypot(rel_x, rel_y)
-            sync_dist = max(target.body_radius * 1.5, 100.0)
-
-            ur_x, ur_y = rel_x / dist, rel_y / dist
-            ut_x, ut_y = -ur_y, ur_x
-            v_tan_mag = math.sqrt(G * target.mass / max(dist, 1.0))
-
-            # 平滑径向靠近速度，防止震荡
-            v_rad_desired = 0.05 * (dist - sync_dist)
-            max_app_speed = math.sqrt(max(0, 2 * max_accel * abs(dist - sync_dist))) * 0.5
-            v_rad_desired = max(-max_app_speed, min(max_app_speed, v_rad_desired))
-
-            tvx, tvy = target.get_velocity()
-            desired_vx, desired_vy = tvx + v_tan_mag * ut_x + v_rad_desired * ur_x, tvy + v_tan_mag * ut_y + v_rad_desired * ur_y
-            dvx, dvy = desired_vx - ship.vx, desired_vy - ship.vy
-            dv_mag = math.hypot(dvx, dvy)
-
-            # --- 优化2：更强大的高倍速容差捕捉机制 ---
-            # 速度误差放宽至 0.5 km/s，距离误差放宽至目标半径的 20%
-            if dv_mag < 0.5 and abs(dist - sync_dist) < target.body_radius * 0.2:
-                ship.ap_state = "STABLE ORBIT"
-                ship.thrust_percent, ship.turn_cmd = 0.0, 0
-                # 瞬间将其绝对锁定在完美圆形轨道上
-                ship.x, ship.y = target.x - ur_x * sync_dist, target.y - ur_y * sync_dist
-                ship.vx, ship.vy = tvx + v_tan_mag * ut_x, tvy + v_tan_mag * ut_y
-                ship.heading = math.atan2(ship.vy - tvy, ship.vx - tvx)
-            else:
-                target_heading = math.atan2(dvy, dvx)
-                angle_diff = (target_heading - ship.heading + math.pi) % (2 * math.pi) - math.pi
-
-                # 如果时间加速开启（流速很快），允许飞船瞬间完成姿态调整，防止因错过窗口而卡住
-                turn_speed = 0.1 if time_scale < 50 else math.pi
-
-                if abs(angle_diff) > turn_speed:
-                    ship.heading += turn_speed * (1 if angle_diff > 0 else -1)
-                    ship.turn_cmd, ship.ap_state = 1 if angle_diff > 0 else -1, "ALIGNING"
-                else:
-                    ship.heading, ship.turn_cmd = target_heading, 0
-                    if abs(angle_diff) < 0.2:
-                        ship.ap_state = "TRANSFER BURN" if dist > sync_dist * 2 else "ORBIT INSERTION"
-                        actual_accel = min(max_accel, dv_mag * 0.5, dv_mag / max(dt, 0.001))
-                        ship.thrust_percent, accel_val = actual_accel / max_accel, actual_accel
-
-        thrust_x, thrust_y = math.cos(ship.heading) * accel_val, math.sin(ship.heading) * accel_val
-
-        # ================= 物理引擎更新 =================
-        time_elapsed += dt
-        for star in stars: star.set_time(time_elapsed)
-
-        if dt > 0:
-            physics_steps = max(1, int(dt / 3600))
-            sim_dt = dt / physics_steps
-            for _ in range(physics_steps):
-                ax, ay = compute_gravity(ship.x, ship.y, all_bodies)
-                ship.vx += (ax + thrust_x) * sim_dt
-                ship.vy += (ay + thrust_y) * sim_dt
-                ship.x += ship.vx * sim_dt
-                ship.y += ship.vy * sim_dt
-
-        # ================= 渲染画面 =================
-        screen.fill((5, 5, 15))
-
-        for body in all_bodies:
-            if body.parent:
-                cx, cy = camera.apply(body.parent.x, body.parent.y)
-                radius = int(body.orbit_radius * camera.scale)
-                if 2 < radius < 8000: pygame.draw.circle(screen, COLORS["dark_gray"], (cx, cy), radius, 1)
-
-        draw_trajectory(screen, ship, all_bodies, camera)
+        if time.perf_counter() >= next_autosave and replay is None:
+            worker.save(writer, auto_path, camera)
+            next_autosave = time.perf_counter() + AUTOSAVE_INTERVAL
+        if writer.error: print("Save failed:", writer.error); writer.error = None
+        PROFILER.lap("events")
+        # ================= 输入送往物理线程 =================
+        if replay is None:
+            keys = pygame.key.get_pressed()
+            pressed = (keys[pygame.K_LEFT], keys[pygame.K_RIGHT], keys[pygame.K_UP])
+            if pressed != controls: worker.set_controls(*pressed); controls = pressed
+            # 镜头中心与所看天体也算激活点：远处星系的行星/卫星只在看向它或飞船靠近时才载入
+            focus = [camera.center()] + ([snap.position(camera.target)] if camera.target else [])
+            worker.set_focus(focus)
+        else:
+            # 回放：飞船状态取自录像，天体按星历摆到同一时刻，不重新模拟
+            snap = snap.replayed(replay.advance(clock.get_time() / 1000.0), replay.sample())
+            camera.locate = snap.position
+        PROFILER.lap("input")
 
-        for body in all_bodies:
-            sx, sy = camera.apply(body.x, body.y)
-            render_r = max(int(body.render_size), int(body.body_radius * camera.scale))
-            if body == camera.target: pygame.draw.circle(screen, COLORS["green"], (sx, sy), render_r + 4, 1)
-            pygame.draw.circle(screen, body.color, (sx, sy), render_r)
-            if camera.scale > 1e-6: screen.blit(font.render(body.name, True, COLORS["white"]),
-                                                (sx + render_r + 5, sy - 10))
+        # ================= 渲染画面（只读快照） =================
+        screen.fill((5, 5, 15))
+        ship = snap.ship
 
-        draw_ship(screen, ship, camera, ui_font)
+        hover = renderer.pick(*pygame.mouse.get_pos())
+        if replay: renderer.draw_trails(replay.recorder, replay.start, replay.t, camera, snap.player)
+        renderer.draw_scene(snap, camera)
+        PROFILER.lap("scene")
 
         ui_texts = [
             f"Mode: {['1: Uni', '2: Sol', '3: Sys', '4: Tgt'][camera.view_level]} (ESC for Menu)",
             f"Target: {camera.target.name if camera.target else 'ALL'} (L-Click)",
-            f"Time Scale: {time_scale}x (Keys [ and ])",
-            f"Spd: {math.hypot(ship.vx, ship.vy):.2f} km/s"
+            f"Time Scale: {snap.time_scale}x (Keys [ and ])",
+            f"Spd: {math.hypot(ship.vx, ship.vy):.2f} km/s",
+            f"Integrator: {'ON RAILS' if ship.on_rails else snap.integrator} (I) "
+            f"{snap.last_steps} steps / {snap.last_evals} evals",
+            f"Physics: {snap.sim_rate:.3g} sim s/s, lag {snap.lag * 1000:.0f} ms (F3 profile, F4 record)"
         ]
-        for i, text in enumerate(ui_texts):
-            screen.blit(font.render(text, True, COLORS["green"]), (10, 10 + i * 22))
+        if replay: ui_texts.append(f"REPLAY t={replay.t:.0f} s, {replay.speed:.3g}x{'' if replay.playing else ' (paused)'}"
+                                   f" (Space, [ ], Backspace reverse, Left/Right scrub, "
+                                   f"R to {'leave' if replay_only else 'resume'})")
+        else: ui_texts.append("R: replay flight recording")
+        if snap.forecast is not None and len(snap.forecast.t) > 1:
+            upcoming = [describe_event(e, snap.time_elapsed) for e in snap.forecast.events if e.t >= snap.time_elapsed]
+            span = (snap.forecast.t[-1] - snap.time_elapsed) / 86400
+            ui_texts.append(f"Forecast {span:.1f} d: " + (", ".join(upcoming[:2]) or "no encounters"))
+        contacts = [c for c in snap.contacts if c.ship == snap.player]
+        if contacts: ui_texts.append("Contact: " + describe_contact(contacts[-1], snap.time_elapsed))
+        if snap.plan is not None: ui_texts.append(f"Plan: {ship.ap_state} -> {snap.plan.target.name} (P cancel)")
+        elif camera.target: ui_texts.append("P: plan transfer to target, Enter: greedy autopilot")
+        renderer.draw_hud(ui_texts)
+        if hover is not None and not is_panning: renderer.draw_tooltip(hover, pygame.mouse.get_pos())
+        if show_profile: renderer.draw_profile(PROFILER)
+        if snap.plan is not None and snap.plan.dv is not None and replay is None:
+            renderer.draw_porkchop(snap.plan, snap.time_elapsed)  # 读档恢复的计划没有 porkchop 网格
+        PROFILER.lap("hud")
 
         pygame.display.flip()
+        PROFILER.lap("flip")
+        PROFILER.end_frame("render")
         clock.tick(FPS)
 
+    if worker: worker.stop()
+    if writer: writer.stop()
+    if planner: planner.shutdown()
+    PROFILER.stop_export()
     pygame.quit()
 
 
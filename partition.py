@@ -0,0 +1,229 @@
+# partition.py
+"""分区并行模拟：各 <Solar> 星系之间在我们的尺度上引力互不相干，于是把每个星系（天体 + 边界内的全部飞船）
+分给一个工作进程各自推进。飞船状态放在共享内存里，主进程每帧只给每个进程发一条短消息；
+飞船越过星系边界（Galaxy 的激活半径）时在帧间移交给新的分区。不在任何星系内的飞船由主进程
+在只含各恒星的星际分区里推进，与工作进程同时进行。供无窗口的批量运行使用（headless --partitioned）"""
+import multiprocessing
+import os
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+from engine import Contact, Fleet, Galaxy, Ship, Simulation
+from profiler import PROFILER
+
+# 共享内存里每个字段一行、每艘飞船一列；整数字段（自动驾驶状态、目标的全局行号、所属星系）也存成 float64
+FIELDS = ("x", "y", "vx", "vy", "heading", "thrust_percent", "ap_code", "target", "system")
+ROW = {name: k for k, name in enumerate(FIELDS)}
+KINEMATIC = ("x", "y", "vx", "vy", "heading", "thrust_percent")
+
+
+class _Partition:
+    """一个分区：一张天体表（rows 为各天体的全局行号）+ 其中飞船组成的 Simulation。
+    成员变化时按共享状态重建编队；proxy(row) 给出不在表内的目标由哪个天体代替（没有则为 -1）"""
+
+    def __init__(self, bodies, rows, proxy=None):
+        self.bodies, self.rows = bodies, np.asarray(rows, dtype=np.int64)
+        self.local = {r: i for i, r in enumerate(self.rows.tolist())}
+        self.proxy = proxy or (lambda row: -1)
+        self.members, self.sim = np.zeros(0, dtype=np.int64), None
+
+    def _map(self, rows):
+        return np.array([-1 if r < 0 else self.local.get(r, self.proxy(r)) for r in rows.astype(np.int64).tolist()],
+                        dtype=np.int64)
+
+    def _rebuild(self, state, members, ships, t0, integrator):
+        self.members, self.sim = members, None
+        if not len(members): return
+        names, mass, thrust = ships
+        fleet = Fleet([Ship(names[i], 0.0, 0.0, thrust[i], mass[i], "cyan") for i in members.tolist()], self.bodies)
+        for name in KINEMATIC: getattr(fleet, name)[:] = state[ROW[name], members]
+        fleet.ap_code[:] = state[ROW["ap_code"], members]
+        fleet.target[:] = self._map(state[ROW["target"], members])
+        self.sim = Simulation(self.bodies.roots, self.bodies, fleet, 0, t0, integrator)
+
+    def step(self, state, members, ships, t0, t1, time_scale, integrator):
+        """把成员推进到 t1 并写回共享状态；返回 (步数, 引力求值次数, 接触事件)。
+        接触事件为 Contact 的元组形式，飞船与天体换成全局下标/行号，便于跨进程传回"""
+        if self.sim is None or not np.array_equal(members, self.members):
+            self._rebuild(state, members, ships, t0, integrator)
+        sim = self.sim
+        if sim is None: return 0, 0, []
+        if sim.integrator.name != integrator: sim.set_integrator(integrator)
+        sim.time_scale, steps, evals, contacts = time_scale, 0, 0, []
+        while t1 - sim.time_elapsed > 1e-9 * max(1.0, abs(t1)):  # 计划点火与推力会把一帧切成几步
+            steps += sim.step(t1 - sim.time_elapsed)
+            evals += sim.last_evals
+            contacts += [(c.t, c.kind, int(self.members[c.ship]), int(self.rows[c.body._index]), c.distance, c.speed)
+                         for c in sim.contacts]
+        fleet = sim.fleet
+        for name in KINEMATIC: state[ROW[name], members] = getattr(fleet, name)
+        state[ROW["ap_code"], members] = fleet.ap_code
+        # 目标：分区内的改动写回全局行号；由代替天体追踪的别处目标保持原样
+        target = state[ROW["target"], members]
+        keep = fleet.target == self._map(target)
+        state[ROW["target"], members] = np.where(keep, target, np.where(fleet.target >= 0,
+                                                                        self.rows[fleet.target], -1))
+        return steps, evals, contacts
+
+
+class _Server:
+    """推进一组星系的全部分区；工作进程里一份，串行时在主进程里一份"""
+
+    def __init__(self, galaxy, systems, ships):
+        self.galaxy, self.systems, self.ships = galaxy, np.asarray(systems, dtype=np.int64), ships
+        self.parts = {}
+
+    def step(self, state, t0, t1, time_scale, integrator):
+        system = state[ROW["system"]]
+        mine = np.flatnonzero(np.isin(system, self.systems))
+        mine = mine[np.argsort(system[mine], kind="stable")]
+        keys, starts = np.unique(system[mine].astype(np.int64), return_index=True)
+        groups = dict(zip(keys.tolist(), np.split(mine, starts[1:])))
+        steps, evals, contacts = 0, 0, []
+        for k in set(groups) | set(self.parts):
+            part = self.parts.get(k)
+            if part is None:
+                bounds = self.galaxy.bounds
+                part = self.parts[k] = _Partition(self.galaxy.detached(k), range(bounds[k], bounds[k + 1]))
+            s, e, c = part.step(state, groups.get(k, np.zeros(0, dtype=np.int64)), self.ships, t0, t1, time_scale,
+                                integrator)
+            steps, evals, contacts = steps + s, evals + e, contacts + c
+            if part.sim is None: del self.parts[k]  # 空星系不留天体表
+        return steps, evals, contacts
+
+
+def _serve(conn, shm_name, n, cols, systems, ships):
+    """工作进程入口：按主进程的消息 (t0, t1, time_scale, integrator) 推进，回复 (步数, 求值次数, 接触事件)；None 退出"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        state = np.ndarray((len(FIELDS), n), dtype=np.float64, buffer=shm.buf)
+        server = _Server(Galaxy(cols), systems, ships)
+        while True:
+            msg = conn.recv()
+            if msg is None: break
+            try: conn.send(server.step(state, *msg))
+            except Exception: conn.send(("error", traceback.format_exc()))
+        del state
+    finally:
+        shm.close()
+
+
+class PartitionedSimulation:
+    """按星系分区推进 sim（须由 new_simulation 载入，带 Galaxy）；接口与 Simulation.step 相同，
+    每帧结束把飞船状态同步回 sim，其余属性直接读 sim。workers <= 1 时全部分区在本进程串行推进。
+    转移计划与玩家操控不跨进程，此模式下不可用；自动驾驶目标在别的星系时，星际分区以其恒星代替，
+    星系分区内则等飞船进入目标所在星系后才继续"""
+
+    def __init__(self, sim, workers=None):
+        galaxy = sim.galaxy
+        if galaxy is None: raise ValueError("partitioned stepping needs a paged galaxy (new_simulation)")
+        self.sim, self.galaxy, fleet = sim, galaxy, sim.fleet
+        n, count = len(fleet), len(galaxy.stars)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, len(FIELDS) * n * 8))
+        self.state = np.ndarray((len(FIELDS), n), dtype=np.float64, buffer=self.shm.buf)
+        for name in KINEMATIC: self.state[ROW[name]] = getattr(fleet, name)
+        self.state[ROW["ap_code"]] = fleet.ap_code
+        self.state[ROW["target"]] = [galaxy.row(fleet.bodies[t].name) if t >= 0 else -1 for t in fleet.target.tolist()]
+        self.state[ROW["system"]] = galaxy.locate(fleet.x, fleet.y)
+        self._targets = self.state[ROW["target"]].copy()
+        self.handovers = 0
+        self.ships = ships = ([s.name for s in fleet.ships], fleet.mass.copy(), fleet.thrust.copy())
+
+        # 按初始飞船数分配星系（大的先分给当前最闲的进程），空星系也轮流分下去
+        self.workers = workers = max(1, min(workers or os.cpu_count() or 1, count))
+        system = self.state[ROW["system"]].astype(np.int64)
+        load = np.bincount(system[system >= 0], minlength=count) + 1e-3
+        assign, total = [[] for _ in range(workers)], np.zeros(workers)
+        for k in np.argsort(-load, kind="stable").tolist():
+            w = int(np.argmin(total))
+            assign[w].append(k)
+            total[w] += load[k]
+        self.local, self.conns, self.procs = None, [], []
+        if workers == 1: self.local = _Server(galaxy, assign[0], ships)
+        else:
+            ctx = multiprocessing.get_context("spawn")
+            for systems in assign:
+                conn, child = ctx.Pipe()
+                p = ctx.Process(target=_serve, args=(child, self.shm.name, n, galaxy.cols, systems, ships),
+                                name="partition", daemon=True)
+                p.start()
+                self.conns.append(conn)
+                self.procs.append(p)
+        # 星际分区：只有各恒星，别的星系里的目标以其恒星代替
+        star_rows = galaxy.star_rows
+        self.interstellar = _Partition(galaxy.detached(), star_rows,
+                                       lambda row: int(np.searchsorted(star_rows, row, side="right")) - 1)
+
+    def __getattr__(self, name):
+        if name == "sim": raise AttributeError(name)
+        return getattr(self.sim, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def step(self, dt, left=False, right=False, up=False):
+        """所有分区同时推进 dt；返回数值积分步数，引力求值次数记在 last_evals，接触事件记在 contacts"""
+        sim, t0 = self.sim, self.sim.time_elapsed
+        msg = (t0, t0 + dt, sim.time_scale, sim.integrator.name)
+        with PROFILER.scope("partition.step"):
+            for conn in self.conns: conn.send(msg)
+            steps, evals, contacts = self.local.step(self.state, *msg) if self.local is not None else (0, 0, [])
+            s, e, c = self.interstellar.step(self.state, np.flatnonzero(self.state[ROW["system"]] < 0), self.ships,
+                                             *msg)
+            steps, evals, contacts = steps + s, evals + e, contacts + c
+            for conn in self.conns:
+                reply = conn.recv()
+                if reply[0] == "error": raise RuntimeError(f"partition worker failed:\n{reply[1]}")
+                steps, evals, contacts = steps + reply[0], evals + reply[1], contacts + reply[2]
+        with PROFILER.scope("partition.handover"): self._handover()
+        with PROFILER.scope("partition.sync"): self._sync(t0 + dt)
+        sim.last_steps, sim.last_evals = steps, evals
+        names = self.galaxy.cols["name"]
+        sim.contacts = [Contact(t, kind, ship, self.galaxy.find(names[row]), distance, speed)
+                        for t, kind, ship, row, distance, speed in sorted(contacts)]
+        PROFILER.count("substeps", steps)
+        PROFILER.count("gravity_evals", evals)
+        return steps
+
+    def _handover(self):
+        """越出所属星系边界的飞船（以及星际空间里的全部飞船）重新定位；所属星系变了即在下一帧移交"""
+        g, state = self.galaxy, self.state
+        system = state[ROW["system"]].astype(np.int64)
+        x, y = state[ROW["x"]], state[ROW["y"]]
+        inside = np.flatnonzero(system >= 0)
+        k = system[inside]
+        out = inside[(x[inside] - g.x[k]) ** 2 + (y[inside] - g.y[k]) ** 2 > g.activation[k] ** 2]
+        check = np.concatenate([out, np.flatnonzero(system < 0)])
+        if not len(check): return
+        new = g.locate(x[check], y[check])
+        moved = new != system[check]
+        state[ROW["system"], check[moved]] = new[moved]
+        self.handovers += int(np.count_nonzero(moved))
+        PROFILER.count("handovers", int(np.count_nonzero(moved)))
+
+    def _sync(self, t):
+        """把共享状态写回 sim：编队数组、时间，以及按飞船位置分页后的天体表"""
+        sim, fleet, state = self.sim, self.sim.fleet, self.state
+        for name in KINEMATIC: getattr(fleet, name)[:] = state[ROW[name]]
+        fleet.ap_code[:] = state[ROW["ap_code"]]
+        sim.time_elapsed = t
+        sim.page()
+        sim.all_bodies.set_time(t)
+        target = state[ROW["target"]]
+        for i in np.flatnonzero(target != self._targets).tolist():
+            row = int(target[i])
+            fleet.target[i] = fleet._body_index(self.galaxy.find(self.galaxy.cols["name"][row])) if row >= 0 else -1
+        self._targets = target.copy()
+
+    def close(self):
+        for conn in self.conns: conn.send(None)
+        for p in self.procs: p.join()
+        self.conns, self.procs = [], []
+        if self.shm is not None:
+            del self.state
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
@@ -0,0 +1,143 @@
+# planner.py
+"""转移窗口规划（porkchop 搜索）：在 出发时刻 × 飞行时长 的网格上批量求解 Lambert 问题，
+找出总 Δv 最小的转移，并保留整张 Δv 网格供绘制。大网格按出发时刻分块交给进程池并行求解。
+本模块只依赖 numpy（子进程导入很快）；天体与飞船的状态由调用方以 t -> (x, y, vx, vy) 的函数给出"""
+import math
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+PARALLEL_MIN_CELLS = 1 << 14  # 网格小于此格数时在本进程求解，进程间传输反而更慢
+
+# origin 为 None 表示从飞船当前轨道直接出发；v_depart 为出发时相对中心天体的转移速度，
+# v_inf 为出发点火量（相对 origin 的双曲剩余速度，或相对飞船自身速度的 Δv）；dv_depart 为出发点火的 Δv
+# （从停泊轨道出发时已换算成逃逸双曲线所需的量）。dv 为 (len(departures), len(durations)) 的总 Δv 网格，无解处为 inf
+TransferPlan = namedtuple("TransferPlan", "origin target central t_depart t_arrive v_depart v_inf "
+                                          "dv_depart dv_arrive departures durations dv")
+
+_pool = None
+
+
+def stumpff(z):
+    """Stumpff 函数 C(z)、S(z)，z 可为任意形状的数组"""
+    z = np.asarray(z, dtype=np.float64)
+    s = np.sqrt(np.abs(z))
+    with np.errstate(all="ignore"):
+        c = np.where(z > 1e-8, (1 - np.cos(s)) / z, np.where(z < -1e-8, (np.cosh(s) - 1) / -z, 0.5 - z / 24))
+        s3 = s ** 3
+        st = np.where(z > 1e-8, (s - np.sin(s)) / s3, np.where(z < -1e-8, (np.sinh(s) - s) / s3, 1 / 6 - z / 120))
+    return c, st
+
+
+def lambert(mu, r1x, r1y, r2x, r2y, tof, iterations=60):
+    """二维单圈顺行（逆时针）Lambert 问题，全部参数（含 mu）按 numpy 规则广播。
+    普适变量法，对 z 二分求解（单圈时飞行时间随 z 单调递增）。返回 (v1x, v1y, v2x, v2y)，无解处为 NaN"""
+    mu, r1x, r1y, r2x, r2y, tof = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64)
+                                                       for v in (mu, r1x, r1y, r2x, r2y, tof)))
+    r1, r2 = np.hypot(r1x, r1y), np.hypot(r2x, r2y)
+    with np.errstate(all="ignore"):
+        cos_dth = np.clip((r1x * r2x + r1y * r2y) / (r1 * r2), -1.0, 1.0)
+        dth = np.arccos(cos_dth)
+        dth = np.where(r1x * r2y - r1y * r2x >= 0, dth, 2 * math.pi - dth)
+        a = np.sin(dth) * np.sqrt(r1 * r2 / (1 - cos_dth))
+        sqrt_mu = np.sqrt(mu)
+        lo, hi = np.full(a.shape, -4 * math.pi ** 2 * 10), np.full(a.shape, 4 * math.pi ** 2 - 1e-9)
+
+        def residual(z):
+            c, s = stumpff(z)
+            y = r1 + r2 + a * (z * s - 1) / np.sqrt(c)
+            # y < 0 只出现在 z 过小的一侧（飞行时间不够），记为负
+            return np.where(y > 0, (np.maximum(y, 0) / c) ** 1.5 * s + a * np.sqrt(np.maximum(y, 0)) - sqrt_mu * tof,
+                            -1.0), y
+
+        for _ in range(iterations):
+            z = 0.5 * (lo + hi)
+            f, _ = residual(z)
+            short = f < 0
+            lo, hi = np.where(short, z, lo), np.where(short, hi, z)
+        z = 0.5 * (lo + hi)
+        f, y = residual(z)
+        c, _ = stumpff(z)
+        ok = (np.abs(a) > 1e-9 * (r1 + r2)) & (y > 0) & (np.abs(f) < 1e-6 * sqrt_mu * tof) & (tof > 0)
+        f_, g, gdot = 1 - y / r1, a * np.sqrt(y / mu), 1 - y / r2
+        v1x, v1y = (r2x - f_ * r1x) / g, (r2y - f_ * r1y) / g
+        v2x, v2y = (gdot * r2x - r1x) / g, (gdot * r2y - r1y) / g
+    return tuple(np.where(ok, v, np.nan) for v in (v1x, v1y, v2x, v2y))
+
+
+def escape_velocity(mu, rx, ry, rvx, rvy, vinf_x, vinf_y):
+    """相对出发天体位于 (rx, ry)、当前速度 (rvx, rvy) 时，出射渐近线沿 v_inf、剩余速度为 |v_inf| 的双曲线在该点的速度。
+    由偏心率矢量 e = (h v∞/μ) n - u（u 为渐近线方向，n 为其顺时针法向）与 e·r = h²/μ - r
+    得角动量 h 的二次方程，取与当前绕行方向相同的根，再由 v = (μ/h) z × (e + r̂) 求速度"""
+    r, v_inf = np.hypot(rx, ry), np.hypot(vinf_x, vinf_y)
+    ux, uy = vinf_x / v_inf, vinf_y / v_inf
+    n_r, u_r = uy * rx - ux * ry, ux * rx + uy * ry
+    root = np.sqrt(v_inf * v_inf * n_r * n_r - 4 * mu * (u_r - r))
+    h = (v_inf * n_r + np.where(rx * rvy - ry * rvx >= 0, root, -root)) / 2
+    ex, ey = h * v_inf / mu * uy - ux + rx / r, -h * v_inf / mu * ux - uy + ry / r  # e + r̂
+    return -mu / h * ey, mu / h * ex
+
+
+def aim_offset(mu, periapsis, vinf_x, vinf_y):
+    """以剩余速度 v_inf 飞近天体、要在 periapsis 处逆时针掠过时，瞄准点相对天体中心的偏移（碰撞参数 b 沿 v_inf 的右法向）"""
+    v_inf = np.hypot(vinf_x, vinf_y)
+    b = periapsis * np.sqrt(1 + 2 * mu / (periapsis * v_inf * v_inf))
+    return b * vinf_y / v_inf, -b * vinf_x / v_inf
+
+
+def _solve_block(mu, start, arrive, tof):
+    """一块网格：start 为各出发时刻的 4 个 (rows, 1) 数组，arrive 为到达状态的 4 个 (rows, cols) 数组；
+    返回 (出发 Δv, 到达 Δv)"""
+    (x1, y1, vx1, vy1), (x2, y2, vx2, vy2) = start, arrive
+    v1x, v1y, v2x, v2y = lambert(mu, x1, y1, x2, y2, tof)
+    return np.hypot(v1x - vx1, v1y - vy1), np.hypot(vx2 - v2x, vy2 - v2y)
+
+
+def _executor(workers):
+    """常驻进程池；spawn 启动，不会把物理、渲染线程的状态 fork 进子进程"""
+    global _pool
+    if _pool is None or _pool._max_workers != workers:
+        shutdown()
+        _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None: _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+
+def porkchop(mu, start, arrive, departures, durations, workers=None):
+    """start(t) / arrive(t)：出发点与目标相对中心天体的状态（接受时间数组）。
+    返回 (出发 Δv, 到达 Δv) 两张 (len(departures), len(durations)) 网格，无解处为 NaN"""
+    departures, durations = np.asarray(departures, dtype=np.float64), np.asarray(durations, dtype=np.float64)
+    t_arr = departures[:, None] + durations[None, :]
+    s = [np.asarray(v)[:, None] for v in start(departures)]
+    a = [np.asarray(v).reshape(t_arr.shape) for v in arrive(t_arr.ravel())]
+    tof = np.broadcast_to(durations, t_arr.shape)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or t_arr.size < PARALLEL_MIN_CELLS: return _solve_block(mu, s, a, tof)
+
+    rows = np.array_split(np.arange(len(departures)), min(workers * 2, len(departures)))
+    futures = [_executor(workers).submit(_solve_block, mu, [v[r] for v in s], [v[r] for v in a], tof[r])
+               for r in rows if len(r)]
+    parts = [f.result() for f in futures]
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+def search(mu, start, arrive, departures, durations, workers=None):
+    """在网格上找总 Δv 最小的转移；整张网格无解时返回 None。返回的 TransferPlan 中天体字段为空，由调用方填写"""
+    dv_dep, dv_arr = porkchop(mu, start, arrive, departures, durations, workers)
+    total = np.where(np.isfinite(dv_dep + dv_arr), dv_dep + dv_arr, np.inf)
+    if not np.isfinite(total).any(): return None
+    i, j = np.unravel_index(int(np.argmin(total)), total.shape)
+    t_dep, tof = float(departures[i]), float(durations[j])
+    x1, y1, vx1, vy1 = (float(np.asarray(v).ravel()[0]) for v in start(np.array([t_dep])))
+    x2, y2, _, _ = (float(np.asarray(v).ravel()[0]) for v in arrive(np.array([t_dep + tof])))
+    v1x, v1y, _, _ = (float(v) for v in lambert(mu, x1, y1, x2, y2, tof))
+    return TransferPlan(None, None, None, t_dep, t_dep + tof, (v1x, v1y), (v1x - vx1, v1y - vy1),
+                        float(dv_dep[i, j]), float(dv_arr[i, j]), np.asarray(departures), np.asarray(durations),
+                        total)
@@ -0,0 +1,128 @@
+# profiler.py
+"""逐帧性能剖析：命名计时区段 + 计数器，按“通道”（渲染循环、物理线程……）逐帧汇总，
+保留最近 history 帧用于滚动分位数，也可把每帧数据写成 CSV 供离线分析。
+关闭时 scope() 只返回一个共享的空上下文，count() 直接返回，开销可忽略"""
+import csv
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+import numpy as np
+
+_NULL = nullcontext()
+
+
+class _Scope:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler, self.name = profiler, name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        times = self.profiler._frame()[0]
+        times[self.name] = times.get(self.name, 0.0) + (time.perf_counter() - self.start) * 1000.0
+
+
+class Lane:
+    """一个通道最近 history 帧的数据：name -> 每帧的值（毫秒或计数），缺席的帧记 0"""
+
+    def __init__(self, history):
+        self.history, self.frames, self.last = history, 0, None
+        self.times, self.counts = {}, {}
+
+    def push(self, times, counts):
+        for store, values in ((self.times, times), (self.counts, counts)):
+            for name in values.keys() - store.keys(): store[name] = deque(maxlen=self.history)
+            for name, ring in store.items(): ring.append(values.get(name, 0))
+        self.frames += 1
+
+    def percentiles(self, q=(50, 95, 99)):
+        """{name: (p50, p95, p99, ...)}，计时与计数都在内"""
+        return {name: tuple(np.percentile(np.fromiter(ring, dtype=np.float64), q))
+                for store in (self.times, self.counts) for name, ring in store.items() if ring}
+
+
+class Profiler:
+    def __init__(self, history=300):
+        self.enabled, self.history = False, history
+        self.lanes, self.export = {}, None
+        self._local, self._lock = threading.local(), threading.Lock()
+
+    def scope(self, name):
+        """with profiler.scope("sim.step"): ... 计入当前线程本帧的 name 耗时（同名多次累加）"""
+        return _Scope(self, name) if self.enabled else _NULL
+
+    def count(self, name, n=1):
+        if not self.enabled: return
+        counts = self._frame()[1]
+        counts[name] = counts.get(name, 0) + n
+
+    def lap(self, name=None):
+        """顺序阶段计时：自本线程上一次 lap 起的耗时计入 name；name 为 None 时只重设起点"""
+        if not self.enabled: return
+        now, last = time.perf_counter(), getattr(self._local, "lap", None)
+        self._local.lap = now
+        if name and last is not None:
+            times = self._frame()[0]
+            times[name] = times.get(name, 0.0) + (now - last) * 1000.0
+
+    def _frame(self):
+        frame = getattr(self._local, "frame", None)
+        if frame is None: frame = self._local.frame = ({}, {})
+        return frame
+
+    def end_frame(self, lane):
+        """把当前线程累计的区段与计数作为 lane 的一帧提交；另记两次提交之间的墙钟时间 frame"""
+        if not self.enabled: return
+        times, counts = self._frame()
+        self._local.frame = None
+        now = time.perf_counter()
+        with self._lock:
+            ring = self.lanes.get(lane)
+            if ring is None: ring = self.lanes[lane] = Lane(self.history)
+            if ring.last is not None: times["frame"] = (now - ring.last) * 1000.0
+            ring.last = now
+            ring.push(times, counts)
+            if self.export: self.export.write(lane, ring.frames, now, times, counts)
+
+    def summary(self, q=(50, 95, 99)):
+        with self._lock:
+            return {lane: ring.percentiles(q) for lane, ring in self.lanes.items()}
+
+    def reset(self):
+        with self._lock: self.lanes = {}
+
+    def start_export(self, path):
+        """开始把此后每帧的数据写入 CSV（同时打开剖析）；返回路径"""
+        self.stop_export()
+        self.export, self.enabled = CsvExport(path), True
+        return path
+
+    def stop_export(self):
+        if self.export:
+            with self._lock: self.export, export = None, self.export
+            export.close()
+
+
+class CsvExport:
+    """长表格式：lane,frame,t,name,kind,value；kind 为 ms（区段耗时）或 count（计数器）"""
+
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(("lane", "frame", "t", "name", "kind", "value"))
+        self.t0 = time.perf_counter()
+
+    def write(self, lane, frame, now, times, counts):
+        t = f"{now - self.t0:.6f}"
+        self.writer.writerows((lane, frame, t, name, "ms", f"{value:.4f}") for name, value in times.items())
+        self.writer.writerows((lane, frame, t, name, "count", value) for name, value in counts.items())
+
+    def close(self):
+        self.file.close()
+
+
+PROFILER = Profiler()
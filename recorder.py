@@ -0,0 +1,178 @@
+# recorder.py
+"""飞行记录仪：每个物理步把全部飞船的状态追加成定长记录，写进内存映射的环形文件，
+写满后覆盖最旧的样本。回放直接在映射缓冲区上二分查找与插值，不重新模拟；
+轨迹尾迹取的也是缓冲区上的切片视图，不复制数据"""
+import glob
+import os
+import time
+import numpy as np
+
+RECORDER_VERSION = 1
+MAGIC = b"UIFLTREC"
+NAME_BYTES = 32
+HEADER = np.dtype([("magic", "S8"), ("version", "<u4"), ("ships", "<u4"), ("capacity", "<u8"), ("count", "<u8")])
+# 每艘飞船每个样本一条定长记录；align=True 让 float64 字段对齐到 8 字节
+RECORD = np.dtype([("t", "<f8"), ("x", "<f8"), ("y", "<f8"), ("vx", "<f8"), ("vy", "<f8"),
+                   ("heading", "<f4"), ("thrust", "<f4"), ("ap", "i1")], align=True)
+
+
+class FlightRecorder:
+    """names 不为空时新建（覆盖）记录文件，否则以只读方式打开已有文件。
+    capacity 为环形缓冲能容纳的样本数，缺省按 budget 字节与飞船数推算"""
+
+    def __init__(self, path, names=None, capacity=None, budget=64 << 20):
+        self.path = path
+        if names is not None:
+            ships = len(names)
+            capacity = capacity or max(1024, budget // (RECORD.itemsize * max(ships, 1)))
+            offset = self._offset(ships)
+            with open(path, "wb") as f: f.truncate(offset + capacity * ships * RECORD.itemsize)
+            header = np.memmap(path, dtype=HEADER, mode="r+", shape=())
+            header["magic"], header["version"], header["ships"], header["capacity"] = \
+                MAGIC, RECORDER_VERSION, ships, capacity
+            np.memmap(path, dtype=f"S{NAME_BYTES}", mode="r+", offset=HEADER.itemsize, shape=(ships,))[:] = \
+                [n.encode("utf-8")[:NAME_BYTES] for n in names]
+            mode = "r+"
+        else:
+            header = np.memmap(path, dtype=HEADER, mode="r", shape=())
+            if bytes(header["magic"]) != MAGIC: raise ValueError(f"not a flight recording: {path}")
+            if int(header["version"]) > RECORDER_VERSION: raise ValueError(f"recording is too new: {path}")
+            mode = "r"
+        self.header = header
+        self.ships, self.capacity = int(header["ships"]), int(header["capacity"])
+        self.names = [n.decode("utf-8") for n in np.memmap(path, dtype=f"S{NAME_BYTES}", mode="r",
+                                                           offset=HEADER.itemsize, shape=(self.ships,)).tolist()]
+        self.records = np.memmap(path, dtype=RECORD, mode=mode, offset=self._offset(self.ships),
+                                 shape=(self.capacity, self.ships))
+        # 各字段在整个缓冲区上的视图只取一次，记录时按行写入，不再创建新的视图
+        self.t, self.x, self.y, self.vx, self.vy, self.heading, self.thrust, self.ap = \
+            (self.records[k] for k in RECORD.names)
+        self.count = int(header["count"])
+
+    @staticmethod
+    def _offset(ships):
+        """记录区起点：文件头与飞船名表之后，按 64 字节对齐"""
+        return -(-(HEADER.itemsize + ships * NAME_BYTES) // 64) * 64
+
+    @classmethod
+    def for_fleet(cls, path, fleet, **kwargs):
+        return cls(path, [s.name for s in fleet.ships], **kwargs)
+
+    def record(self, t, fleet):
+        row = self.count % self.capacity
+        self.t[row] = t
+        self.x[row], self.y[row], self.vx[row], self.vy[row] = fleet.x, fleet.y, fleet.vx, fleet.vy
+        self.heading[row], self.thrust[row], self.ap[row] = fleet.heading, fleet.thrust_percent, fleet.ap_code
+        self.count += 1
+        self.header["count"] = self.count  # 最后才更新计数，读者不会看到写了一半的样本
+
+    def clear(self):
+        """时间不再单调时（例如读档后）从头记录"""
+        self.count = 0
+        self.header["count"] = 0
+
+    def flush(self):
+        if self.records.mode != "r": self.records.flush(); self.header.flush()
+
+    def refresh(self):
+        """只读打开时重新读取样本数，以跟上仍在写入的记录"""
+        self.count = int(self.header["count"])
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def segments(self):
+        """按时间先后排列的行区间（环形缓冲绕回后为两段）"""
+        if self.count <= self.capacity: return [slice(0, self.count)] if self.count else []
+        head = self.count % self.capacity
+        return [slice(head, self.capacity), slice(0, head)] if head else [slice(0, self.capacity)]
+
+    def _row(self, k):
+        """第 k 个（按时间先后）样本所在的行"""
+        return (k + max(0, self.count - self.capacity)) % self.capacity
+
+    def span(self):
+        n = len(self)
+        if not n: return None
+        return float(self.t[self._row(0), 0]), float(self.t[self._row(n - 1), 0])
+
+    def _locate(self, t):
+        """t 所在的相邻两个样本 (k, k + 1) 中的 k 与插值系数"""
+        n, k = len(self), 0
+        for seg in self.segments():
+            times = self.t[seg, 0]  # 视图
+            i = int(np.searchsorted(times, t, side="right"))
+            k += i
+            if i < len(times): break
+        k = min(max(k - 1, 0), n - 1)
+        if k == n - 1: return k, 0.0
+        t0, t1 = float(self.t[self._row(k), 0]), float(self.t[self._row(k + 1), 0])
+        return k, (min(max((t - t0) / (t1 - t0), 0.0), 1.0) if t1 > t0 else 0.0)
+
+    def sample(self, t):
+        """t 时刻全部飞船的 (x, y, vx, vy, heading, thrust, ap)：位置与速度线性插值，其余取前一个样本"""
+        k, w = self._locate(t)
+        a, b = self._row(k), self._row(min(k + 1, len(self) - 1))
+        lerp = [self.x, self.y, self.vx, self.vy]
+        x, y, vx, vy = (f[a] + (f[b] - f[a]) * w for f in lerp)
+        return x, y, vx, vy, self.heading[a], self.thrust[a], self.ap[a]
+
+    def trail(self, ship, t0, t1, max_points=2000):
+        """ship 在 [t0, t1] 内的轨迹：[(xs, ys), ...] 每段一对缓冲区上的跨步视图，超过 max_points 时均匀抽稀"""
+        parts = []
+        for seg in self.segments():
+            times = self.t[seg, 0]
+            a, b = int(np.searchsorted(times, t0)), int(np.searchsorted(times, t1, side="right"))
+            if b > a: parts.append((seg.start + a, seg.start + b))
+        step = max(1, sum(b - a for a, b in parts) // max_points)
+        return [(self.x[a:b:step, ship], self.y[a:b:step, ship]) for a, b in parts]
+
+
+def new_recording_path(folder, keep=8):
+    """新一段录像的文件名（按开始时间命名，不覆盖以前的录像）；folder 里只保留最近 keep 段，更早的删除"""
+    old = sorted(glob.glob(os.path.join(folder, "flight*.rec")), key=os.path.getmtime)
+    for p in old[:max(0, len(old) - keep + 1)]:
+        try: os.remove(p)
+        except OSError: pass  # 仍被别的进程映射等情况：留到下次再删
+    stamp, n = time.strftime("flight-%Y%m%d-%H%M%S"), 0
+    path = os.path.join(folder, stamp + ".rec")
+    while os.path.exists(path):
+        n += 1
+        path = os.path.join(folder, f"{stamp}-{n}.rec")
+    return path
+
+
+def latest_recording(folder):
+    """folder 里最近的一段录像，没有时返回 None"""
+    found = glob.glob(os.path.join(folder, "flight*.rec"))
+    return max(found, key=os.path.getmtime) if found else None
+
+
+class Replay:
+    """在录像上按任意倍速（可倒放）播放或拖动；speed 为每墙钟秒推进的模拟秒数"""
+
+    def __init__(self, recorder, duration=20.0):
+        self.recorder = recorder
+        self.start, self.end = recorder.span()
+        self.speed = max((self.end - self.start) / duration, 1.0)  # 缺省 duration 秒放完
+        self.t, self.playing = self.start, True
+
+    def control(self, action):
+        if action == "toggle":
+            if not self.playing and self.t >= self.end and self.speed > 0: self.t = self.start
+            self.playing = not self.playing
+        elif action == "faster": self.speed *= 2.0
+        elif action == "slower": self.speed /= 2.0
+        elif action == "reverse": self.speed = -self.speed
+        elif action in ("back", "forward"):
+            self.t += (self.end - self.start) * (0.02 if action == "forward" else -0.02)
+            self.t = min(max(self.t, self.start), self.end)
+
+    def advance(self, wall_dt):
+        if not self.playing: return self.t
+        self.t = min(max(self.t + self.speed * wall_dt, self.start), self.end)
+        if self.t in (self.start, self.end) and (self.t == self.end) == (self.speed > 0): self.playing = False
+        return self.t
+
+    def sample(self):
+        return self.recorder.sample(self.t)
@@ -0,0 +1,352 @@
+# render.py
+"""渲染管线：每帧把所有世界坐标一次性批量变换到屏幕，先按视口剔除再绘制；
+文字与半透明面板渲染成 Surface 后按 (内容, 字体, 颜色) 缓存复用，LRU 淘汰"""
+import json
+import math
+import os
+from collections import OrderedDict
+import numpy as np
+import pygame
+from settings import COLORS, SCREEN_WIDTH, SCREEN_HEIGHT
+from profiler import PROFILER
+
+FONT_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__", "fonts.json")
+
+
+def system_font(name, size, bold=False, cache_path=FONT_CACHE):
+    """与 pygame.font.SysFont 相同，但解析出的字体文件路径缓存在磁盘上：SysFont 每次都要扫描系统字体列表，
+    字体多的机器上很慢。找不到该字体时同样退回 pygame 自带字体（缓存为空路径）；首次调用时才初始化字体模块"""
+    if not pygame.font.get_init(): pygame.font.init()
+    key = f"{name.lower()}:{'bold' if bold else 'regular'}"
+    try:
+        with open(cache_path) as f: paths = json.load(f)
+    except (OSError, ValueError):
+        paths = {}
+    path = paths.get(key)
+    if path is None or (path and not os.path.exists(path)):  # 字体被卸载后重新解析
+        path = paths[key] = pygame.font.match_font(name, bold=bold) or ""
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path + ".tmp", "w") as f: json.dump(paths, f, indent=1)
+            os.replace(cache_path + ".tmp", cache_path)
+        except OSError:
+            pass  # 目录只读时放弃缓存，下次照常扫描
+    font = pygame.font.Font(path or None, size)
+    if bold and not path: font.set_bold(True)
+    return font
+
+
+class SurfaceCache:
+    """按 key 缓存已渲染的 Surface，超出 capacity 时淘汰最久未用的一项"""
+
+    def __init__(self, capacity=1024):
+        self.capacity, self.items = capacity, OrderedDict()
+        self.hits, self.misses = 0, 0
+
+    def get(self, key, build):
+        surf = self.items.get(key)
+        if surf is None:
+            self.misses += 1
+            PROFILER.count("surface_renders")
+            surf = self.items[key] = build()
+            if len(self.items) > self.capacity: self.items.popitem(last=False)
+        else:
+            self.hits += 1
+            self.items.move_to_end(key)
+        return surf
+
+    def text(self, font, string, color):
+        return self.get((string, font, color), lambda: font.render(string, True, color))
+
+    def panel(self, width, height, color):
+        def build():
+            surf = pygame.Surface((width, height), pygame.SRCALPHA)
+            surf.fill(color)
+            return surf
+        return self.get(("panel", width, height, color), build)
+
+
+def _on_screen(sx, sy, r):
+    """中心 (sx, sy)、半径 r 的圆是否与视口相交"""
+    return (sx + r >= 0) & (sx - r < SCREEN_WIDTH) & (sy + r >= 0) & (sy - r < SCREEN_HEIGHT)
+
+
+def _ring_on_screen(cx, cy, r):
+    """半径 r 的圆周是否穿过视口：圆心到视口的最近距离不超过 r，且视口没有整个落在圆内"""
+    nx, ny = np.clip(cx, 0, SCREEN_WIDTH) - cx, np.clip(cy, 0, SCREEN_HEIGHT) - cy
+    fx = np.maximum(np.abs(cx), np.abs(cx - SCREEN_WIDTH))
+    fy = np.maximum(np.abs(cy), np.abs(cy - SCREEN_HEIGHT))
+    return (nx * nx + ny * ny <= r * r) & (fx * fx + fy * fy >= r * r)
+
+
+class PickIndex:
+    """屏幕空间拾取网格：渲染时登记可点选对象的屏幕坐标与命中半径，首次查询时才分桶建格，
+    查询只看点击点附近的格子。命中半径超过一格的大目标单独放在 large 里逐个检查"""
+
+    def __init__(self, cell=64):
+        self.cell = cell
+        self.reset()
+
+    def reset(self):
+        self._pending, self._grid = [], None
+
+    def add(self, objects, index, sx, sy, reach):
+        """登记 objects[index[k]] 位于屏幕 (sx[k], sy[k])、命中半径 reach[k]"""
+        index = np.asarray(index, dtype=np.int64)
+        self._pending.append((objects, index, np.asarray(sx, dtype=np.float64), np.asarray(sy, dtype=np.float64),
+                              np.broadcast_to(np.asarray(reach, dtype=np.float64), index.shape)))
+        self._grid = None
+
+    def _build(self):
+        parts = self._pending or [((), np.zeros(0, dtype=np.int64)) + (np.zeros(0),) * 3]
+        self.index, self.x, self.y, self.reach = (np.concatenate([p[k] for p in parts]) for k in (1, 2, 3, 4))
+        self.bounds = np.cumsum([len(p[1]) for p in parts])
+        small = self.reach <= self.cell
+        self.large = np.flatnonzero(~small)
+        idx = np.flatnonzero(small)
+        keys = (self.x[idx] // self.cell).astype(np.int64) * 65536 + (self.y[idx] // self.cell).astype(np.int64)
+        order = np.argsort(keys)
+        self._grid, self._cells = keys[order], idx[order]  # 按格子排序，同格对象连续存放
+
+    def pick(self, x, y):
+        """(x, y) 命中的对象中离得最近的一个；没有则返回 None"""
+        if self._grid is None: self._build()
+        gx, gy = int(x // self.cell), int(y // self.cell)
+        near = np.array([(gx + i) * 65536 + gy + j for i in (-1, 0, 1) for j in (-1, 0, 1)])
+        lo, hi = np.searchsorted(self._grid, near), np.searchsorted(self._grid, near, side="right")
+        cand = np.concatenate([self._cells[a:b] for a, b in zip(lo.tolist(), hi.tolist()) if b > a] + [self.large])
+        if not len(cand): return None
+        d = np.hypot(self.x[cand] - x, self.y[cand] - y)
+        hit = d <= self.reach[cand]
+        if not hit.any(): return None
+        k = int(cand[hit][np.argmin(d[hit])])
+        return self._pending[int(np.searchsorted(self.bounds, k, side="right"))][0][self.index[k]]
+
+
+class Renderer:
+    def __init__(self, screen, font, ui_font, title_font, cache_size=1024):
+        self.screen, self.font, self.ui_font, self.title_font = screen, font, ui_font, title_font
+        self.cache = SurfaceCache(cache_size)
+        self._table, self._static = None, None
+        self.picker = PickIndex()
+
+    def text(self, string, pos, color=COLORS["white"], font=None):
+        self.screen.blit(self.cache.text(font or self.font, string, color), pos)
+
+    def pick(self, x, y):
+        """上一帧画面中屏幕坐标 (x, y) 处最近的天体或玩家飞船"""
+        return self.picker.pick(x, y)
+
+    def draw_scene(self, snap, camera):
+        self.picker.reset()
+        with PROFILER.scope("render.bodies"): self.draw_bodies(snap, camera)
+        with PROFILER.scope("render.fleet"): self.draw_fleet(snap, camera)
+        with PROFILER.scope("render.ship"): self.draw_ship(snap.ship, camera)
+
+    def _body_columns(self, snap):
+        """天体的静态绘制属性（不随时间变），每张天体表只收集一次"""
+        if snap.bodies is not self._table:
+            bodies = snap.bodies
+            self._table, self._static = bodies, (
+                np.array([b.render_size for b in bodies], dtype=np.float64),
+                np.array([b.body_radius for b in bodies], dtype=np.float64),
+                np.array([b.orbit_radius for b in bodies], dtype=np.float64))
+        return self._static
+
+    def draw_bodies(self, snap, camera):
+        render_size, body_radius, orbit_radius = self._body_columns(snap)
+        bodies, parent = snap.bodies, snap.parent
+        sx, sy = camera.apply_array(snap.x, snap.y)
+
+        # 轨道圈：圆心即父天体的屏幕坐标，只画穿过视口的
+        child = np.flatnonzero(parent >= 0)
+        cx, cy = sx[parent[child]], sy[parent[child]]
+        ring = (orbit_radius[child] * camera.scale).astype(np.int64)
+        keep = (2 < ring) & (ring < 8000)
+        keep[keep] = _ring_on_screen(cx[keep], cy[keep], ring[keep])
+        for k in np.flatnonzero(keep):
+            pygame.draw.circle(self.screen, COLORS["dark_gray"], (int(cx[k]), int(cy[k])), int(ring[k]), 1)
+
+        with PROFILER.scope("render.trajectory"): self.draw_trajectory(snap, camera)
+
+        r = np.maximum(render_size.astype(np.int64), (body_radius * camera.scale).astype(np.int64))
+        show_names = camera.scale > 1e-6
+        shown = np.flatnonzero(_on_screen(sx, sy, r + 15))
+        self.picker.add(bodies, shown, sx[shown], sy[shown], r[shown] + 15)
+        for i in shown:
+            body, pos, ri = bodies[i], (int(sx[i]), int(sy[i])), int(r[i])
+            if body == camera.target: pygame.draw.circle(self.screen, COLORS["green"], pos, ri + 4, 1)
+            pygame.draw.circle(self.screen, body.color, pos, ri)
+            if show_names: self.text(body.name, (pos[0] + ri + 5, pos[1] - 10))
+
+    def draw_trajectory(self, snap, camera):
+        """有 n 体预报时画预报（每段 SOI 内的点相对该天体，画在天体当前位置上），否则画当前圆锥曲线"""
+        forecast = snap.forecast
+        if forecast is not None and len(forecast.t) > 1: return self.draw_forecast(snap, forecast, camera)
+        body, points = snap.trajectory
+        if points is None: return
+        bx, by = snap.position(body)
+        sx, sy = camera.apply_array(bx + points[0], by + points[1])
+        visible = (-500 < sx) & (sx < SCREEN_WIDTH + 500) & (-500 < sy) & (sy < SCREEN_HEIGHT + 500)
+        if np.count_nonzero(visible) > 1:
+            pygame.draw.lines(self.screen, COLORS["cyan"], False,
+                              np.column_stack((sx[visible], sy[visible])).tolist(), 1)
+
+    EVENT_STYLE = {"enter": ("SOI", COLORS["yellow"]), "exit": ("SOI", COLORS["yellow"]),
+                   "periapsis": ("Pe", COLORS["green"]), "closest": ("CA", COLORS["orange"]),
+                   "impact": ("X", COLORS["red"])}
+
+    def draw_forecast(self, snap, forecast, camera):
+        bx, by = np.array([snap.position(b) for b in forecast.bodies], dtype=np.float64).T
+        start = max(int(np.searchsorted(forecast.t, snap.time_elapsed)) - 1, 0)
+        body = forecast.body[start:]
+        sx, sy = camera.apply_array(bx[body] + forecast.rx[start:], by[body] + forecast.ry[start:])
+        visible = (-500 < sx) & (sx < SCREEN_WIDTH + 500) & (-500 < sy) & (sy < SCREEN_HEIGHT + 500)
+        # 跨 SOI 处参考天体改变，折线在此断开
+        for run in np.split(np.arange(len(body)), np.flatnonzero(np.diff(body)) + 1):
+            run = run[visible[run]]
+            if len(run) > 1:
+                pygame.draw.lines(self.screen, COLORS["cyan"], False, np.column_stack((sx[run], sy[run])).tolist(), 1)
+        for e in forecast.events:
+            if e.t < snap.time_elapsed: continue
+            label, color = self.EVENT_STYLE[e.kind]
+            ex, ey = snap.position(e.body)
+            px, py = camera.apply(ex + e.rx, ey + e.ry)
+            if not _on_screen(px, py, 4): continue
+            pygame.draw.circle(self.screen, color, (px, py), 4, 1)
+            self.text(label, (px + 6, py - 6), color, self.ui_font)
+
+    def draw_fleet(self, snap, camera):
+        """编队中除玩家外的飞船只画成小点，整队一次批量变换坐标"""
+        sx, sy = camera.apply_array(snap.fleet_x, snap.fleet_y)
+        visible = (0 <= sx) & (sx < SCREEN_WIDTH) & (0 <= sy) & (sy < SCREEN_HEIGHT)
+        visible[snap.player] = False
+        for i in np.flatnonzero(visible):
+            pygame.draw.circle(self.screen, snap.ships[i].color, (int(sx[i]), int(sy[i])), 2)
+
+    def draw_trails(self, recorder, t0, t1, camera, player, max_ships=64):
+        """回放尾迹：直接变换映射缓冲区上的视图；玩家用青色，其余飞船（最多 max_ships 艘）用暗色"""
+        for i in [player] + [i for i in range(min(recorder.ships, max_ships + 1)) if i != player][:max_ships]:
+            color = COLORS["cyan"] if i == player else COLORS["dark_gray"]
+            for xs, ys in recorder.trail(i, t0, t1):
+                sx, sy = camera.apply_array(xs, ys)
+                visible = (-500 < sx) & (sx < SCREEN_WIDTH + 500) & (-500 < sy) & (sy < SCREEN_HEIGHT + 500)
+                if np.count_nonzero(visible) > 1:
+                    pygame.draw.lines(self.screen, color, False,
+                                      np.column_stack((sx[visible], sy[visible])).tolist(), 1)
+
+    def draw_ship(self, ship, camera):
+        screen = self.screen
+        sx, sy = camera.apply(ship.x, ship.y)
+        if not _on_screen(sx, sy, 200): return
+        self.picker.add([ship], [0], [sx], [sy], 20)
+        length, width = 12, 7
+        cos_h, sin_h = math.cos(ship.heading), math.sin(ship.heading)
+        nose = (sx + cos_h * length, sy + sin_h * length)
+        left = (sx - cos_h * length + sin_h * width, sy - sin_h * length - cos_h * width)
+        right = (sx - cos_h * length - sin_h * width, sy - sin_h * length + cos_h * width)
+
+        # --- 优化1：主引擎火焰大幅加长 ---
+        if ship.thrust_percent > 0:
+            flame_len = length * 5.0 * ship.thrust_percent  # 从2.0提升到5.0
+            flame_width = width * 0.4
+            f_left = (sx - cos_h * length + sin_h * flame_width, sy - sin_h * length - cos_h * flame_width)
+            f_right = (sx - cos_h * length - sin_h * flame_width, sy - sin_h * length + cos_h * flame_width)
+            flame_tip = (sx - cos_h * (length + flame_len), sy - sin_h * (length + flame_len))
+            pygame.draw.polygon(screen, COLORS["orange"], [f_left, f_right, flame_tip])
+
+        if ship.turn_cmd != 0:
+            rcs_color, rcs_len = COLORS["white"], 6
+            if ship.turn_cmd < 0:
+                pygame.draw.line(screen, rcs_color, nose, (nose[0] - sin_h * rcs_len, nose[1] + cos_h * rcs_len), 2)
+                pygame.draw.line(screen, rcs_color, left, (left[0] + sin_h * rcs_len, left[1] - cos_h * rcs_len), 2)
+            else:
+                pygame.draw.line(screen, rcs_color, nose, (nose[0] + sin_h * rcs_len, nose[1] - cos_h * rcs_len), 2)
+                pygame.draw.line(screen, rcs_color, right, (right[0] - sin_h * rcs_len, right[1] + cos_h * rcs_len), 2)
+
+        pygame.draw.polygon(screen, ship.color, [nose, left, right])
+
+        if ship.show_ui:
+            panel_w, panel_h = 180, 75
+            panel_x, panel_y = sx + 20, sy - panel_h // 2
+            screen.blit(self.cache.panel(panel_w, panel_h, COLORS["ui_bg"]), (panel_x, panel_y))
+            pygame.draw.rect(screen, ship.color, (panel_x, panel_y, panel_w, panel_h), 1)
+
+            lines = [
+                f"Vessel: {ship.name}",
+                f"Dest: {ship.autopilot_target.name if ship.autopilot_target else 'None'}",
+                f"Phase: {ship.ap_state}",
+                f"Thrust: {ship.thrust_percent * 100:.0f}%"
+            ]
+            for i, text in enumerate(lines):
+                color = COLORS["orange"] if "ORBIT" in text or ship.thrust_percent > 0 else COLORS["white"]
+                self.text(text, (panel_x + 5, panel_y + 5 + i * 16), color, self.ui_font)
+
+    def draw_tooltip(self, obj, pos):
+        label = self.cache.text(self.font, obj.name, COLORS["white"])
+        x, y = pos[0] + 14, pos[1] + 10
+        screen = self.screen
+        screen.blit(self.cache.panel(label.get_width() + 8, label.get_height() + 4, COLORS["ui_bg"]), (x, y))
+        screen.blit(label, (x + 4, y + 2))
+
+    def draw_hud(self, lines):
+        for i, text in enumerate(lines):
+            self.text(text, (10, 10 + i * 22), COLORS["green"])
+
+    def draw_profile(self, profiler, top=10):
+        """右上角的剖析面板：每个通道按 p95 从高到低列出区段耗时与计数的 p50/p95/p99"""
+        lines = []
+        for lane, stats in sorted(profiler.summary().items()):
+            lines.append((f"[{lane}]{'p50':>18}{'p95':>8}{'p99':>8}", COLORS["yellow"]))
+            for name, (p50, p95, p99) in sorted(stats.items(), key=lambda kv: -kv[1][1])[:top]:
+                lines.append((f"{name[:16]:<16}{p50:8.2f}{p95:8.2f}{p99:8.2f}", COLORS["white"]))
+        if profiler.export: lines.append(("REC profile -> CSV (F4)", COLORS["orange"]))
+        if not lines: return
+        width, x = 330, SCREEN_WIDTH - 340
+        self.screen.blit(self.cache.panel(width, 8 + 16 * len(lines), COLORS["ui_bg"]), (x, 10))
+        for i, (text, color) in enumerate(lines):
+            self.text(text, (x + 6, 14 + 16 * i), color, self.ui_font)
+
+    def draw_porkchop(self, plan, t, size=(256, 160)):
+        """右下角的 porkchop 图：横轴出发时刻、纵轴飞行时长（向上增长），颜色为总 Δv 的对数（蓝低红高，无解为暗色）。
+        标出选中的转移与当前时刻；整张图按计划缓存，只渲染一次"""
+        w, h = size
+        x, y = SCREEN_WIDTH - w - 10, SCREEN_HEIGHT - h - 70
+        dep, dur = plan.departures, plan.durations
+
+        def build():
+            dv = plan.dv
+            ok = np.isfinite(dv)
+            best = dv[ok].min()
+            level = np.clip(np.log(np.where(ok, dv, best) / best) / math.log(8.0), 0.0, 1.0)  # 最优的 8 倍以上同色
+            rgb = np.stack([255 * np.clip(2 * level, 0, 1), 255 * (1 - np.abs(2 * level - 1)),
+                            255 * np.clip(1 - 2 * level, 0, 1)], axis=-1)
+            rgb[~ok] = COLORS["dark_gray"]
+            surf = pygame.surfarray.make_surface(rgb[:, ::-1].astype(np.uint8))  # surfarray 为 [x, y]，纵轴翻转
+            return pygame.transform.scale(surf, size)
+
+        self.screen.blit(self.cache.panel(w + 8, h + 66, COLORS["ui_bg"]), (x - 4, y - 4))
+        self.screen.blit(self.cache.get(("porkchop", id(plan)), build), (x, y))
+        to_x = lambda v: x + (v - dep[0]) / (dep[-1] - dep[0]) * w
+        to_y = lambda v: y + h - (v - dur[0]) / (dur[-1] - dur[0]) * h
+        pygame.draw.circle(self.screen, COLORS["white"],
+                           (int(to_x(plan.t_depart)), int(to_y(plan.t_arrive - plan.t_depart))), 4, 1)
+        if dep[0] <= t <= dep[-1]: pygame.draw.line(self.screen, COLORS["white"], (to_x(t), y), (to_x(t), y + h))
+        name = plan.origin.name if plan.origin is not None else "orbit"
+        lines = [f"{name} -> {plan.target.name}: dv {plan.dv_depart:.2f} + {plan.dv_arrive:.2f} km/s",
+                 f"Depart in {max(plan.t_depart - t, 0.0) / 86400:.1f} d, flight {(plan.t_arrive - plan.t_depart) / 86400:.1f} d",
+                 f"Window {(dep[-1] - dep[0]) / 86400:.0f} d x {dur[0] / 86400:.0f}-{dur[-1] / 86400:.0f} d (P: cancel)"]
+        for i, text in enumerate(lines):
+            self.text(text, (x, y + h + 6 + 16 * i), COLORS["white"], self.ui_font)
+
+    def draw_menus(self, state, menu_options, selected_index):
+        screen = self.screen
+        screen.fill(COLORS["menu_bg"])
+        title_str = "ORBITAL MECHANICS" if state == "MAIN_MENU" else "PAUSED"
+        t_surf = self.cache.text(self.title_font, title_str, COLORS["white"])
+        screen.blit(t_surf, (SCREEN_WIDTH // 2 - t_surf.get_width() // 2, 200))
+
+        for i, opt in enumerate(menu_options):
+            color = COLORS["yellow"] if i == selected_index else COLORS["gray"]
+            prefix = ">> " if i == selected_index else "   "
+            self.text(prefix + opt, (SCREEN_WIDTH // 2 - 150, 350 + i * 60), color, self.title_font)
@@ -6,6 +6,27 @@ G = 6.6743e-17
 SCREEN_WIDTH, SCREEN_HEIGHT = 1024, 768
 FPS = 60
 
+# --- 时间加速 ---
+MAX_TIME_SCALE = 1e12  # 滑行（on-rails）时允许的最大倍速
+MAX_NUMERIC_DT = 1e6  # 推力/数值积分时每帧最多推进的模拟秒数
+
+# --- 转移规划 ---
+PLAN_BURN_DT = 60.0  # 执行计划点火时每帧最多推进的模拟秒数（近似脉冲点火）
+PLAN_DV_TOL = 0.001  # 计划点火剩余 Δv 小于此值 (km/s) 即视为完成
+
+# --- 轨迹预报 ---
+FORECAST_SAMPLES = 4096  # 预报缓冲区最多保留的未来样本数（每个积分步一个样本）
+FORECAST_ETA = 0.02  # 预报步长占最近天体动力学时间 sqrt(r³/GM) 的比例
+FORECAST_TOL = 0.01  # 飞船偏离预报超过 (到 SOI 天体距离 × 此值) 时从当前状态重新起算（滑行按圆锥曲线拼接，与 n 体预报本就略有出入）
+FORECAST_BUDGET = 0.003  # 每个物理步用于延长预报的墙钟秒数
+
+# --- 碰撞与接近 ---
+ATMOSPHERE_HEIGHT = 0.02  # 大气层厚度占天体半径的比例（宇宙数据里没有大气，统一按此估计）
+CLOSE_APPROACH = 3.0  # 非束缚飞掠时距天体中心不到此倍数的天体半径即记为近距离接近
+
+# --- 存档 ---
+AUTOSAVE_INTERVAL = 120.0  # 游戏中每隔多少墙钟秒自动存档一次
+
 # --- 颜色库 ---
 COLORS = {
     "yellow": (255, 255, 0), "blue": (100, 149, 237), "red": (205, 92, 92),
@@ -0,0 +1,106 @@
+"""存档往返：npz 存档、JSON 导出与只有 ship 的旧版 JSON 读回后，飞船状态、时间与自动驾驶字段不变"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+import engine
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Data")
+UNIVERSE = os.path.join(DATA, "Universe.xml")
+
+SHIPS = """<?xml version="1.0" encoding="UTF-8" ?>
+<Ships>
+    <Ship name="Astral" class="Player" mass="100.0" thrust="2.0" x="149630000" y="0" colour="cyan" />
+    <Ship name="Lander" mass="50.0" thrust="1.0" x="149600000" y="30000" colour="red" />
+</Ships>"""
+
+# 旧版存档：只有玩家飞船，没有飞船名、着陆与转移计划
+LEGACY = {"time_elapsed": 352100.0,
+          "ship": {"x": 218315.7373422813, "y": 938948.7091034361, "vx": 361.45162413577634,
+                   "vy": -84.04141330137332, "heading": 2.920840629349647, "ap_state": "ORBIT INSERTION",
+                   "target": "Sun"},
+          "camera": {"target": "Sun", "scale": 9.390259189651983e-05}}
+
+
+@pytest.fixture
+def ships_path(tmp_path):
+    path = tmp_path / "ships.xml"
+    path.write_text(SHIPS)
+    return str(path)
+
+
+def fresh(ships_path):
+    sim, near = engine.new_simulation(UNIVERSE, ships_path)
+    camera = engine.Camera()
+    camera.target = near
+    return sim, camera
+
+
+def body_names(fleet, field):
+    return [fleet.bodies[int(i)].name if i >= 0 else None for i in getattr(fleet, field)]
+
+
+@pytest.fixture
+def played(ships_path):
+    """玩家按转移计划飞往火星（已在巡航段）、另一艘停在地球上，并改过时间倍率、积分器与镜头"""
+    sim, camera = fresh(ships_path)
+    assert sim.plan_transfer(engine.find_body(sim.galaxy, "Mars")) is not None
+    for _ in range(1000):
+        if engine.AP_STATES[sim.fleet.ap_code[sim.player]] == "CRUISE": break
+        sim.step(1e6)
+    sim.step(1e5)
+    earth = engine.find_body(sim.galaxy, "Earth")
+    lander = next(i for i, s in enumerate(sim.fleet.ships) if s.name == "Lander")
+    sim.fleet.touch_down(np.array([lander]), sim.fleet._body_index(earth), 0.0, earth.body_radius)
+    sim.time_scale = 1000.0
+    sim.set_integrator("leapfrog")
+    camera.scale, camera.offset_x, camera.offset_y, camera.view_level = 1e-4, 12.5, -3.0, 2
+    return sim, camera
+
+
+@pytest.mark.parametrize("name", ["savegame.sav", "savegame.json"])
+def test_round_trip(played, ships_path, tmp_path, name):
+    sim, camera = played
+    path = str(tmp_path / name)
+    engine.save_game(path, engine.capture_state(sim, camera))
+    sim2, camera2 = fresh(ships_path)
+    assert engine.load_game(path, sim2, camera2) == sim.time_elapsed
+
+    fleet, fleet2 = sim.fleet, sim2.fleet
+    assert [s.name for s in fleet2.ships] == [s.name for s in fleet.ships]
+    for k in engine.Fleet.FLOAT_FIELDS + engine.SAVE_PLAN_FIELDS + ("land_x", "land_y", "turn_cmd", "ap_code"):
+        np.testing.assert_array_equal(getattr(fleet2, k), getattr(fleet, k), err_msg=k)
+    for k in engine.SAVE_BODY_FIELDS:
+        assert body_names(fleet2, k) == body_names(fleet, k), k
+    assert engine.AP_STATES[fleet2.ap_code[sim2.player]] == "CRUISE"
+    assert body_names(fleet2, "landed") == [None, "Earth"]
+
+    plan, plan2 = fleet.plans[sim.player], fleet2.plans[sim2.player]
+    assert plan2 is not None and plan2.target.name == "Mars"
+    assert (plan2.t_depart, plan2.t_arrive, plan2.v_inf) == (plan.t_depart, plan.t_arrive, plan.v_inf)
+    assert (plan2.dv_depart, plan2.dv_arrive) == (plan.dv_depart, plan.dv_arrive)
+
+    assert (sim2.player, sim2.time_scale, sim2.integrator.name) == (sim.player, 1000.0, "leapfrog")
+    assert camera2.target.name == camera.target.name
+    assert (camera2.scale, camera2.offset_x, camera2.offset_y, camera2.view_level) == (1e-4, 12.5, -3.0, 2)
+
+
+def test_legacy_json(ships_path, tmp_path):
+    path = tmp_path / "savegame.json"
+    path.write_text(json.dumps(LEGACY))
+    sim, camera = fresh(ships_path)
+    sim.plan_transfer(engine.find_body(sim.galaxy, "Mars"))
+    assert engine.load_game(str(path), sim, camera) == 352100.0
+
+    fleet, ship, old = sim.fleet, sim.ship, LEGACY["ship"]
+    assert ship.name == "Astral"
+    assert (ship.x, ship.y, ship.vx, ship.vy, ship.heading) == tuple(old[k] for k in ("x", "y", "vx", "vy", "heading"))
+    assert engine.AP_STATES[fleet.ap_code[sim.player]] == "ORBIT INSERTION"
+    assert body_names(fleet, "target")[sim.player] == "Sun"
+    # 旧版没有的着陆与转移计划一律视为无，不沿用读档前的计划
+    assert fleet.landed[sim.player] == -1 and fleet.plans[sim.player] is None
+    assert np.isnan(fleet.plan_arrive[sim.player])
+    assert sim.all_bodies.time == 352100.0
+    assert camera.target.name == "Sun" and camera.scale == LEGACY["camera"]["scale"]
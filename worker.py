@@ -0,0 +1,221 @@
+# worker.py
+"""物理工作线程：按固定节拍独立推进 Simulation，每步结束发布一份只读快照供渲染读取；
+输入与自动驾驶等指令经队列在两步之间执行。渲染帧率因此不再受物理负载拖累"""
+import copy
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+import numpy as np
+from settings import FPS
+from engine import AP_STATES, Forecaster, TrajectoryPredictor, capture_state, save_game
+from profiler import PROFILER
+
+ShipFrame = namedtuple("ShipFrame", "name color x y vx vy heading thrust_percent turn_cmd "
+                                    "ap_state autopilot_target on_rails show_ui")
+
+
+def _frozen(array):
+    array = np.array(array, dtype=np.float64)
+    array.flags.writeable = False
+    return array
+
+
+class Snapshot:
+    """某一物理步结束时的世界状态。数组都是拷贝且只读，发布后不再改动，渲染线程可随意读取"""
+
+    def __init__(self, sim, index, trajectory, forecast, contacts, lag, sim_rate):
+        bodies, fleet = sim.all_bodies, sim.fleet
+        self.time_elapsed, self.time_scale = sim.time_elapsed, sim.time_scale
+        self.integrator, self.last_steps, self.last_evals = sim.integrator.name, sim.last_steps, sim.last_evals
+        self.stars, self.bodies, self.index = sim.stars, bodies, index
+        self.parent = bodies.ephemeris.parent  # 与 bodies 同一张表，建表后不变
+        self.x, self.y = _frozen(bodies.x), _frozen(bodies.y)
+        self.ships, self.player = fleet.ships, sim.player
+        self.fleet_x, self.fleet_y = _frozen(fleet.x), _frozen(fleet.y)
+        i, ship = sim.player, sim.ship
+        self.ship = ShipFrame(ship.name, ship.color, float(fleet.x[i]), float(fleet.y[i]), float(fleet.vx[i]),
+                              float(fleet.vy[i]), float(fleet.heading[i]), float(fleet.thrust_percent[i]),
+                              int(fleet.turn_cmd[i]), AP_STATES[fleet.ap_code[i]], ship.autopilot_target,
+                              bool(fleet.rails_body[i] >= 0), ship.show_ui)
+        # 玩家正在执行的转移计划（TransferPlan 本身不可变，直接共享）；没有时为 None
+        self.plan = fleet.plans[i] if np.isfinite(fleet.plan_arrive[i]) else None
+        self.trajectory = trajectory  # (body, (xs, ys))，点相对 body
+        self.forecast = forecast  # 玩家飞船的 n 体长程预报（engine.Forecast），回放时为 None
+        self.contacts = contacts  # 最近的若干条 engine.Contact（全部飞船，按时间先后），回放时为空
+        self.lag, self.sim_rate = lag, sim_rate
+
+    def position(self, body):
+        """body 在这一帧的位置；不在本帧表内（例如刚被分页淘汰）时退回实时值"""
+        i = self.index.get(id(body))
+        return (float(self.x[i]), float(self.y[i])) if i is not None else (body.x, body.y)
+
+    def replayed(self, t, state):
+        """回放用的一帧：飞船取录像在 t 时刻的状态 state，天体按星历放到 t 时刻，其余沿用本快照"""
+        frame = copy.copy(self)
+        x, y, vx, vy, heading, thrust, ap = state
+        bx, by = self.bodies.positions(t)
+        frame.time_elapsed, frame.trajectory, frame.forecast, frame.contacts = t, (None, None), None, ()
+        frame.x, frame.y, frame.fleet_x, frame.fleet_y = _frozen(bx), _frozen(by), _frozen(x), _frozen(y)
+        i = self.player
+        frame.ship = self.ship._replace(x=float(x[i]), y=float(y[i]), vx=float(vx[i]), vy=float(vy[i]),
+                                        heading=float(heading[i]), thrust_percent=float(thrust[i]), turn_cmd=0,
+                                        ap_state=AP_STATES[ap[i]], on_rails=False)
+        return frame
+
+    def nearest(self, x, y):
+        if not len(self.bodies): return None
+        return self.bodies[int(np.argmin((self.x - x) ** 2 + (self.y - y) ** 2))]
+
+
+class PhysicsWorker:
+    """在后台线程里每 1/tick_rate 秒推进一步（每步 base_dt * time_scale 模拟秒）。
+    渲染线程只读 snapshot；改动模拟状态一律经 submit(fn) 排队，fn(sim) 在物理线程中执行，执行过指令就重发快照。
+    每帧都会变的镜头激活点不走队列：set_focus 只替换引用，下一步推进前才交给 sim，不触发重发快照。
+    落后实时超过 max_lag 秒时放弃补帧，避免越追越慢；lag 即当前落后实时的秒数"""
+
+    def __init__(self, sim, base_dt=1.0, tick_rate=FPS, max_lag=0.25, recorder=None):
+        self.sim, self.base_dt, self.tick, self.max_lag = sim, base_dt, 1.0 / tick_rate, max_lag
+        self.recorder = recorder  # 可选 FlightRecorder：每步结束记录一次全部飞船
+        self.commands = queue.SimpleQueue()
+        self.controls, self.paused, self.focus = (False, False, False), True, []
+        self.lag, self.sim_rate, self.error = 0.0, 0.0, None
+        self.predictor = TrajectoryPredictor()
+        self.forecaster = Forecaster()  # 每步在 FORECAST_BUDGET 内续算；暂停时也继续填满缓冲区
+        self.contacts = deque(maxlen=16)
+        self._table, self._index = None, {}
+        self.snapshot = self._capture()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="physics", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.commands.put((None, None))  # 唤醒等待中的线程
+        self._thread.join()
+
+    def submit(self, fn):
+        """排队执行 fn(sim)；返回 Future，需要结果（如存档、读档）时可 .result() 等待"""
+        future = Future()
+        self.commands.put((fn, future))
+        return future
+
+    def save(self, writer, path, camera):
+        """在两步之间拷贝世界状态，再交给 writer 在后台写盘；本线程与物理线程都不等待 I/O"""
+        camera = copy.copy(camera)
+        future = self.submit(lambda sim: capture_state(sim, camera))
+        future.add_done_callback(lambda f: f.exception() is None and writer.write(path, f.result()))
+        return future
+
+    def set_controls(self, left, right, up):
+        self.submit(lambda sim: setattr(self, "controls", (left, right, up)))
+
+    def set_paused(self, paused):
+        self.submit(lambda sim: setattr(self, "paused", paused))
+
+    def set_focus(self, focus):
+        """镜头等额外的激活点 [(x, y), ...]，下一步推进时生效（见 Simulation.focus）"""
+        self.focus = focus
+
+    def _drain(self, timeout):
+        """执行队列中的全部指令；队列为空时最多等待 timeout 秒。返回是否执行过指令"""
+        ran = False
+        while True:
+            try:
+                fn, future = self.commands.get(timeout=timeout) if timeout > 0 and not ran else self.commands.get_nowait()
+            except queue.Empty:
+                return ran
+            if fn is None: return ran
+            ran = True
+            if future.set_running_or_notify_cancel():
+                try: future.set_result(fn(self.sim))
+                except Exception as e: future.set_exception(e)
+
+    def _run(self):
+        try:
+            next_tick, rate_mark = time.perf_counter(), (time.perf_counter(), self.sim.time_elapsed)
+            while not self._stop.is_set():
+                now = time.perf_counter()
+                wait = self.tick if self.paused else max(0.0, next_tick - now)
+                if self._drain(wait): self.snapshot = self._capture()
+                now = time.perf_counter()
+                if self.paused or now < next_tick:
+                    if self.paused: next_tick, self.lag = now, 0.0
+                    if self.paused and self.forecaster.pending: self.snapshot = self._capture()
+                    continue
+
+                left, right, up = self.controls
+                self.sim.focus = self.focus
+                with PROFILER.scope("step"): self.sim.step(self.base_dt * self.sim.time_scale, left, right, up)
+                self.contacts.extend(self.sim.contacts)
+                if self.recorder is not None:
+                    with PROFILER.scope("record"): self.recorder.record(self.sim.time_elapsed, self.sim.fleet)
+                next_tick += self.tick
+                now = time.perf_counter()
+                self.lag = max(0.0, now - next_tick)
+                if self.lag > self.max_lag: next_tick = now  # 追不上就放弃补帧
+                if now - rate_mark[0] >= 0.5:
+                    self.sim_rate = (self.sim.time_elapsed - rate_mark[1]) / (now - rate_mark[0])
+                    rate_mark = (now, self.sim.time_elapsed)
+                with PROFILER.scope("snapshot"):
+                    self.snapshot = self._capture()  # 先填好新快照再整体替换引用，渲染端永远读到完整的一帧
+                PROFILER.end_frame("physics")
+        except Exception as e:
+            self.error = e
+
+    def _capture(self):
+        sim = self.sim
+        if sim.all_bodies is not self._table:
+            self._table, self._index = sim.all_bodies, {id(b): i for i, b in enumerate(sim.all_bodies)}
+        with PROFILER.scope("trajectory"):
+            trajectory = self.predictor.update(sim.ship, sim.all_bodies, sim.time_elapsed)
+        with PROFILER.scope("forecast"): forecast = self.forecaster.update(sim)
+        return Snapshot(sim, self._index, trajectory, forecast, tuple(self.contacts), self.lag, self.sim_rate)
+
+
+class SaveWriter:
+    """后台写盘线程：write(path, state) 立即返回，序列化与原子改名都在线程里完成。
+    同一路径尚未写出的旧状态会被新状态直接替换；最近一次失败记在 error"""
+
+    def __init__(self):
+        self.pending, self.busy, self.error, self.saved = {}, False, None, {}
+        self._cond, self._stop = threading.Condition(), False
+        self._thread = threading.Thread(target=self._run, name="saver", daemon=True)
+        self._thread.start()
+
+    def write(self, path, state):
+        with self._cond:
+            self.pending[path] = state
+            self._cond.notify_all()
+
+    def flush(self):
+        """等到所有排队的存档都已写出"""
+        with self._cond:
+            while self.pending or self.busy: self._cond.wait()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self.pending and not self._stop: self._cond.wait()
+                if not self.pending: return
+                path, state = self.pending.popitem()
+                self.busy = True
+            try:
+                with PROFILER.scope("save"): save_game(path, state)
+                self.saved[path] = time.time()
+            except OSError as e:
+                self.error = e
+            finally:
+                with self._cond:
+                    self.busy = False
+                    self._cond.notify_all()